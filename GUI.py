@@ -5,21 +5,140 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                             QHBoxLayout, QLabel, QLineEdit, QPushButton, 
                             QFileDialog, QCheckBox, QGroupBox, QMessageBox, QComboBox)
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap, QIcon
-from PyQt5.QtCore import QTimer
-from pathlib import Path
+from PyQt5.QtGui import QPixmap, QIcon, QImage
+from PyQt5.QtCore import QTimer, QObject, pyqtSignal
+from concurrent.futures import ThreadPoolExecutor
+import font_catalog
 import picture_spawner
-import tempfile
+import profiles
+import render_server
 import keyboard
 import os
 
+PREVIEW_TEXT = "这是一段预览文本\n用于展示生成的对话框"
+# 编辑配置后等待多久刷新预览（毫秒），连续输入时只渲染最后一次
+PREVIEW_DEBOUNCE_MS = 250
+
+
+def pil_to_qimage(img):
+    """在内存中把 PIL Image 转换为 QImage，不经过临时文件"""
+    img = img.convert('RGBA')
+    data = img.tobytes('raw', 'RGBA')
+    qimage = QImage(data, img.width, img.height, img.width * 4, QImage.Format_RGBA8888)
+    # QImage 不持有 data 的引用，复制到 Qt 自己的缓冲区
+    return qimage.copy()
+
+
+class PreviewRenderer(QObject):
+    """
+    在后台线程渲染预览图片，不阻塞界面
+
+    每次 request 分配一个新的序号。排队中的旧请求会被取消，开始渲染前发现已有更新的请求也直接跳过；
+    只有最新请求的结果通过 finished/failed 信号交给界面线程。
+    """
+
+    finished = pyqtSignal(int, QImage)
+    failed = pyqtSignal(int, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.generation = 0
+        self.render_server = None
+        self._client = None
+        self._future = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview")
+
+    def request(self, options: dict) -> int:
+        """
+        提交一次预览渲染
+
+        Args:
+            options: avatar、background、username、font、size（输出图片尺寸）
+
+        Returns:
+            本次请求的序号
+        """
+        self.generation += 1
+        if self._future is not None:
+            self._future.cancel()
+        self._future = self._executor.submit(self._run, self.generation, options)
+        return self.generation
+
+    def shutdown(self) -> None:
+        self.generation += 1
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._client is not None:
+            self._client.close()
+
+    def _run(self, generation: int, options: dict) -> None:
+        if generation != self.generation:
+            return
+        try:
+            qimage = self._render(options)
+        except Exception as e:
+            if generation == self.generation:
+                self.failed.emit(generation, str(e))
+            return
+        if generation == self.generation:
+            self.finished.emit(generation, qimage)
+
+    def _render(self, options: dict) -> QImage:
+        # 渲染服务运行时直接向服务请求预览图片，无需在本进程加载字体
+        if self.render_server:
+            try:
+                if self._client is None or self._client.address != self.render_server:
+                    if self._client is not None:
+                        self._client.close()
+                    self._client = render_server.RenderClient(self.render_server)
+                data = self._client.render(
+                    PREVIEW_TEXT,
+                    avatar=options["avatar"],
+                    background=options["background"],
+                    username=options["username"],
+                    font=options["font"],
+                    size=list(options["size"]),
+                    profile="png-fast"
+                )
+                qimage = QImage.fromData(data)
+                if not qimage.isNull():
+                    return qimage
+            except Exception as e:
+                print(f"渲染服务不可用，改为本地渲染: {e}")
+
+        img = picture_spawner.generate_dialog_image(
+            avatar_path=options["avatar"],
+            background_path=options["background"],
+            username=options["username"],
+            dialog_text=PREVIEW_TEXT,
+            font_index=options["font"],
+            img_size=options["size"],
+            output_path=None
+        )
+        return pil_to_qimage(img)
+
+
 class ConfigGUI(QMainWindow):
     def __init__(self):
         super().__init__()
         self.config_file = "config.json"
+        self.preview_renderer = PreviewRenderer(self)
+        self.preview_renderer.finished.connect(self.show_preview)
+        self.preview_renderer.failed.connect(self.show_preview_error)
+        self._explicit_preview = None
+        # 热键服务输出的图片尺寸（与 main.py 一样取第一个角色的 image_size），预览按此尺寸渲染后再缩放显示
+        self.output_size = profiles.DEFAULT_IMG_SIZE
+        # 编辑配置时防抖刷新预览
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DEBOUNCE_MS)
+        self.preview_timer.timeout.connect(self.request_preview)
         self.initUI()
         self.load_config()
-        self.preview_image()
+        for line_edit in (self.avatar_path, self.bg_path, self.username):
+            line_edit.textChanged.connect(self.schedule_preview)
+        self.font_combo.currentIndexChanged.connect(self.schedule_preview)
+        # 窗口显示、预览区域尺寸确定后再渲染第一张预览
+        self.schedule_preview()
 
     def initUI(self):
         self.setWindowTitle('AVG Text Spawner 配置')
@@ -169,15 +288,16 @@ class ConfigGUI(QMainWindow):
         layout.addLayout(btn_layout)
 
     def load_fonts(self):
-        if sys.platform.startswith('win'):
-            fonts_dir = Path("C:/Windows/Fonts")
-        else:
-            fonts_dir = Path("/usr/share/fonts")
-        if fonts_dir.exists():
-            font_files = [f.name for f in list(fonts_dir.glob("*.ttf")) + list(fonts_dir.glob("*.ttc"))]
-            self.font_combo.addItems(font_files)
-        else:
-            self.font_combo.addItem("默认字体")
+        # 字体索引递归扫描系统字体目录并缓存到文件，之后启动只检查目录的修改时间
+        fonts = font_catalog.list_fonts()
+        for font in fonts:
+            # 显示字体族与样式，配置中保存可直接查找的名称（文件名或 文件名#face 索引）
+            self.font_combo.addItem(f"{font['family']} {font['style']} ({font['name']})", font['name'])
+        if not fonts:
+            self.font_combo.addItem("默认字体", "默认字体")
+
+    def current_font(self):
+        return self.font_combo.currentData() or self.font_combo.currentText()
 
     def detect_hotkey(self):
         """检测用户输入的热键，按ESC退出"""
@@ -260,38 +380,50 @@ class ConfigGUI(QMainWindow):
 
 
     def preview_image(self):
-        try:
-            # 获取当前配置
-            avatar_path = self.avatar_path.text()
-            background_path = self.bg_path.text()
-            username = self.username.text()
-            
-            # 生成临时预览图片
-            temp_path = tempfile.mktemp(suffix='.png')
-            img = picture_spawner.generate_dialog_image(
-                avatar_path=avatar_path,
-                background_path=background_path,
-                username=username,
-                dialog_text="这是一段预览文本\n用于展示生成的对话框",
-                font_index=self.font_combo.currentText(),
-                img_size=(900, 300),
-                output_path=temp_path
-            )
-            
-            # 在预览标签中显示图片
-            pixmap = QPixmap(temp_path)
-            scaled_pixmap = pixmap.scaled(
-                self.preview_label.size(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            self.preview_label.setPixmap(scaled_pixmap)
-            
-            # 清理临时文件
-            QTimer.singleShot(1000, lambda: Path(temp_path).unlink(missing_ok=True))
-            
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"预览失败: {str(e)}")
+        """预览按钮：立即渲染，失败时弹窗提示"""
+        self.preview_timer.stop()
+        self._explicit_preview = self.request_preview()
+
+    def schedule_preview(self, *args):
+        """配置变化时重新计时，停止输入 PREVIEW_DEBOUNCE_MS 毫秒后才渲染"""
+        self.preview_timer.start()
+
+    def request_preview(self):
+        """把当前配置交给后台线程渲染，返回请求序号"""
+        return self.preview_renderer.request({
+            "avatar": self.avatar_path.text(),
+            "background": self.bg_path.text(),
+            "username": self.username.text(),
+            "font": self.current_font(),
+            "size": self.output_size,
+        })
+
+    def show_preview(self, generation, qimage):
+        if generation != self.preview_renderer.generation:
+            return
+        # 按实际输出尺寸渲染（字号下限与换行与输出一致），再缩小到预览区域（物理像素）显示
+        rect = self.preview_label.contentsRect()
+        ratio = self.preview_label.devicePixelRatioF()
+        pixmap = QPixmap.fromImage(qimage)
+        if pixmap.width() > rect.width() * ratio or pixmap.height() > rect.height() * ratio:
+            pixmap = pixmap.scaled(int(rect.width() * ratio), int(rect.height() * ratio),
+                                   Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        pixmap.setDevicePixelRatio(ratio)
+        self.preview_label.setPixmap(pixmap)
+
+    def show_preview_error(self, generation, message):
+        if generation != self.preview_renderer.generation:
+            return
+        print(f"预览失败: {message}")
+        if generation == self._explicit_preview:
+            QMessageBox.critical(self, "错误", f"预览失败: {message}")
+        else:
+            self.preview_label.setText(f"预览失败: {message}")
+
+    def closeEvent(self, event):
+        self.preview_timer.stop()
+        self.preview_renderer.shutdown()
+        super().closeEvent(event)
 
     def browse_file(self, line_edit, file_filter):
         file_name, _ = QFileDialog.getOpenFileName(self, '选择文件', '', file_filter)
@@ -309,22 +441,34 @@ class ConfigGUI(QMainWindow):
                 # 加载保存的字体
                 font_name = config.get('font_name', '')
                 if font_name:
-                    index = self.font_combo.findText(font_name)
+                    # 旧配置中可能保存的是字体族名等其他名称，先在索引中查到对应的条目
+                    info = font_catalog.get_font_info(font_name)
+                    index = self.font_combo.findData(info['name'] if info else font_name)
                     if index >= 0:
                         self.font_combo.setCurrentIndex(index)
                 self.auto_send.setChecked(config.get('want_auto_send', 0))
+                self.preview_renderer.render_server = config.get('render_server')
+                profile_list = profiles.load_profiles(config)
+                if profile_list:
+                    self.output_size = profile_list[0].img_size
         except Exception as e:
             print(f"加载配置文件失败: {e}")
 
     def save_config(self):
-        config = {
+        # 保留界面上没有的配置项（例如 render_server）
+        try:
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except Exception:
+            config = {}
+        config.update({
             'avatar_image_path': self.avatar_path.text(),
             'background_image_path': self.bg_path.text(),
             'username': self.username.text(),
             'hotkey': self.hotkey.text(),
-            'font_name': self.font_combo.currentText(),  # 改为保存字体名称
+            'font_name': self.current_font(),  # 改为保存字体名称
             'want_auto_send': 1 if self.auto_send.isChecked() else 0
-        }
+        })
         try:
             with open(self.config_file, 'w', encoding='utf-8') as f:
                 json.dump(config, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,331 @@
+"""
+批量生成对话框图片
+
+从剧本文件（纯文本或 JSONL）或标准输入读取对话，每行一条，使用进程池并行渲染，
+按行号输出编号图片。
+
+纯文本格式：每行一条对话，行内的 "\\n" 表示换行；指定 --speaker-sep 时，
+分隔符之前的部分作为该行的角色名。
+
+JSONL 格式：每行一个 JSON 对象，支持以下字段：
+    text        对话内容（必填）
+    username    角色名
+    avatar      头像路径
+    background  背景路径
+
+用法：
+    python batch.py script.txt -o out/ --jobs 4
+    cat script.jsonl | python batch.py - --format jsonl -o out/
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import config
+import image_encoder
+import picture_spawner
+import render_cache
+
+# 进程内的成品缓存（见 get_render_cache）
+_render_cache = None
+
+
+def parse_size(value: str) -> tuple:
+    """把 "900x300" 解析为 (900, 300)"""
+    try:
+        width, height = value.lower().split("x")
+        return int(width), int(height)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的图片尺寸: {value}（格式应为 宽x高，例如 900x300）")
+
+
+def parse_record(line: str, fmt: str = "text", speaker_sep: str = None, lineno: int = 0):
+    """
+    解析剧本中的一行
+
+    Args:
+        line: 文本行
+        fmt: "text" 或 "jsonl"
+        speaker_sep: 纯文本格式下角色名与对话内容的分隔符，为 None 时不拆分
+        lineno: 行号，用于错误信息
+
+    Returns:
+        记录字典（至少包含 "text"），空行返回 None
+
+    Raises:
+        ValueError: JSONL 行格式无效或缺少 text 字段
+    """
+    line = line.rstrip("\r\n")
+    if not line.strip():
+        return None
+    if fmt == "jsonl":
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"第 {lineno} 行不是有效的 JSON: {e}")
+        if not isinstance(record, dict) or "text" not in record:
+            raise ValueError(f"第 {lineno} 行缺少 text 字段")
+        return record
+    record = {}
+    if speaker_sep and speaker_sep in line:
+        speaker, line = line.split(speaker_sep, 1)
+        record["username"] = speaker.strip()
+    record["text"] = line.replace("\\n", "\n")
+    return record
+
+
+def read_script(lines, fmt: str = "text", speaker_sep: str = None) -> list:
+    """
+    把剧本内容解析为对话记录列表
+
+    Args:
+        lines: 可迭代的文本行
+        fmt: "text" 或 "jsonl"
+        speaker_sep: 纯文本格式下角色名与对话内容的分隔符，为 None 时不拆分
+
+    Returns:
+        记录字典列表，每条至少包含 "text"
+
+    Raises:
+        ValueError: JSONL 行格式无效或缺少 text 字段
+    """
+    records = []
+    for lineno, line in enumerate(lines, 1):
+        record = parse_record(line, fmt, speaker_sep, lineno)
+        if record is not None:
+            records.append(record)
+    return records
+
+
+def load_defaults(config_path: str = config.CONFIG_FILE) -> dict:
+    """从配置文件读取默认的头像、背景、角色名与字体"""
+    try:
+        cfg = config.load_config(config_path)
+    except FileNotFoundError:
+        cfg = {}
+    return {
+        "avatar": cfg.get("avatar_image_path", ""),
+        "background": cfg.get("background_image_path", ""),
+        "username": cfg.get("username", "角色名称"),
+        "font_name": cfg.get("font_name", "STKAITI.TTF"),
+        "fallback_fonts": cfg.get("fallback_fonts"),
+        "auto_fit": cfg.get("auto_fit_text", False),
+        "break_rules": cfg.get("line_break_rules", False),
+        "render_cache_dir": cfg.get("render_cache_dir"),
+        "encode_profile": cfg.get("output_encode_profile", image_encoder.DEFAULT_PROFILE),
+        "quality": cfg.get("output_quality"),
+    }
+
+
+def record_to_kwargs(record: dict, defaults: dict, img_size: tuple) -> dict:
+    """
+    把对话记录与默认值合并为 generate_dialog_image 的参数
+
+    Args:
+        record: 对话记录（text 以及可选的 username/avatar/background）
+        defaults: load_defaults 返回的默认值
+        img_size: 图片大小 (width, height)
+
+    Returns:
+        参数字典（不含 output_path）
+    """
+    return {
+        "avatar_path": record.get("avatar") or defaults["avatar"],
+        "background_path": record.get("background") or defaults["background"],
+        "username": record.get("username") or defaults["username"],
+        "dialog_text": record["text"],
+        "font_index": defaults["font_name"],
+        "img_size": img_size,
+        "fallback_fonts": defaults.get("fallback_fonts"),
+        "auto_fit": defaults.get("auto_fit", False),
+        "break_rules": defaults.get("break_rules", False),
+    }
+
+
+def _init_worker(font_name: str, img_size: tuple, fallback_fonts=None) -> None:
+    # 每个工作进程各自持有字体与底图缓存，启动时先预热字体
+    picture_spawner.preload_fonts(font_name, img_size, fallback_fonts)
+
+
+def get_render_cache(defaults: dict) -> render_cache.RenderCache:
+    """
+    返回进程内的成品缓存，第一次调用时创建
+
+    内存缓存属于各个进程；defaults 中的 render_cache_dir 指定磁盘缓存目录时，
+    所有进程以及之后的运行共用磁盘缓存。
+    """
+    global _render_cache
+    if _render_cache is None:
+        _render_cache = render_cache.RenderCache(disk_dir=defaults.get("render_cache_dir") or None)
+    return _render_cache
+
+
+def render_encoded(record: dict, defaults: dict, img_size: tuple, profile: str = None, quality: int = None) -> tuple:
+    """
+    渲染一条对话并编码，命中成品缓存时跳过渲染与编码
+
+    Args:
+        record: 对话记录
+        defaults: load_defaults 返回的默认值
+        img_size: 图片大小 (width, height)
+        profile: 编码配置，默认使用 defaults["encode_profile"]
+        quality: 编码质量，默认使用 defaults["quality"]
+
+    Returns:
+        (图片字节, 是否命中缓存)
+    """
+    profile = profile or defaults["encode_profile"]
+    quality = defaults["quality"] if quality is None else quality
+    kwargs = record_to_kwargs(record, defaults, img_size)
+    cache = get_render_cache(defaults)
+    key = render_cache.make_key(kwargs, profile, quality)
+    data = cache.get(key)
+    if data is not None:
+        return data, True
+    img = picture_spawner.generate_dialog_image(**kwargs)
+    data = image_encoder.encode_image(img, profile, quality)
+    cache.put(key, data)
+    return data, False
+
+
+def render_record(index: int, record: dict, defaults: dict, img_size: tuple, output_path: str) -> tuple:
+    """
+    渲染单条对话并保存
+
+    Returns:
+        (序号, 输出路径, 耗时秒数, 是否命中成品缓存)
+    """
+    start = time.perf_counter()
+    data, hit = render_encoded(record, defaults, img_size)
+    with open(output_path, "wb") as f:
+        f.write(data)
+    return index, output_path, time.perf_counter() - start, hit
+
+
+def run_batch(records: list, output_dir: str, defaults: dict, img_size: tuple = (900, 300),
+              jobs: int = None, prefix: str = "") -> list:
+    """
+    并行渲染所有记录
+
+    Args:
+        records: read_script 返回的记录列表
+        output_dir: 输出目录
+        defaults: load_defaults 返回的默认值
+        img_size: 图片大小 (width, height)
+        jobs: 进程数，默认使用 CPU 核数；为 1 时在当前进程内渲染
+        prefix: 输出文件名前缀
+
+    Returns:
+        按输入顺序排列的输出路径列表，渲染失败的记录为 None（错误信息输出到标准错误）
+    """
+    out_dir = Path(output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    jobs = jobs or os.cpu_count() or 1
+    total = len(records)
+    digits = max(4, len(str(total)))
+    ext = image_encoder.file_extension(defaults["encode_profile"])
+    paths = [str(out_dir / f"{prefix}{i + 1:0{digits}d}{ext}") for i in range(total)]
+    results = [None] * total
+
+    start = time.perf_counter()
+    if jobs == 1:
+        _init_worker(defaults["font_name"], img_size, defaults.get("fallback_fonts"))
+        for i, record in enumerate(records):
+            try:
+                results[i] = render_record(i, record, defaults, img_size, paths[i])
+            except Exception as e:
+                _report_failure(i, e)
+            _report_progress(i + 1, total)
+    else:
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(defaults["font_name"], img_size, defaults.get("fallback_fonts"))
+        ) as executor:
+            futures = {
+                executor.submit(render_record, i, record, defaults, img_size, paths[i]): i
+                for i, record in enumerate(records)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    result = future.result()
+                    results[result[0]] = result
+                except Exception as e:
+                    _report_failure(futures[future], e)
+                _report_progress(done, total)
+    elapsed = time.perf_counter() - start
+
+    succeeded = [r for r in results if r is not None]
+    rate = len(succeeded) / elapsed if elapsed > 0 else 0.0
+    hits = sum(1 for r in succeeded if r[3])
+    print(f"完成：{len(succeeded)} 张图片，耗时 {elapsed:.2f} 秒，{rate:.1f} 张/秒（{jobs} 个进程）", file=sys.stderr)
+    if succeeded:
+        print(f"成品缓存命中：{hits}/{len(succeeded)}（{hits / len(succeeded):.0%}）", file=sys.stderr)
+    if len(succeeded) < total:
+        print(f"失败：{total - len(succeeded)} 条", file=sys.stderr)
+    return [r[1] if r is not None else None for r in results]
+
+
+def _report_failure(index: int, error: Exception) -> None:
+    # 换行后输出，避免与进度行混在一起
+    print(f"\n第 {index + 1} 条渲染失败: {error}", file=sys.stderr)
+
+
+def _report_progress(done: int, total: int) -> None:
+    print(f"\r进度: {done}/{total}", end="" if done < total else "\n", file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从剧本文件批量生成对话框图片")
+    parser.add_argument("script", help="剧本文件路径，- 表示从标准输入读取")
+    parser.add_argument("-o", "--output-dir", default="output", help="输出目录（默认 output）")
+    parser.add_argument("--format", choices=["auto", "text", "jsonl"], default="auto",
+                        help="剧本格式，auto 时按扩展名判断（.jsonl 为 JSONL）")
+    parser.add_argument("--speaker-sep", default=None, help="纯文本格式下角色名与对话内容的分隔符，例如 ：")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="并行进程数（默认 CPU 核数）")
+    parser.add_argument("--size", type=parse_size, default=(900, 300), help="图片尺寸，默认 900x300")
+    parser.add_argument("--prefix", default="", help="输出文件名前缀")
+    parser.add_argument("--profile", choices=list(image_encoder.ENCODE_PROFILES), default=None,
+                        help="输出编码配置（默认读取配置中的 output_encode_profile，否则为 png）")
+    parser.add_argument("--quality", type=int, default=None, help="WebP/JPEG 的质量（1-100）")
+    parser.add_argument("--auto-fit", action="store_true", help="文本放不下对话框时自动缩小字号")
+    parser.add_argument("--break-rules", action="store_true", help="启用断行规则（CJK 行首/行尾禁则、拉丁文按单词换行）")
+    parser.add_argument("--cache-dir", default=None, help="成品缓存的磁盘目录（默认使用配置中的 render_cache_dir）")
+    parser.add_argument("--config", default=config.CONFIG_FILE, help="配置文件路径")
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt == "auto":
+        fmt = "jsonl" if args.script.endswith(".jsonl") else "text"
+
+    if args.script == "-":
+        records = read_script(sys.stdin, fmt, args.speaker_sep)
+    else:
+        with open(args.script, "r", encoding="utf-8") as f:
+            records = read_script(f, fmt, args.speaker_sep)
+
+    if not records:
+        print("剧本中没有对话。", file=sys.stderr)
+        return 1
+
+    defaults = load_defaults(args.config)
+    if args.profile:
+        defaults["encode_profile"] = args.profile
+    if args.quality is not None:
+        defaults["quality"] = args.quality
+    if args.auto_fit:
+        defaults["auto_fit"] = True
+    if args.break_rules:
+        defaults["break_rules"] = True
+    if args.cache_dir:
+        defaults["render_cache_dir"] = args.cache_dir
+    paths = run_batch(records, args.output_dir, defaults, args.size, args.jobs, args.prefix)
+    return 1 if None in paths else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
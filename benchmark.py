@@ -0,0 +1,551 @@
+"""
+性能基准测试脚本
+
+用法：
+    python benchmark.py wrap [--font 字体路径] [--repeat 次数]
+    python benchmark.py encode [--font 字体路径] [--repeat 次数]
+    python benchmark.py composite [--repeat 次数]
+    python benchmark.py decode [--repeat 次数]
+    python benchmark.py pipeline [--runs 次数] [--cut-latency 秒] [--paste-delay 秒] [--trace] [--repeat-rate 0.5]
+    python benchmark.py suite [-o results.json] [--quick]
+    python benchmark.py compare 基线.json 新结果.json [--threshold 0.1]
+
+suite 只使用 Pillow 自带字体，可离线在任意环境运行；compare 比较两次 suite 的结果，
+耗时增加超过阈值的用例标记为回归，存在回归时退出码为 1。
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import PIL
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageFont, ImageStat
+
+import image_encoder
+import io_backends
+import picture_spawner
+import tracing
+
+# 默认使用 Pillow 自带字体，保证离线可运行
+DEFAULT_FONT = picture_spawner.DEFAULT_FONT_KEY
+BITMAP_FONT = picture_spawner.BITMAP_FONT_KEY
+
+LATIN_WORDS = ["the", "quick", "brown", "fox", "jumps", "over", "lazy", "dog", "AVG", "dialog"]
+CJK_CHARS = "这是一段用于测试的对话文本我们需要足够多的汉字来填满对话框，。！？「」"
+
+
+def legacy_wrap_text(text: str, max_width: int, font) -> list:
+    """旧版逐字符测量整行的换行实现，用作对照"""
+    lines = []
+    for paragraph in text.split('\n'):
+        if not paragraph:
+            lines.append("")
+            continue
+        current_line = ""
+        for char in paragraph:
+            test_line = current_line + char
+            bbox = font.getbbox(test_line)
+            if bbox[2] - bbox[0] > max_width:
+                if current_line:
+                    lines.append(current_line)
+                current_line = char
+            else:
+                current_line = test_line
+        if current_line:
+            lines.append(current_line)
+    return lines
+
+
+def make_text(length: int, seed: int = 0, script: str = "mixed") -> str:
+    """
+    生成测试文本
+
+    Args:
+        length: 字符数
+        seed: 随机种子
+        script: "mixed"（中英混排）、"latin" 或 "cjk"
+    """
+    rng = random.Random(seed)
+    latin_ratio = {"mixed": 0.5, "latin": 1.0, "cjk": 0.0}[script]
+    parts = []
+    size = 0
+    while size < length:
+        if rng.random() < latin_ratio:
+            piece = rng.choice(LATIN_WORDS) + " "
+        else:
+            piece = "".join(rng.choice(CJK_CHARS) for _ in range(rng.randint(2, 8)))
+        parts.append(piece)
+        size += len(piece)
+    return "".join(parts)[:length]
+
+
+def load_bench_font(font_path: str, size: int):
+    if font_path == DEFAULT_FONT:
+        return ImageFont.load_default(size)
+    if font_path == BITMAP_FONT:
+        return ImageFont.load_default_imagefont()
+    return ImageFont.truetype(font_path, size)
+
+
+def _time_call(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_wrap(font_path: str = DEFAULT_FONT, repeat: int = 3) -> None:
+    """对比旧版与新版 wrap_text 在 1k/10k 字符输入上的耗时"""
+    font = load_bench_font(font_path, 45)
+    max_width = 590  # 900x300 画布下的内容宽度
+    print(f"{'长度':>8} {'旧版(ms)':>12} {'新版(ms)':>12} {'加速比':>8}")
+    for length in (1_000, 10_000):
+        text = make_text(length)
+        expected = legacy_wrap_text(text, max_width, font)
+        actual = picture_spawner.wrap_text(text, max_width, font)
+        if actual != expected:
+            raise AssertionError(f"换行结果与旧版不一致（长度 {length}）")
+        old = _time_call(lambda: legacy_wrap_text(text, max_width, font), repeat)
+        new = _time_call(lambda: picture_spawner.wrap_text(text, max_width, font), repeat)
+        print(f"{length:>8} {old * 1000:>12.2f} {new * 1000:>12.2f} {old / new:>7.1f}x")
+
+
+def make_assets(directory: str) -> tuple:
+    """
+    生成接近真实照片的背景（渐变 + 噪点 + 模糊色块）与带透明通道的头像
+
+    Returns:
+        (头像路径, 背景路径)
+    """
+    rng = random.Random(0)
+    bg = Image.linear_gradient("L").resize((1600, 1200)).convert("RGB")
+    draw = ImageDraw.Draw(bg)
+    for _ in range(60):
+        x, y = rng.randint(0, 1500), rng.randint(0, 1100)
+        size = rng.randint(40, 400)
+        color = tuple(rng.randint(0, 255) for _ in range(3))
+        draw.ellipse([x, y, x + size, y + size], fill=color)
+    bg = bg.filter(ImageFilter.GaussianBlur(12))
+    noise = Image.effect_noise((1600, 1200), 24).convert("RGB")
+    bg = Image.blend(bg, noise, 0.15)
+    background_path = os.path.join(directory, "background.jpg")
+    bg.save(background_path, quality=92)
+
+    avatar = Image.new("RGBA", (512, 512), (0, 0, 0, 0))
+    ImageDraw.Draw(avatar).ellipse([16, 16, 496, 496], fill=(230, 180, 150, 255))
+    avatar_path = os.path.join(directory, "avatar.png")
+    avatar.save(avatar_path)
+    return avatar_path, background_path
+
+
+def bench_encode(font_path: str = DEFAULT_FONT, repeat: int = 5) -> None:
+    """对比各编码配置在 900x300 典型画面上的编码耗时与文件大小"""
+    with tempfile.TemporaryDirectory() as tmp:
+        avatar_path, background_path = make_assets(tmp)
+        img = picture_spawner.generate_dialog_image(
+            avatar_path=avatar_path,
+            background_path=background_path,
+            username="角色名称",
+            dialog_text=make_text(60),
+            font_index=font_path,
+            img_size=(900, 300)
+        )
+    print(f"{'配置':<16} {'耗时(ms)':>10} {'大小(KB)':>10}")
+    for profile in image_encoder.ENCODE_PROFILES:
+        data = image_encoder.encode_image(img, profile)
+        elapsed = _time_call(lambda: image_encoder.encode_image(img, profile), repeat)
+        print(f"{profile:<16} {elapsed * 1000:>10.2f} {len(data) / 1024:>10.1f}")
+
+
+def legacy_blend_box(image: Image.Image, coords, fill: tuple) -> Image.Image:
+    """旧版的半透明对话框：整幅透明图层 + 整幅 RGBA 转换与合成，用于对比"""
+    overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    ImageDraw.Draw(overlay).rectangle(coords, fill=fill)
+    return Image.alpha_composite(image.convert("RGBA"), overlay).convert("RGB")
+
+
+def bench_composite(repeat: int = 10) -> None:
+    """
+    对比整幅合成与只合成对话框区域的耗时与临时内存
+
+    临时内存按分配的图片缓冲区计算：旧版需要整幅的透明图层、RGBA 转换结果与合成结果
+    （各 4 字节/像素）以及转回的 RGB 图片（3 字节/像素）；新版只需对话框大小的单通道蒙版（1 字节/像素）。
+    """
+    fill = (20, 20, 40, 180)
+    print(f"{'尺寸':<10} {'旧版(ms)':>10} {'新版(ms)':>10} {'加速比':>8} {'旧版临时(MB)':>14} {'新版临时(MB)':>14}")
+    for width, height in SUITE_IMG_SIZES:
+        background = Image.effect_noise((width, height), 40).convert("RGB")
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            layout = picture_spawner.compute_layout((width, height), "Name", DEFAULT_FONT)
+        content_height = layout["text_box_height"] - layout["username_height"] - 30
+        coords = [
+            (layout["text_box_x"] - 10, layout["content_start_y"] - 10),
+            (layout["text_box_x"] + layout["text_box_width"] + 10, layout["content_start_y"] + content_height),
+        ]
+        expected = legacy_blend_box(background, coords, fill)
+        actual = background.copy()
+        picture_spawner.blend_box(actual, coords, fill)
+        if expected.tobytes() != actual.tobytes():
+            raise AssertionError(f"合成结果与旧版不一致（{width}x{height}）")
+
+        old = _time_call(lambda: legacy_blend_box(background, coords, fill), repeat)
+        # 新版原地修改，每次在副本上合成，并扣除复制的耗时
+        copy_time = _time_call(background.copy, repeat)
+        new = _time_call(lambda: picture_spawner.blend_box(background.copy(), coords, fill), repeat) - copy_time
+        box_w = coords[1][0] - coords[0][0] + 1
+        box_h = coords[1][1] - coords[0][1] + 1
+        old_mb = width * height * (4 + 4 + 4 + 3) / 2 ** 20
+        new_mb = box_w * box_h / 2 ** 20
+        print(f"{width}x{height:<5} {old * 1000:>10.2f} {new * 1000:>10.2f} {old / max(new, 1e-9):>7.1f}x"
+              f" {old_mb:>14.1f} {new_mb:>14.1f}")
+
+
+def legacy_load_resized(path: str, size: tuple, mode: str) -> Image.Image:
+    """旧版的素材加载：完整解码、转换为目标模式后直接 LANCZOS 缩放，用于对比"""
+    return Image.open(path).convert(mode).resize(size, Image.Resampling.LANCZOS)
+
+
+def make_large_assets(directory: str) -> list:
+    """
+    生成大尺寸素材：4000x3000 的 JPEG 照片与 3000x3000 的 RGBA PNG
+
+    Returns:
+        [(名称, 路径), ...]
+    """
+    photo = Image.effect_noise((1000, 750), 60).convert("RGB").resize((4000, 3000), Image.Resampling.BICUBIC)
+    photo = Image.blend(photo, Image.linear_gradient("L").resize((4000, 3000)).convert("RGB"), 0.5)
+    jpeg_path = os.path.join(directory, "photo.jpg")
+    photo.save(jpeg_path, quality=90)
+
+    portrait = Image.new("RGBA", (3000, 3000), (0, 0, 0, 0))
+    ImageDraw.Draw(portrait).ellipse([100, 100, 2900, 2900], fill=(230, 180, 150, 255))
+    portrait.paste(Image.effect_noise((1000, 1000), 40).convert("RGBA"), (1000, 1000))
+    png_path = os.path.join(directory, "portrait.png")
+    portrait.save(png_path)
+    return [("jpeg-4000x3000", jpeg_path), ("png-3000x3000", png_path)]
+
+
+def bench_decode(repeat: int = 3) -> None:
+    """
+    对比大尺寸素材的完整解码与缩小解码（JPEG draft + reduce）的耗时，以及命中磁盘缓存（mmap）
+    与内存缓存后的耗时
+
+    同时输出与旧版结果的最大/平均像素差，用于确认缩小解码没有明显的画质损失。
+    """
+    targets = (("背景 900x300", (900, 300), "RGB"), ("头像 195x195", (195, 195), "RGBA"),
+               ("背景 1920x1080", (1920, 1080), "RGB"))
+    print(f"{'素材':<16} {'目标':<16} {'旧版(ms)':>10} {'新版(ms)':>10} {'磁盘(ms)':>10} {'内存(ms)':>10}"
+          f" {'加速比':>8} {'最大差':>6} {'平均差':>6}")
+    disk_dir = picture_spawner.ASSET_DISK_CACHE_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        picture_spawner.ASSET_DISK_CACHE_DIR = os.path.join(tmp, "asset_cache")
+        for name, path in make_large_assets(tmp):
+            for label, size, mode in targets:
+                expected = legacy_load_resized(path, size, mode)
+                actual = picture_spawner._decode_resized(path, size, mode)
+                diff = ImageChops.difference(expected, actual)
+                max_diff = max(high for _, high in diff.getextrema())
+                mean_diff = sum(ImageStat.Stat(diff).mean) / len(diff.getbands())
+
+                old = _time_call(lambda: legacy_load_resized(path, size, mode), repeat)
+                new = _time_call(lambda: picture_spawner._decode_resized(path, size, mode), repeat)
+                # 第一次加载写入磁盘缓存，之后每次清空内存缓存，只命中磁盘缓存
+                picture_spawner.load_resized_image(path, size, mode)
+                disk = _time_call(lambda: (picture_spawner.clear_asset_cache(),
+                                           picture_spawner.load_resized_image(path, size, mode)), repeat)
+                cached = _time_call(lambda: picture_spawner.load_resized_image(path, size, mode), repeat)
+                print(f"{name:<16} {label:<16} {old * 1000:>10.1f} {new * 1000:>10.1f} {disk * 1000:>10.3f}"
+                      f" {cached * 1000:>10.3f} {old / new:>7.1f}x {max_diff:>6} {mean_diff:>6.2f}")
+        picture_spawner.clear_asset_cache()
+        picture_spawner.ASSET_DISK_CACHE_DIR = disk_dir
+
+
+def _format_distribution(samples: list) -> str:
+    ordered = sorted(samples)
+
+    def pct(p):
+        return tracing.percentile(ordered, p) * 1000
+
+    return (f"{statistics.mean(ordered) * 1000:>9.2f} {pct(50):>9.2f} {pct(95):>9.2f} "
+            f"{pct(99):>9.2f} {ordered[-1] * 1000:>9.2f}")
+
+
+# 常用短句，用于模拟成品缓存命中
+STOCK_LINES = ("好的", "收到", "谢谢", "明白了", "稍等一下", "没问题", "晚安", "哈哈哈")
+
+
+def bench_pipeline(runs: int = 1000, cut_latency: float = 0.0, paste_delay: float = 0.0,
+                   font_path: str = DEFAULT_FONT, trace: bool = False, repeat_rate: float = 0.0) -> None:
+    """
+    用内存假后端驱动 main.on_hotkey_pressed，统计各阶段与总延迟分布
+
+    不需要 root、键盘与桌面环境，可在无界面的 Linux 上运行。
+    trace 为 True 时启用 tracing，额外输出细分阶段（换行、底图、绘制文本等）的统计。
+    repeat_rate 为输入常用短句（STOCK_LINES）的比例，用于观察成品缓存的命中率与命中后的延迟。
+    """
+    import main
+
+    backend = io_backends.FakeBackend(cut_latency=cut_latency)
+    main.set_backend(backend)
+    main.PASTE_DELAY = paste_delay
+    main.RENDER_SERVER = None
+    main.WANT_AUTO_SEND = 0
+    main.FONT_NAME = font_path
+    main.CLIPBOARD_PROFILE = "png-fast"
+    main.RENDER_CACHE.clear()
+
+    stages = ("capture", "render", "encode", "clipboard", "paste", "total")
+    samples = {stage: [] for stage in stages}
+    rng = random.Random(1)
+    tracing.reset()
+    tracing.configure(enabled=trace)
+    with tempfile.TemporaryDirectory() as tmp:
+        main.AVATAR_FILE, main.BACKGROUND_FILE = make_assets(tmp)
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            for _ in range(runs):
+                if rng.random() < repeat_rate:
+                    backend.set_input(rng.choice(STOCK_LINES))
+                else:
+                    backend.set_input(make_text(rng.randint(5, 120), rng.randint(0, 10_000)))
+                main.on_hotkey_pressed()
+                for stage in stages:
+                    if stage in main.LAST_TIMINGS:
+                        samples[stage].append(main.LAST_TIMINGS[stage])
+
+    print(f"运行 {runs} 次，成功粘贴 {len(backend.pasted)} 次")
+    cache = main.RENDER_CACHE.stats()
+    print(f"成品缓存命中率 {cache['hit_rate']:.1%}（{cache['entries']} 条，{cache['bytes'] / 1024:.0f} KB）")
+    print(f"{'阶段':<10} {'平均(ms)':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'最大':>9}")
+    for stage in stages:
+        if samples[stage]:
+            print(f"{stage:<10} {_format_distribution(samples[stage])}")
+    if trace:
+        tracing.configure(enabled=False)
+        print()
+        print(tracing.format_stats())
+
+
+# ===== 基准测试套件 =====
+SUITE_TEXT_LENGTHS = (0, 100, 1_000, 10_000)
+SUITE_IMG_SIZES = ((900, 300), (1920, 1080), (3840, 2160))
+SUITE_FONTS = {"truetype": DEFAULT_FONT, "bitmap": BITMAP_FONT}
+# 位图字体只支持 Latin-1 字符
+SUITE_SCRIPTS = {"truetype": ("latin", "cjk"), "bitmap": ("latin",)}
+
+
+def _measure(func, repeat: int, setup=None) -> dict:
+    """
+    多次运行 func，返回耗时统计（秒）
+
+    setup 在每次计时前执行且不计入耗时（用于测量冷启动）；没有 setup 时先不计时地运行一次预热。
+    """
+    if setup is None:
+        func()
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - t0)
+    return {"median": statistics.median(samples), "min": min(samples), "repeat": repeat}
+
+
+def _clear_render_caches() -> None:
+    picture_spawner.clear_base_frame_cache()
+    picture_spawner.clear_asset_cache()
+
+
+def run_suite(repeat: int = 5, quick: bool = False) -> dict:
+    """
+    运行基准测试套件
+
+    覆盖 get_available_font、wrap_text、generate_dialog_image 与剪贴板编码，
+    变化维度：文本长度、CJK/拉丁文、图片尺寸、有无背景与头像、位图/TrueType 字体。
+
+    Args:
+        repeat: 每个用例的重复次数（取中位数）
+        quick: 只运行较小的尺寸与文本长度
+
+    Returns:
+        {用例名: 耗时统计}
+    """
+    lengths = SUITE_TEXT_LENGTHS[:3] if quick else SUITE_TEXT_LENGTHS
+    sizes = SUITE_IMG_SIZES[:2] if quick else SUITE_IMG_SIZES
+    results = {}
+
+    def record(name, func, setup=None):
+        results[name] = _measure(func, repeat, setup)
+        print(f"{name:<56} {results[name]['median'] * 1000:>10.2f} ms", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w", encoding="utf-8") as devnull:
+        avatar_path, background_path = make_assets(tmp)
+        with contextlib.redirect_stdout(devnull):
+            # 字体加载：冷启动（清空缓存）与缓存命中
+            for font_name, font_key in SUITE_FONTS.items():
+                record(f"font/{font_name}/cold",
+                       lambda: picture_spawner.get_available_font(font_key, 45),
+                       setup=picture_spawner.clear_font_cache)
+                record(f"font/{font_name}/warm",
+                       lambda: picture_spawner.get_available_font(font_key, 45))
+
+            # 换行
+            for font_name, font_key in SUITE_FONTS.items():
+                font = load_bench_font(font_key, 45)
+                for script in SUITE_SCRIPTS[font_name]:
+                    for length in lengths:
+                        text = make_text(length, script=script)
+                        record(f"wrap/{font_name}/{script}/{length}",
+                               lambda: picture_spawner.wrap_text(text, 590, font))
+
+            # 完整渲染：尺寸 × 有无素材 × 文字类型
+            for width, height in sizes:
+                for assets in ("plain", "assets"):
+                    avatar = avatar_path if assets == "assets" else ""
+                    background = background_path if assets == "assets" else ""
+                    for script in ("latin", "cjk"):
+                        text = make_text(100, script=script)
+                        kwargs = dict(avatar_path=avatar, background_path=background, username="角色名称",
+                                      dialog_text=text, font_index=DEFAULT_FONT, img_size=(width, height))
+                        base = f"render/{width}x{height}/{assets}/{script}"
+                        record(f"{base}/cold", lambda: picture_spawner.generate_dialog_image(**kwargs),
+                               setup=_clear_render_caches)
+                        record(f"{base}/warm", lambda: picture_spawner.generate_dialog_image(**kwargs))
+
+            # 文本长度与字体类型对完整渲染的影响（900x300）
+            for font_name, font_key in SUITE_FONTS.items():
+                script = SUITE_SCRIPTS[font_name][-1]
+                username = "角色名称" if script == "cjk" else "Name"
+                for length in lengths:
+                    text = make_text(length, script=script)
+                    record(f"render/900x300/length/{font_name}/{script}/{length}",
+                           lambda: picture_spawner.generate_dialog_image(
+                               avatar_path=avatar_path, background_path=background_path, username=username,
+                               dialog_text=text, font_index=font_key, img_size=(900, 300)))
+
+            # 剪贴板编码
+            img = picture_spawner.generate_dialog_image(
+                avatar_path=avatar_path, background_path=background_path, username="角色名称",
+                dialog_text=make_text(60), font_index=DEFAULT_FONT, img_size=(900, 300))
+            for profile in image_encoder.ENCODE_PROFILES:
+                record(f"encode/{profile}", lambda: image_encoder.encode_image(img, profile))
+    return results
+
+
+def save_results(results: dict, path: str) -> None:
+    """把套件结果与运行环境保存为 JSON"""
+    data = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def compare_results(baseline_path: str, current_path: str, threshold: float = 0.1) -> list:
+    """
+    比较两次套件结果（按中位数）
+
+    Args:
+        baseline_path: 基线结果 JSON
+        current_path: 新结果 JSON
+        threshold: 允许的相对增幅，例如 0.1 表示慢 10% 以内不算回归
+
+    Returns:
+        回归的用例名列表
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    with open(current_path, "r", encoding="utf-8") as f:
+        current = json.load(f)["results"]
+
+    regressions = []
+    print(f"{'用例':<56} {'基线(ms)':>10} {'当前(ms)':>10} {'变化':>8}")
+    for name in sorted(set(baseline) & set(current)):
+        old = baseline[name]["median"]
+        new = current[name]["median"]
+        change = (new - old) / old if old > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  回归"
+        print(f"{name:<56} {old * 1000:>10.2f} {new * 1000:>10.2f} {change:>+7.1%}{flag}")
+    for name in sorted(set(baseline) ^ set(current)):
+        print(f"{name:<56} （仅存在于{'基线' if name in baseline else '当前结果'}中）")
+    print(f"\n共 {len(regressions)} 个用例回归（阈值 {threshold:.0%}）")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AVG Text Spawner 性能基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    wrap = sub.add_parser("wrap", help="wrap_text 换行耗时")
+    wrap.add_argument("--font", default=DEFAULT_FONT, help="字体文件路径，默认使用 Pillow 自带字体")
+    wrap.add_argument("--repeat", type=int, default=3, help="每项重复次数（取最快一次）")
+
+    encode = sub.add_parser("encode", help="各编码配置的耗时与文件大小")
+    encode.add_argument("--font", default=DEFAULT_FONT, help="字体文件路径，默认使用 Pillow 自带字体")
+    encode.add_argument("--repeat", type=int, default=5, help="每项重复次数（取最快一次）")
+
+    composite = sub.add_parser("composite", help="半透明对话框整幅合成与区域合成的耗时与临时内存")
+    composite.add_argument("--repeat", type=int, default=10, help="每项重复次数（取最快一次）")
+
+    decode = sub.add_parser("decode", help="大尺寸背景/头像的完整解码与缩小解码耗时")
+    decode.add_argument("--repeat", type=int, default=3, help="每项重复次数（取最快一次）")
+
+    pipeline = sub.add_parser("pipeline", help="热键流水线端到端延迟（内存假后端）")
+    pipeline.add_argument("--runs", type=int, default=1000, help="运行次数（默认 1000）")
+    pipeline.add_argument("--cut-latency", type=float, default=0.0, help="模拟应用响应剪切的延迟（秒）")
+    pipeline.add_argument("--paste-delay", type=float, default=0.0, help="粘贴后的等待时间（秒），实际服务为 0.1")
+    pipeline.add_argument("--font", default=DEFAULT_FONT, help="字体文件路径，默认使用 Pillow 自带字体")
+    pipeline.add_argument("--trace", action="store_true", help="启用 tracing 并输出细分阶段统计")
+    pipeline.add_argument("--repeat-rate", type=float, default=0.0, help="输入常用短句的比例（0-1），用于观察成品缓存")
+
+    suite = sub.add_parser("suite", help="运行完整基准测试套件并保存 JSON 结果")
+    suite.add_argument("-o", "--output", default="bench_results.json", help="结果文件（默认 bench_results.json）")
+    suite.add_argument("--repeat", type=int, default=5, help="每个用例的重复次数（取中位数）")
+    suite.add_argument("--quick", action="store_true", help="跳过 4K 与 10k 字符等较慢的用例")
+
+    compare = sub.add_parser("compare", help="比较两次套件结果，标记回归")
+    compare.add_argument("baseline", help="基线结果 JSON")
+    compare.add_argument("current", help="新结果 JSON")
+    compare.add_argument("--threshold", type=float, default=0.1, help="允许的相对增幅（默认 0.1，即 10%%）")
+
+    args = parser.parse_args()
+    # 不读写用户目录中的素材磁盘缓存，冷启动用例才是真正的冷启动
+    picture_spawner.ASSET_DISK_CACHE_DIR = None
+    if args.command == "wrap":
+        bench_wrap(args.font, args.repeat)
+    elif args.command == "encode":
+        bench_encode(args.font, args.repeat)
+    elif args.command == "composite":
+        bench_composite(args.repeat)
+    elif args.command == "decode":
+        bench_decode(args.repeat)
+    elif args.command == "pipeline":
+        bench_pipeline(args.runs, args.cut_latency, args.paste_delay, args.font, args.trace, args.repeat_rate)
+    elif args.command == "suite":
+        save_results(run_suite(args.repeat, args.quick), args.output)
+        print(f"结果已保存到: {args.output}")
+    elif args.command == "compare":
+        return 1 if compare_results(args.baseline, args.current, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,7 @@
 import json
+import os
+import threading
 from pathlib import Path
-import main
 
 CONFIG_FILE = "config.json"
 
@@ -36,6 +37,10 @@ def save_config(config: dict, config_path: str = CONFIG_FILE) -> None:
     """
     with open(config_path, 'w', encoding='utf-8') as f:
         json.dump(config, f, indent=2, ensure_ascii=False)
+    # 同步内存中的配置缓存
+    store = _stores.get(_store_key(config_path))
+    if store is not None:
+        store.reload()
 
 
 def get_hotkey(config_path: str = CONFIG_FILE) -> str:
@@ -48,8 +53,7 @@ def get_hotkey(config_path: str = CONFIG_FILE) -> str:
     Returns:
         热键字符串
     """
-    config = load_config(config_path)
-    return config.get("hotkey", "enter")
+    return get_store(config_path).get("hotkey", "enter")
 
 
 def set_hotkey(new_hotkey: str, config_path: str = CONFIG_FILE) -> None:
@@ -63,6 +67,8 @@ def set_hotkey(new_hotkey: str, config_path: str = CONFIG_FILE) -> None:
     config = load_config(config_path)
     config["hotkey"] = new_hotkey
     save_config(config, config_path)
+    # 延迟导入，避免无需热键的模式（批量、无界面渲染）也依赖 keyboard
+    import main
     main.HOTKEY = new_hotkey
     print(f"热键已更新为: {new_hotkey}")
 
@@ -78,8 +84,7 @@ def get_config_value(key: str, config_path: str = CONFIG_FILE):
     Returns:
         配置值
     """
-    config = load_config(config_path)
-    return config.get(key)
+    return get_store(config_path).get(key)
 
 
 def set_config_value(key: str, value, config_path: str = CONFIG_FILE) -> None:
@@ -95,3 +100,149 @@ def set_config_value(key: str, value, config_path: str = CONFIG_FILE) -> None:
     config[key] = value
     save_config(config, config_path)
     print(f"配置 '{key}' 已更新为: {value}")
+
+
+class ConfigStore:
+    """
+    内存中的配置缓存
+
+    配置文件只在启动和文件变化时解析一次，读取配置不再访问磁盘。
+    start_watching 启动后台线程按 mtime 轮询配置文件，变化时整体替换配置字典，
+    并把变化的键通知给订阅者，由订阅者只重建受影响的部分（字体、热键等）。
+    """
+
+    def __init__(self, config_path: str = CONFIG_FILE):
+        self.config_path = config_path
+        self._data = {}
+        self._signature = None
+        self._failed_signature = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._watcher = None
+        self._stop = threading.Event()
+        self.reload()
+
+    def get(self, key: str, default=None):
+        """读取配置值"""
+        return self._data.get(key, default)
+
+    def snapshot(self) -> dict:
+        """返回当前配置的副本"""
+        return dict(self._data)
+
+    def _file_signature(self):
+        st = os.stat(self.config_path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def reload(self) -> dict:
+        """
+        重新读取配置文件并替换内存中的配置
+
+        Returns:
+            变化的配置项 {键: 新值}（被删除的键值为 None）
+
+        Raises:
+            FileNotFoundError: 如果配置文件不存在
+            json.JSONDecodeError: 如果JSON格式无效
+        """
+        signature = self._file_signature()
+        data = load_config(self.config_path)
+        with self._lock:
+            old = self._data
+            # 整体替换字典引用，读取方不会看到更新到一半的配置
+            self._data = data
+            self._signature = signature
+            listeners = list(self._listeners)
+        changed = {k: data.get(k) for k in set(old) | set(data) if old.get(k) != data.get(k)}
+        if changed and old:
+            for callback, keys in listeners:
+                relevant = changed if keys is None else {k: v for k, v in changed.items() if k in keys}
+                if relevant:
+                    try:
+                        callback(relevant)
+                    except Exception as e:
+                        print(f"配置变更回调出错: {e}")
+        return changed
+
+    def check(self) -> dict:
+        """
+        配置文件的 mtime 或大小变化时重新加载
+
+        Returns:
+            变化的配置项，文件未变化或读取失败时为空字典
+        """
+        signature = None
+        try:
+            signature = self._file_signature()
+            if signature in (self._signature, self._failed_signature):
+                return {}
+            return self.reload()
+        except (OSError, json.JSONDecodeError) as e:
+            # 文件可能正在被写入，保留旧配置，文件再次变化时重试
+            if signature != self._failed_signature:
+                print(f"重新加载配置失败，继续使用旧配置: {e}")
+            self._failed_signature = signature
+            return {}
+
+    def subscribe(self, callback, keys=None) -> None:
+        """
+        订阅配置变化
+
+        Args:
+            callback: 回调函数，参数为变化的配置项 {键: 新值}
+            keys: 只关心的键集合，为 None 时接收所有变化
+        """
+        with self._lock:
+            self._listeners.append((callback, set(keys) if keys is not None else None))
+
+    def start_watching(self, interval: float = 1.0) -> None:
+        """
+        启动后台线程轮询配置文件
+
+        Args:
+            interval: 轮询间隔（秒）
+        """
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+
+        def watch():
+            while not self._stop.wait(interval):
+                self.check()
+
+        self._watcher = threading.Thread(target=watch, name="config-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        """停止轮询"""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _store_key(config_path: str) -> str:
+    return os.path.abspath(config_path)
+
+
+def get_store(config_path: str = CONFIG_FILE) -> ConfigStore:
+    """
+    获取配置文件对应的共享配置缓存，第一次调用时加载配置文件
+
+    Args:
+        config_path: 配置文件路径
+
+    Returns:
+        ConfigStore 对象
+    """
+    key = _store_key(config_path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = ConfigStore(config_path)
+            _stores[key] = store
+    return store
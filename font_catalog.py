@@ -0,0 +1,411 @@
+"""
+系统字体索引
+
+递归扫描系统字体目录，记录每个字体文件中每个 face 的字体族、样式、face 索引与
+码位覆盖范围（直接解析 cmap 表），结果保存到 FONT_INDEX_FILE。之后每次启动只需 stat
+各个目录：目录的 mtime 未变化时沿用缓存中的文件与子目录列表，只重新读取新增或修改过的字体文件。
+
+GUI 的字体下拉框与渲染器都通过 find_font 按名称查找字体（字典查找，O(1)），
+名称可以是文件名（"STKAITI.TTF"）、去掉扩展名的文件名、字体族名（"Noto Sans CJK SC"）、
+"字体族 样式"（"DejaVu Sans Bold"），或 "文件名#face 索引"（TTC 字体集合中的其他 face）。
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+
+from PIL import ImageFont
+
+INDEX_VERSION = 1
+FONT_EXTENSIONS = (".ttf", ".ttc", ".otf", ".otc")
+FONT_INDEX_FILE = os.path.join(os.path.expanduser('~'), 'ADVTextSpawner', 'font_index.json')
+# 按名称查找时优先选择的样式（字体族名对应多个 face 时）
+REGULAR_STYLES = ("regular", "book", "normal", "roman", "medium")
+
+_index = None
+_names = None
+_lock = threading.Lock()
+
+
+def font_dirs() -> list:
+    """返回当前平台的系统与用户字体目录"""
+    home = os.path.expanduser('~')
+    if sys.platform.startswith('win'):
+        dirs = [os.path.join(os.environ.get('WINDIR', 'C:/Windows'), 'Fonts')]
+        if os.environ.get('LOCALAPPDATA'):
+            dirs.append(os.path.join(os.environ['LOCALAPPDATA'], 'Microsoft', 'Windows', 'Fonts'))
+    elif sys.platform == 'darwin':
+        dirs = ['/System/Library/Fonts', '/Library/Fonts', os.path.join(home, 'Library', 'Fonts')]
+    else:
+        dirs = ['/usr/share/fonts', '/usr/local/share/fonts',
+                os.path.join(home, '.local', 'share', 'fonts'), os.path.join(home, '.fonts')]
+    return [d for d in dirs if os.path.isdir(d)]
+
+
+# ===== cmap 解析 =====
+def _table_directory(data: bytes, offset: int) -> dict:
+    """读取 sfnt 表目录，返回 {表名: (偏移, 长度)}"""
+    (num_tables,) = struct.unpack_from(">H", data, offset + 4)
+    tables = {}
+    for i in range(num_tables):
+        tag, _, table_offset, length = struct.unpack_from(">4sIII", data, offset + 12 + 16 * i)
+        tables[tag] = (table_offset, length)
+    return tables
+
+
+def face_offsets(data) -> list:
+    """返回字体文件中每个 face 的 sfnt 头偏移（TTC/OTC 字体集合有多个 face）"""
+    if data[:4] == b"ttcf":
+        (num_fonts,) = struct.unpack_from(">I", data, 8)
+        return list(struct.unpack_from(f">{num_fonts}I", data, 12))
+    return [0]
+
+
+def _format4_ranges(data: bytes, offset: int) -> list:
+    seg_count = struct.unpack_from(">H", data, offset + 6)[0] // 2
+    ends = struct.unpack_from(f">{seg_count}H", data, offset + 14)
+    starts_at = offset + 16 + 2 * seg_count
+    starts = struct.unpack_from(f">{seg_count}H", data, starts_at)
+    deltas = struct.unpack_from(f">{seg_count}h", data, starts_at + 2 * seg_count)
+    range_offsets_at = starts_at + 4 * seg_count
+    range_offsets = struct.unpack_from(f">{seg_count}H", data, range_offsets_at)
+    ranges = []
+    for i in range(seg_count):
+        start, end = starts[i], ends[i]
+        if start == 0xFFFF:
+            continue
+        if range_offsets[i] == 0:
+            # 码位直接加 idDelta 得到字形编号，只有结果为 0 的那个码位没有字形
+            missing = (-deltas[i]) & 0xFFFF
+            if start <= missing <= end:
+                if start < missing:
+                    ranges.append((start, missing - 1))
+                if missing < end:
+                    ranges.append((missing + 1, end))
+            else:
+                ranges.append((start, end))
+            continue
+        # 通过 glyphIdArray 间接查找，逐个码位检查字形编号是否为 0
+        base = range_offsets_at + 2 * i + range_offsets[i]
+        run_start = None
+        for code in range(start, end + 1):
+            at = base + 2 * (code - start)
+            glyph = struct.unpack_from(">H", data, at)[0] if at + 2 <= len(data) else 0
+            if glyph:
+                if run_start is None:
+                    run_start = code
+            elif run_start is not None:
+                ranges.append((run_start, code - 1))
+                run_start = None
+        if run_start is not None:
+            ranges.append((run_start, end))
+    return ranges
+
+
+def _format12_ranges(data: bytes, offset: int) -> list:
+    (num_groups,) = struct.unpack_from(">I", data, offset + 12)
+    ranges = []
+    for i in range(num_groups):
+        start, end, glyph = struct.unpack_from(">III", data, offset + 16 + 12 * i)
+        if glyph == 0:
+            start += 1
+        if start <= end:
+            ranges.append((start, min(end, 0x10FFFF)))
+    return ranges
+
+
+def cmap_ranges(data: bytes, face_offset: int = 0) -> list:
+    """
+    解析一个 face 的 cmap 表，返回有字形的码位范围
+
+    优先使用 Unicode 全平面子表（format 12），否则使用 BMP 子表（format 4）。
+
+    Returns:
+        排序并合并后的 [(起始码位, 结束码位), ...]，没有可用子表时为空列表
+    """
+    tables = _table_directory(data, face_offset)
+    if b"cmap" not in tables:
+        return []
+    cmap_offset = tables[b"cmap"][0]
+    (num_subtables,) = struct.unpack_from(">H", data, cmap_offset + 2)
+    best = None
+    for i in range(num_subtables):
+        platform, encoding, sub_offset = struct.unpack_from(">HHI", data, cmap_offset + 4 + 8 * i)
+        at = cmap_offset + sub_offset
+        (fmt,) = struct.unpack_from(">H", data, at)
+        if fmt == 12 and (platform, encoding) in ((3, 10), (0, 4), (0, 6)):
+            rank = 0
+        elif fmt == 4 and (platform == 0 or (platform, encoding) == (3, 1)):
+            rank = 1
+        elif fmt == 4 and (platform, encoding) == (3, 0):
+            # 符号字体
+            rank = 2
+        else:
+            continue
+        if best is None or rank < best[0]:
+            best = (rank, fmt, at)
+    if best is None:
+        return []
+    _, fmt, at = best
+    ranges = _format12_ranges(data, at) if fmt == 12 else _format4_ranges(data, at)
+    return merge_ranges(ranges)
+
+
+def merge_ranges(ranges) -> list:
+    """排序并合并相邻或重叠的码位范围"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def read_font_file(path: str) -> list:
+    """
+    读取字体文件中每个 face 的元数据
+
+    Returns:
+        [{"index", "family", "style", "coverage", "glyphs"}, ...]，coverage 为扁平的
+        [起始, 结束, 起始, 结束, ...] 码位范围列表，glyphs 为覆盖的码位数
+    """
+    # 只映射文件，cmap 解析只会读到表目录与 cmap 表所在的页
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        faces = []
+        for index, offset in enumerate(face_offsets(data)):
+            try:
+                family, style = ImageFont.truetype(path, 12, index=index).getname()
+                ranges = cmap_ranges(data, offset)
+            except Exception:
+                continue
+            faces.append({
+                "index": index,
+                "family": family or "",
+                "style": style or "",
+                "coverage": [value for r in ranges for value in r],
+                "glyphs": sum(end - start + 1 for start, end in ranges),
+            })
+    return faces
+
+
+# ===== 索引 =====
+def _scan_dir(directory: str, cached: dict, dirs: dict) -> bool:
+    """
+    递归扫描一个目录，结果写入 dirs
+
+    Args:
+        directory: 目录路径
+        cached: 上一次保存的目录记录 {目录: {"mtime_ns", "files", "subdirs"}}
+        dirs: 本次扫描得到的目录记录
+
+    Returns:
+        是否有变化
+    """
+    try:
+        mtime_ns = os.stat(directory).st_mtime_ns
+    except OSError:
+        return True
+    previous = cached.get(directory)
+    changed = False
+    if previous is not None and previous["mtime_ns"] == mtime_ns:
+        # 目录项未变化，沿用文件与子目录列表；文件本身被覆盖时只需比较文件的 mtime
+        entry = {"mtime_ns": mtime_ns, "files": {}, "subdirs": previous["subdirs"]}
+        for name, record in previous["files"].items():
+            path = os.path.join(directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                changed = True
+                continue
+            if record["mtime_ns"] != st.st_mtime_ns or record["size"] != st.st_size:
+                record = _index_file(path, st)
+                changed = True
+            entry["files"][name] = record
+    else:
+        changed = True
+        entry = {"mtime_ns": mtime_ns, "files": {}, "subdirs": []}
+        try:
+            with os.scandir(directory) as it:
+                items = sorted(it, key=lambda e: e.name)
+        except OSError:
+            items = []
+        old_files = previous["files"] if previous else {}
+        for item in items:
+            try:
+                if item.is_dir(follow_symlinks=False):
+                    entry["subdirs"].append(item.name)
+                elif item.name.lower().endswith(FONT_EXTENSIONS):
+                    st = item.stat()
+                    record = old_files.get(item.name)
+                    if record is None or record["mtime_ns"] != st.st_mtime_ns or record["size"] != st.st_size:
+                        record = _index_file(item.path, st)
+                    entry["files"][item.name] = record
+            except OSError:
+                continue
+    dirs[directory] = entry
+    for name in entry["subdirs"]:
+        changed = _scan_dir(os.path.join(directory, name), cached, dirs) or changed
+    return changed
+
+
+def _index_file(path: str, st: os.stat_result) -> dict:
+    try:
+        faces = read_font_file(path)
+    except Exception:
+        # 损坏的文件同样记录下来，修改之前不再重复读取
+        faces = []
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "faces": faces}
+
+
+def _load_index_file(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION:
+            return index
+    except (OSError, ValueError):
+        pass
+    return {"version": INDEX_VERSION, "roots": [], "dirs": {}}
+
+
+def _save_index_file(index: dict, path: str) -> None:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"无法保存字体索引 {path}: {e}")
+
+
+def _build_names(index: dict) -> dict:
+    """建立 名称（小写）-> face 记录 的查找表"""
+    names = {}
+    by_family = {}
+    for directory, entry in index["dirs"].items():
+        for filename, record in entry["files"].items():
+            path = os.path.join(directory, filename)
+            stem = os.path.splitext(filename)[0]
+            for face in record["faces"]:
+                info = dict(face, path=path, file=filename)
+                info["name"] = filename if face["index"] == 0 else f"{filename}#{face['index']}"
+                keys = [info["name"], f"{face['family']} {face['style']}".strip()]
+                if face["index"] == 0:
+                    keys.append(stem)
+                for key in keys:
+                    names.setdefault(key.lower(), info)
+                by_family.setdefault(face["family"].lower(), []).append(info)
+    for family, faces in by_family.items():
+        if family and family not in names:
+            regular = [f for f in faces if f["style"].lower() in REGULAR_STYLES]
+            names[family] = (regular or faces)[0]
+    return names
+
+
+def refresh(roots: list = None, index_file: str = None) -> dict:
+    """
+    增量刷新字体索引并保存
+
+    Args:
+        roots: 要扫描的字体目录，默认使用 font_dirs()
+        index_file: 索引缓存文件路径，默认使用 FONT_INDEX_FILE
+
+    Returns:
+        索引数据
+    """
+    global _index, _names
+    roots = font_dirs() if roots is None else [os.path.abspath(r) for r in roots]
+    index_file = index_file or FONT_INDEX_FILE
+    with _lock:
+        index = _index if _index is not None else _load_index_file(index_file)
+        dirs = {}
+        changed = index.get("roots") != roots
+        for root in roots:
+            changed = _scan_dir(root, index["dirs"], dirs) or changed
+        changed = changed or set(dirs) != set(index["dirs"])
+        index = {"version": INDEX_VERSION, "roots": roots, "dirs": dirs}
+        if changed:
+            _save_index_file(index, index_file)
+        _index = index
+        _names = _build_names(index)
+    return index
+
+
+def _get_names() -> dict:
+    if _names is None:
+        refresh()
+    return _names
+
+
+def find_font(name: str):
+    """
+    按名称查找字体（第一次调用时加载并增量刷新索引）
+
+    Args:
+        name: 文件名、去掉扩展名的文件名、字体族名、"字体族 样式" 或 "文件名#face 索引"（不区分大小写）
+
+    Returns:
+        (字体文件路径, face 索引)，未找到时返回 None
+    """
+    info = _get_names().get(str(name).lower())
+    if info is None:
+        return None
+    return info["path"], info["index"]
+
+
+def get_font_info(name: str):
+    """返回字体的完整记录（path、index、family、style、coverage、glyphs、name），未找到时返回 None"""
+    return _get_names().get(str(name).lower())
+
+
+def list_fonts() -> list:
+    """
+    返回索引中的所有 face，按字体族与样式排序
+
+    Returns:
+        [{"name", "family", "style", "path", "index", "glyphs"}, ...]，name 可直接传给 find_font
+    """
+    faces = {id(info): info for info in _get_names().values()}.values()
+    return sorted(
+        ({k: info[k] for k in ("name", "family", "style", "path", "index", "glyphs")} for info in faces),
+        key=lambda f: (f["family"].lower(), f["style"].lower(), f["name"].lower())
+    )
+
+
+def coverage_ranges(path, index: int = 0) -> list:
+    """
+    返回字体 face 覆盖的码位范围
+
+    索引中有该文件时直接使用索引中的记录（文件被修改过则重新解析），否则直接解析文件的 cmap 表。
+
+    Args:
+        path: 字体文件路径
+        index: face 索引
+
+    Returns:
+        [(起始码位, 结束码位), ...]
+
+    Raises:
+        OSError: 文件无法读取
+    """
+    path = os.path.abspath(str(path))
+    if _index is None:
+        refresh()
+    st = os.stat(path)
+    entry = _index["dirs"].get(os.path.dirname(path))
+    record = entry["files"].get(os.path.basename(path)) if entry else None
+    if record is not None and record["mtime_ns"] == st.st_mtime_ns and record["size"] == st.st_size:
+        for face in record["faces"]:
+            if face["index"] == index:
+                flat = face["coverage"]
+                return list(zip(flat[0::2], flat[1::2]))
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        offsets = face_offsets(data)
+        if index >= len(offsets):
+            return []
+        return cmap_ranges(data, offsets[index])
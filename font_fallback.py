@@ -0,0 +1,236 @@
+"""
+按字形覆盖范围回退的字体链
+
+FontChain 把同一字号的主字体与若干回退字体组合在一起：每个字符使用链中第一个包含该字符字形的字体，
+连续使用同一字体的字符组成一段（run），每段用对应的字体测量与绘制。
+
+覆盖检查使用由 cmap 预先生成的位图（每个码位 1 bit，O(1) 查询），每个字符只判断一次；
+文本的分段结果按行缓存，因此换行测量与绘制时同一行文本不会重复分段。
+只有主字体时不需要 FontChain，直接使用字体对象。
+
+FontChain 提供与 FreeTypeFont 相同的 getlength/getbbox/getmetrics，可直接交给 wrap_text；
+绘制时使用 draw_text（或 FontChain.draw），各段按主字体的基线对齐。
+"""
+import sys
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import font_catalog
+
+# 默认回退字体（按顺序尝试，系统中不存在或无法按任意字号加载的字体会被跳过）
+if sys.platform.startswith('win'):
+    DEFAULT_FALLBACK_FONTS = ("Microsoft YaHei", "SimSun", "Segoe UI Symbol", "Segoe UI Emoji")
+elif sys.platform == 'darwin':
+    DEFAULT_FALLBACK_FONTS = ("PingFang SC", "Hiragino Sans GB", "Arial Unicode MS", "Apple Symbols")
+else:
+    DEFAULT_FALLBACK_FONTS = ("Noto Sans CJK SC", "Noto Sans SC", "WenQuanYi Micro Hei", "Droid Sans Fallback",
+                              "Noto Emoji", "Noto Sans Symbols2", "Symbola", "DejaVu Sans")
+
+# 每个字体链缓存的分段结果数
+RUN_CACHE_MAXSIZE = 512
+
+# 包含所有码位的覆盖位图，用于覆盖范围未知、作为最后一级的字体
+FULL_COVERAGE = b"\xff" * (0x110000 >> 3)
+
+_coverage_cache = {}
+_coverage_lock = threading.Lock()
+
+
+def ranges_to_bitset(ranges) -> bytes:
+    """把码位范围转换为位图（0x110000 bit），码位 cp 对应 bitset[cp >> 3] 的第 cp & 7 位"""
+    bits = bytearray(0x110000 >> 3)
+    for start, end in ranges:
+        # 首尾不足一个字节的部分逐位设置，中间整字节填充
+        while start <= end and start & 7:
+            bits[start >> 3] |= 1 << (start & 7)
+            start += 1
+        while end >= start and end & 7 != 7:
+            bits[end >> 3] |= 1 << (end & 7)
+            end -= 1
+        if start <= end:
+            bits[start >> 3:(end >> 3) + 1] = b"\xff" * ((end >> 3) - (start >> 3) + 1)
+    return bytes(bits)
+
+
+def get_coverage(path, index: int = 0) -> bytes:
+    """
+    获取字体 face 的覆盖位图（进程内缓存）
+
+    Raises:
+        OSError: 字体文件无法读取
+    """
+    key = (str(path), index)
+    bits = _coverage_cache.get(key)
+    if bits is None:
+        bits = ranges_to_bitset(font_catalog.coverage_ranges(path, index))
+        with _coverage_lock:
+            _coverage_cache[key] = bits
+    return bits
+
+
+def _inherits_font(char: str) -> bool:
+    # 组合符号、变体选择符、零宽连接符等跟随前一个字符使用的字体
+    return unicodedata.category(char) in ("Mn", "Me", "Cf")
+
+
+class FontChain:
+    """
+    主字体加回退字体的字体链
+
+    Args:
+        fonts: 同一字号的字体对象列表，第一个为主字体
+        coverages: 与 fonts 对应的覆盖位图
+    """
+
+    def __init__(self, fonts: list, coverages: list):
+        self.fonts = list(fonts)
+        self.coverages = list(coverages)
+        self.primary = self.fonts[0]
+        self.size = getattr(self.primary, "size", None)
+        self.ascent = self.primary.getmetrics()[0]
+        self._char_font = {}
+        # 已确认使用主字体的字符，全部由这些字符组成的文本不需要分段
+        self._primary_chars = set()
+        self._runs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def covering_font(self, char: str) -> int:
+        """返回链中第一个包含该字符字形的字体位置，所有字体都不包含时使用主字体（0）"""
+        cp = ord(char)
+        for i, bits in enumerate(self.coverages):
+            if bits[cp >> 3] >> (cp & 7) & 1:
+                return i
+        return 0
+
+    def _covers(self, slot: int, char: str) -> bool:
+        cp = ord(char)
+        return bool(self.coverages[slot][cp >> 3] >> (cp & 7) & 1)
+
+    def _covering_both(self, base: str, mark: str):
+        for i in range(len(self.fonts)):
+            if self._covers(i, base) and self._covers(i, mark):
+                return i
+        return None
+
+    def font_for(self, char: str) -> int:
+        """返回字符使用的字体位置；组合符号等需要跟随前一个字符的字符返回 -1"""
+        slot = self._char_font.get(char)
+        if slot is None:
+            slot = -1 if _inherits_font(char) else self.covering_font(char)
+            self._char_font[char] = slot
+            if slot == 0:
+                self._primary_chars.add(char)
+        return slot
+
+    def segment(self, text: str) -> tuple:
+        """
+        把文本分成使用同一字体的若干段
+
+        Returns:
+            ((字体位置, 文本段), ...)
+        """
+        if self._primary_chars.issuperset(text):
+            return ((0, text),) if text else ()
+        with self._lock:
+            runs = self._runs.get(text)
+            if runs is not None:
+                self._runs.move_to_end(text)
+                return runs
+
+        runs = []
+        current = None
+        start = 0
+        for i, char in enumerate(text):
+            slot = self.font_for(char)
+            if slot < 0:
+                if current is None:
+                    slot = self.covering_font(char)
+                elif self._covers(current, char):
+                    continue
+                else:
+                    # 当前字体缺少该组合符号时，把前一个字符与组合符号一起交给同时包含两者的字体
+                    alt = self._covering_both(text[i - 1], char)
+                    if alt is not None and alt != current:
+                        if i - 1 > start:
+                            runs.append((current, text[start:i - 1]))
+                            start = i - 1
+                        current = alt
+                    continue
+            if current is None:
+                current = slot
+            elif slot != current:
+                runs.append((current, text[start:i]))
+                start = i
+                current = slot
+        if text:
+            runs.append((current, text[start:]))
+        runs = tuple(runs)
+
+        with self._lock:
+            self._runs[text] = runs
+            while len(self._runs) > RUN_CACHE_MAXSIZE:
+                self._runs.popitem(last=False)
+        return runs
+
+    def _single_font(self, text: str):
+        """文本只使用一个字体时返回该字体，否则返回 None"""
+        runs = self.segment(text)
+        if len(runs) <= 1:
+            return self.fonts[runs[0][0]] if runs else self.primary
+        return None
+
+    def getmetrics(self) -> tuple:
+        return self.primary.getmetrics()
+
+    def getlength(self, text: str, *args, **kwargs) -> float:
+        font = self._single_font(text)
+        if font is not None:
+            return font.getlength(text, *args, **kwargs)
+        return sum(self.fonts[slot].getlength(run, *args, **kwargs) for slot, run in self.segment(text))
+
+    def getbbox(self, text: str, *args, **kwargs) -> tuple:
+        """与 FreeTypeFont.getbbox 相同（默认锚点 "la"，即以主字体的上沿为顶部）"""
+        runs = self.segment(text)
+        if len(runs) <= 1 and (not runs or runs[0][0] == 0):
+            return self.primary.getbbox(text, *args, **kwargs)
+        left = top = right = bottom = None
+        pen = 0.0
+        for slot, run in runs:
+            font = self.fonts[slot]
+            l, t, r, b = font.getbbox(run, anchor="ls")
+            l, r = l + pen, r + pen
+            t, b = t + self.ascent, b + self.ascent
+            if left is None:
+                left, top, right, bottom = l, t, r, b
+            else:
+                left, top, right, bottom = min(left, l), min(top, t), max(right, r), max(bottom, b)
+            pen += font.getlength(run)
+        return int(left), int(top), int(right), int(bottom)
+
+    def draw(self, draw, xy: tuple, text: str, fill) -> None:
+        """在 ImageDraw 上绘制文本，各段按主字体的基线对齐"""
+        runs = self.segment(text)
+        if len(runs) <= 1 and (not runs or runs[0][0] == 0):
+            draw.text(xy, text, fill=fill, font=self.primary)
+            return
+        x, y = xy
+        baseline = y + self.ascent
+        for slot, run in runs:
+            font = self.fonts[slot]
+            draw.text((x, baseline), run, fill=fill, font=font, anchor="ls")
+            x += font.getlength(run)
+
+
+def draw_text(draw, xy: tuple, text: str, font, fill) -> None:
+    """绘制文本，font 可以是普通字体对象或 FontChain"""
+    if isinstance(font, FontChain):
+        font.draw(draw, xy, text, fill)
+    else:
+        draw.text(xy, text, fill=fill, font=font)
+
+
+def clear_coverage_cache() -> None:
+    """清空覆盖位图缓存"""
+    with _coverage_lock:
+        _coverage_cache.clear()
@@ -0,0 +1,180 @@
+"""
+无界面渲染模式：从参数或标准输入读取对话文本，把编码后的图片写到标准输出或文件
+
+不需要 root 权限与键盘，可在管道与服务器中使用。默认读取 config.json 中的头像、背景、
+用户名与字体，可用参数覆盖。
+
+单张模式：
+    python headless.py "你好" > out.png
+    echo "你好" | python headless.py -o out.png
+
+打字机动画（--animate apng|webp|gif）：逐字显示的动态图片，只支持单张模式。
+    python headless.py --animate apng --fps 20 "你好" > out.png
+
+流式模式（--stream）：每行输入一条记录（纯文本或 JSONL，格式同 batch.py），
+每条记录输出一帧：4 字节大端无符号长度 + 图片数据。渲染失败时输出长度为 0 的帧，
+错误信息写到标准错误。进程常驻期间字体与底图缓存保持预热。
+    python headless.py --stream --input-format jsonl < records.jsonl > frames.bin
+"""
+import argparse
+import contextlib
+import struct
+import sys
+
+import batch
+import config
+import image_encoder
+import picture_spawner
+import typewriter
+
+FRAME_HEADER = struct.Struct(">I")
+
+
+def render_bytes(record: dict, defaults: dict, img_size: tuple) -> bytes:
+    """
+    渲染一条对话并编码为图片字节
+
+    Args:
+        record: 对话记录（text 以及可选的 username/avatar/background）
+        defaults: batch.load_defaults 返回的默认值
+        img_size: 图片大小 (width, height)
+
+    Returns:
+        编码后的图片字节（流式模式中重复的记录命中成品缓存，不再渲染）
+    """
+    # generate_dialog_image 会打印状态信息，重定向到标准错误以免污染输出的图片数据
+    with contextlib.redirect_stdout(sys.stderr):
+        return batch.render_encoded(record, defaults, img_size)[0]
+
+
+def render_animation(record: dict, defaults: dict, img_size: tuple, fmt: str, fps: float,
+                     chars_per_frame: int, hold_ms: int) -> bytes:
+    """渲染一条对话的打字机动画（见 typewriter.generate_typewriter_animation）"""
+    kwargs = batch.record_to_kwargs(record, defaults, img_size)
+    kwargs.pop("auto_fit")
+    with contextlib.redirect_stdout(sys.stderr):
+        return typewriter.generate_typewriter_animation(
+            fmt=fmt, fps=fps, chars_per_frame=chars_per_frame, hold_ms=hold_ms,
+            quality=defaults.get("quality"), **kwargs
+        )
+
+
+def write_frame(stream, data: bytes) -> None:
+    """写入一帧：长度前缀 + 数据"""
+    stream.write(FRAME_HEADER.pack(len(data)))
+    stream.write(data)
+    stream.flush()
+
+
+def read_frame(stream):
+    """
+    从流中读取一帧，供调用方解析 --stream 的输出
+
+    Returns:
+        帧数据，流结束时返回 None
+    """
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    return stream.read(length)
+
+
+def run_stream(lines, out, defaults: dict, img_size: tuple, fmt: str = "text",
+               speaker_sep: str = None) -> int:
+    """
+    流式渲染：每读到一条记录立即渲染并输出一帧
+
+    Returns:
+        渲染失败的记录数
+    """
+    failures = 0
+    for lineno, line in enumerate(lines, 1):
+        try:
+            record = batch.parse_record(line, fmt, speaker_sep, lineno)
+            if record is None:
+                continue
+            data = render_bytes(record, defaults, img_size)
+        except Exception as e:
+            print(f"第 {lineno} 行渲染失败: {e}", file=sys.stderr)
+            failures += 1
+            data = b""
+        write_frame(out, data)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面渲染对话框图片")
+    parser.add_argument("text", nargs="*", help="对话内容；为空时从标准输入读取")
+    parser.add_argument("-o", "--output", default="-", help="输出文件路径，- 表示标准输出（默认）")
+    parser.add_argument("--stream", action="store_true", help="流式模式：每行一条记录，输出长度前缀帧")
+    parser.add_argument("--input-format", choices=["text", "jsonl"], default="text", help="流式模式的输入格式")
+    parser.add_argument("--speaker-sep", default=None, help="纯文本输入中角色名与对话内容的分隔符")
+    parser.add_argument("--username", default=None, help="覆盖配置中的用户名")
+    parser.add_argument("--avatar", default=None, help="覆盖配置中的头像路径")
+    parser.add_argument("--background", default=None, help="覆盖配置中的背景路径")
+    parser.add_argument("--font", default=None, help="覆盖配置中的字体")
+    parser.add_argument("--size", type=batch.parse_size, default=(900, 300), help="图片尺寸，默认 900x300")
+    parser.add_argument("--profile", choices=list(image_encoder.ENCODE_PROFILES), default=None,
+                        help="输出编码配置（默认读取配置中的 output_encode_profile，否则为 png）")
+    parser.add_argument("--quality", type=int, default=None, help="WebP/JPEG 的质量（1-100）")
+    parser.add_argument("--auto-fit", action="store_true", help="文本放不下对话框时自动缩小字号")
+    parser.add_argument("--break-rules", action="store_true", help="启用断行规则（CJK 行首/行尾禁则、拉丁文按单词换行）")
+    parser.add_argument("--animate", choices=list(typewriter.ANIMATION_FORMATS), default=None,
+                        help="输出打字机效果的动态图片")
+    parser.add_argument("--fps", type=float, default=typewriter.DEFAULT_FPS, help="动画帧率")
+    parser.add_argument("--chars-per-frame", type=int, default=typewriter.DEFAULT_CHARS_PER_FRAME,
+                        help="动画每帧新显示的字数")
+    parser.add_argument("--hold-ms", type=int, default=typewriter.DEFAULT_HOLD_MS,
+                        help="文字全部出现后最后一帧的停留时间（毫秒）")
+    parser.add_argument("--config", default=config.CONFIG_FILE, help="配置文件路径")
+    args = parser.parse_args()
+
+    defaults = batch.load_defaults(args.config)
+    for key, value in (("username", args.username), ("avatar", args.avatar),
+                       ("background", args.background), ("font_name", args.font),
+                       ("encode_profile", args.profile), ("quality", args.quality)):
+        if value is not None:
+            defaults[key] = value
+    if args.auto_fit:
+        defaults["auto_fit"] = True
+    if args.break_rules:
+        defaults["break_rules"] = True
+
+    with contextlib.redirect_stdout(sys.stderr):
+        picture_spawner.preload_fonts(defaults["font_name"], args.size, defaults["fallback_fonts"])
+
+    if args.output == "-":
+        out = sys.stdout.buffer
+        close_out = False
+    else:
+        out = open(args.output, "wb")
+        close_out = True
+
+    try:
+        if args.stream:
+            if args.animate:
+                print("流式模式不支持 --animate。", file=sys.stderr)
+                return 1
+            failures = run_stream(sys.stdin, out, defaults, args.size, args.input_format,
+                                  args.speaker_sep)
+            return 1 if failures else 0
+
+        text = " ".join(args.text) if args.text else sys.stdin.read().rstrip("\n")
+        if not text:
+            print("未提供对话内容。", file=sys.stderr)
+            return 1
+        if args.animate:
+            out.write(render_animation({"text": text}, defaults, args.size, args.animate, args.fps,
+                                       args.chars_per_frame, args.hold_ms))
+        else:
+            out.write(render_bytes({"text": text}, defaults, args.size))
+        out.flush()
+        return 0
+    finally:
+        if close_out:
+            out.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+图片编码配置
+
+把 PIL Image 按指定的编码配置（profile）在内存中编码为图片字节，
+供剪贴板、无界面渲染、批量生成与渲染服务共用。
+"""
+import io
+
+from PIL import Image
+
+# 编码配置：Pillow 格式名、保存参数、文件扩展名，以及可选的调色板颜色数
+ENCODE_PROFILES = {
+    # Pillow 默认参数（compress_level=6）
+    "png": {"format": "PNG", "params": {}, "ext": ".png"},
+    # 低压缩级别，编码更快、文件稍大，适合粘贴到聊天窗口
+    "png-fast": {"format": "PNG", "params": {"compress_level": 1}, "ext": ".png"},
+    # 量化为 256 色调色板，文件最小的 PNG，渐变背景可能出现色带
+    "png-palette": {"format": "PNG", "params": {"compress_level": 6}, "ext": ".png", "colors": 256},
+    # 无损 WebP
+    "webp-lossless": {"format": "WEBP", "params": {"lossless": True, "quality": 30, "method": 2}, "ext": ".webp"},
+    # 有损 WebP
+    "webp": {"format": "WEBP", "params": {"quality": 85, "method": 4}, "ext": ".webp"},
+    # JPEG
+    "jpeg": {"format": "JPEG", "params": {"quality": 90}, "ext": ".jpg"},
+}
+
+DEFAULT_PROFILE = "png"
+
+MIME_TYPES = {
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "JPEG": "image/jpeg",
+}
+
+
+def get_profile(name: str) -> dict:
+    """
+    获取编码配置
+
+    Args:
+        name: 配置名
+
+    Returns:
+        包含 format、params、ext 的字典
+
+    Raises:
+        ValueError: 未知的配置名
+    """
+    profile = ENCODE_PROFILES.get(name)
+    if profile is None:
+        raise ValueError(f"未知的编码配置: {name}（可选: {', '.join(ENCODE_PROFILES)}）")
+    return profile
+
+
+def prepare_image(img: Image.Image, profile: str = DEFAULT_PROFILE) -> Image.Image:
+    """
+    按编码配置转换图片模式（调色板量化、JPEG 去掉透明通道）
+
+    Args:
+        img: PIL Image 对象
+        profile: 编码配置名
+
+    Returns:
+        可直接保存的图片
+    """
+    spec = get_profile(profile)
+    if spec.get("colors"):
+        return img.convert("RGB").quantize(spec["colors"], method=Image.Quantize.FASTOCTREE)
+    if spec["format"] == "JPEG" and img.mode != "RGB":
+        return img.convert("RGB")
+    return img
+
+
+def save_params(profile: str = DEFAULT_PROFILE, quality: int = None) -> dict:
+    """
+    返回编码配置的保存参数
+
+    Args:
+        profile: 编码配置名
+        quality: 覆盖配置中的 quality（仅对含 quality 参数的配置生效）
+    """
+    params = dict(get_profile(profile)["params"])
+    if quality is not None and "quality" in params:
+        params["quality"] = quality
+    return params
+
+
+def encode_image(img: Image.Image, profile: str = DEFAULT_PROFILE, quality: int = None) -> bytes:
+    """
+    按编码配置把图片编码为字节
+
+    Args:
+        img: PIL Image 对象
+        profile: 编码配置名
+        quality: 覆盖配置中的 quality（WebP/JPEG）
+
+    Returns:
+        编码后的图片字节
+    """
+    with io.BytesIO() as output:
+        save_image(img, output, profile, quality)
+        return output.getvalue()
+
+
+def save_image(img: Image.Image, fp, profile: str = DEFAULT_PROFILE, quality: int = None) -> None:
+    """
+    按编码配置把图片保存到文件路径或文件对象
+
+    Args:
+        img: PIL Image 对象
+        fp: 文件路径或文件对象
+        profile: 编码配置名
+        quality: 覆盖配置中的 quality（WebP/JPEG）
+    """
+    spec = get_profile(profile)
+    prepare_image(img, profile).save(fp, format=spec["format"], **save_params(profile, quality))
+
+
+def mime_type(profile: str = DEFAULT_PROFILE) -> str:
+    """返回编码配置对应的 MIME 类型"""
+    return MIME_TYPES[get_profile(profile)["format"]]
+
+
+def file_extension(profile: str = DEFAULT_PROFILE) -> str:
+    """返回编码配置对应的文件扩展名（含点号）"""
+    return get_profile(profile)["ext"]
@@ -0,0 +1,239 @@
+"""
+热键流水线的输入输出后端
+
+把按键模拟、剪贴板文本读取与剪贴板图片写入放在统一接口之后：
+    SystemBackend  真实实现（keyboard、pyperclip、wl-paste/xclip/xsel、wl-copy/xclip/xsel、Win32 剪贴板）
+    FakeBackend    纯内存实现，不需要 root 与桌面环境，用于端到端延迟基准测试
+"""
+import abc
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+
+class IOBackend(abc.ABC):
+    """后端接口，子类必须实现 send_keys、read_clipboard_text 与 write_clipboard_image"""
+
+    @abc.abstractmethod
+    def send_keys(self, combo: str) -> None:
+        """模拟按下组合键，例如 "ctrl+x" """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def read_clipboard_text(self) -> str:
+        """读取剪贴板文本，失败时返回空字符串"""
+        raise NotImplementedError
+
+    def clipboard_change_token(self):
+        """
+        返回表示当前剪贴板状态的标记，剪贴板变化后标记随之变化
+
+        最好是序列号或时间戳，内容相同的两次复制之间也会变化；默认实现返回剪贴板文本，
+        剪切与剪贴板中已有内容相同的文本时检测不到变化，只能等到超时
+        """
+        return self.read_clipboard_text()
+
+    @abc.abstractmethod
+    def write_clipboard_image(self, data: bytes, mime: str) -> bool:
+        """
+        把编码好的图片写入剪贴板
+
+        Args:
+            data: 图片字节（Windows 上为 BMP 文件字节）
+            mime: MIME 类型
+
+        Returns:
+            是否成功
+        """
+        raise NotImplementedError
+
+    def prepare(self, mime: str) -> None:
+        """启动时预先完成耗时的初始化（例如查找剪贴板工具）"""
+
+
+class SystemBackend(IOBackend):
+    """真实的系统后端"""
+
+    def __init__(self):
+        self._commands = {}
+        # 剪贴板文本读取命令与 X11 时间戳命令只在创建时查找一次，轮询时不再检查环境变量与 PATH
+        self._text_command, self._timestamp_command = resolve_clipboard_text_commands()
+
+    def send_keys(self, combo: str) -> None:
+        import keyboard
+        keyboard.send(combo)
+
+    def read_clipboard_text(self) -> str:
+        try:
+            if sys.platform.startswith('win'):
+                import pyperclip
+                return pyperclip.paste()
+            return subprocess.check_output(self._text_command, text=True, stderr=subprocess.DEVNULL).strip()
+        except Exception:
+            return ''
+
+    def clipboard_change_token(self):
+        # Windows 上使用剪贴板序列号，读取无需复制内容
+        if sys.platform.startswith('win'):
+            try:
+                import ctypes
+                return ctypes.windll.user32.GetClipboardSequenceNumber()
+            except Exception:
+                pass
+            return self.read_clipboard_text()
+        # X11 上使用剪贴板所有者取得选区的时间戳（TIMESTAMP 目标），每次复制或剪切都会更新；
+        # 此时文本也通过 xclip 读取（见 resolve_clipboard_text_commands）
+        if self._timestamp_command is not None:
+            try:
+                stamp = subprocess.check_output(self._timestamp_command,
+                                                text=True, stderr=subprocess.DEVNULL, timeout=0.5).strip()
+                if stamp:
+                    return ("timestamp", stamp)
+            except Exception:
+                pass
+        return self.read_clipboard_text()
+
+    def prepare(self, mime: str) -> None:
+        if not sys.platform.startswith('win'):
+            self.get_clipboard_command(mime)
+
+    def get_clipboard_command(self, mime: str = 'image/png'):
+        """返回剪贴板命令，每种 MIME 类型只查找一次"""
+        if mime not in self._commands:
+            self._commands[mime] = resolve_clipboard_command(mime)
+        return self._commands[mime]
+
+    def write_clipboard_image(self, data: bytes, mime: str) -> bool:
+        # 平台区分：Windows 使用 Win32 API，其他平台尝试 wl-copy/xclip/xsel
+        if sys.platform.startswith('win'):
+            # 尝试使用 pywin32 的 win32clipboard
+            try:
+                import win32clipboard
+                import win32con
+
+                # BMP 文件头为 14 字节，DIB 从第 14 字节开始
+                dib = data[14:]
+
+                win32clipboard.OpenClipboard()
+                try:
+                    win32clipboard.EmptyClipboard()
+                    win32clipboard.SetClipboardData(win32con.CF_DIB, dib)
+                finally:
+                    win32clipboard.CloseClipboard()
+                return True
+            except ModuleNotFoundError:
+                print('pywin32 未安装，Windows 上请安装 pywin32 (pip install pywin32) 以启用图片复制到剪贴板')
+                return False
+            except Exception as e:
+                print('复制到 Windows 剪贴板失败:', e)
+                return False
+
+        command = self.get_clipboard_command(mime)
+        if command is None:
+            print('未找到支持图片复制到剪贴板的命令（wl-copy/xclip/xsel）。请安装其中之一以启用此功能。')
+            return False
+        # 直接写入剪贴板工具的标准输入，不经过临时文件
+        res = subprocess.run(command, input=data)
+        return res.returncode == 0
+
+
+def resolve_clipboard_text_commands() -> tuple:
+    """
+    查找读取剪贴板文本的命令（非 Windows 平台）
+
+    X11 会话（设置了 DISPLAY 且没有 WAYLAND_DISPLAY）使用 xclip 或 xsel，其他情况使用 wl-paste。
+
+    Returns:
+        (文本读取命令, X11 时间戳命令)；只有 X11 会话且安装了 xclip 时才有时间戳命令，否则为 None
+    """
+    if os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY"):
+        if shutil.which("xclip"):
+            return (["xclip", "-selection", "clipboard", "-o"],
+                    ["xclip", "-selection", "clipboard", "-o", "-t", "TIMESTAMP"])
+        if shutil.which("xsel"):
+            return ["xsel", "--clipboard", "--output"], None
+    return ["wl-paste"], None
+
+
+def resolve_clipboard_command(mime: str = 'image/png'):
+    """
+    查找可用的剪贴板工具（依次尝试 wl-copy、xclip、xsel）
+
+    Args:
+        mime: 写入剪贴板的 MIME 类型
+
+    Returns:
+        命令参数列表，未找到时返回 None
+    """
+    # 优先尝试 Wayland 的 wl-copy
+    if shutil.which('wl-copy'):
+        return ['wl-copy', '--type', mime]
+    # 尝试 xclip
+    if shutil.which('xclip'):
+        return ['xclip', '-selection', 'clipboard', '-t', mime, '-i']
+    # 尝试 xsel（支持可能有限）
+    if shutil.which('xsel'):
+        return ['xsel', '--clipboard', '--input', '--mime-type', mime]
+    return None
+
+
+class FakeBackend(IOBackend):
+    """
+    内存中的假后端，模拟一个输入框和系统剪贴板
+
+    ctrl+x 把输入框文本剪切到剪贴板（可设置 cut_latency 模拟应用响应延迟），
+    ctrl+v 把剪贴板中的图片“粘贴”出去并记录下来。
+    """
+
+    def __init__(self, input_text: str = "", cut_latency: float = 0.0):
+        self.input_text = input_text
+        self.cut_latency = cut_latency
+        self.clipboard_text = ""
+        self.clipboard_image = None
+        self.clipboard_mime = None
+        self.sequence = 0
+        self.keys = []
+        self.pasted = []
+        self._lock = threading.Lock()
+
+    def set_input(self, text: str) -> None:
+        """设置输入框中的文本"""
+        with self._lock:
+            self.input_text = text
+
+    def _cut(self) -> None:
+        with self._lock:
+            self.clipboard_text = self.input_text
+            self.clipboard_image = None
+            self.input_text = ""
+            self.sequence += 1
+
+    def send_keys(self, combo: str) -> None:
+        self.keys.append(combo)
+        if combo == 'ctrl+x':
+            if self.cut_latency > 0:
+                threading.Timer(self.cut_latency, self._cut).start()
+            else:
+                self._cut()
+        elif combo == 'ctrl+v':
+            with self._lock:
+                self.pasted.append((time.perf_counter(), self.clipboard_mime, self.clipboard_image))
+
+    def read_clipboard_text(self) -> str:
+        with self._lock:
+            return self.clipboard_text
+
+    def clipboard_change_token(self):
+        with self._lock:
+            return self.sequence
+
+    def write_clipboard_image(self, data: bytes, mime: str) -> bool:
+        with self._lock:
+            self.clipboard_image = data
+            self.clipboard_mime = mime
+            self.clipboard_text = ""
+            self.sequence += 1
+        return True
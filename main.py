@@ -1,16 +1,22 @@
 from PIL import Image
 import keyboard
-import pyperclip
-from pathlib import Path
 import time
-import subprocess
+import collections
+import statistics
 import tempfile
-import shutil
 import sys
 import io
+import threading
 import os
 import config
+import image_encoder
+import io_backends
 import picture_spawner
+import profiles
+import render_cache
+import render_server
+import tracing
+import typewriter
 
 # 全局热键变量
 CONFIG_FILE = os.path.join(os.path.expanduser('~'), 'ADVTextSpawner', 'config.json')
@@ -18,6 +24,50 @@ AVATAR_FILE = "avatar.png"
 BACKGROUND_FILE = "background.png"
 USERNAME = "匿名"
 WANT_AUTO_SEND = 0
+FONT_NAME = "STKAITI.TTF"
+# 回退字体列表（config.json 的 fallback_fonts），None 时使用 picture_spawner.FALLBACK_FONTS
+FALLBACK_FONTS = None
+# 文本放不下对话框时是否自动缩小字号（config.json 的 auto_fit_text）
+AUTO_FIT = False
+# 放不下一个对话框的文本是否分成多页粘贴（config.json 的 paginate_long_text）
+PAGINATE = False
+# 是否启用断行规则：CJK 行首/行尾禁则、拉丁文按单词换行（config.json 的 line_break_rules）
+BREAK_RULES = False
+# 打字机动画格式（config.json 的 typewriter_format：apng、webp、gif，为空时输出静态图片；Windows 剪贴板不支持动画）
+TYPEWRITER_FORMAT = None
+# 打字机动画的帧率与每帧新显示的字数（config.json 的 typewriter_fps、typewriter_chars_per_frame）
+TYPEWRITER_FPS = typewriter.DEFAULT_FPS
+TYPEWRITER_CHARS_PER_FRAME = typewriter.DEFAULT_CHARS_PER_FRAME
+IMG_SIZE = (900, 300)
+# 复制到剪贴板时使用的编码配置（见 image_encoder.ENCODE_PROFILES）
+CLIPBOARD_PROFILE = "png-fast"
+# 成品图片缓存：相同的对话内容与配置直接使用缓存的编码结果（config.json 的 render_cache_mb、
+# render_cache_dir、render_cache_disk_mb）
+RENDER_CACHE = render_cache.RenderCache()
+# 按键与剪贴板后端
+BACKEND = io_backends.SystemBackend()
+# 粘贴后等待目标应用读取剪贴板的时间（秒）
+PASTE_DELAY = 0.1
+# 最近一次热键流水线各阶段耗时（秒）：capture、render、encode、clipboard、paste、total
+LAST_TIMINGS = {}
+# 剪切后等待剪贴板变化的超时时间与轮询间隔（秒）
+CLIPBOARD_TIMEOUT = 1.0
+CLIPBOARD_POLL_MIN = 0.01
+CLIPBOARD_POLL_MAX = 0.05
+# 最近几次剪切到剪贴板变化的实测延迟
+_clipboard_wait_samples = collections.deque(maxlen=20)
+# 常驻渲染服务地址（Unix 套接字路径或 host:port），为 None 时在本进程渲染
+RENDER_SERVER = None
+_render_client = None
+# 角色列表（见 profiles），每个角色一个热键；按下热键时切换到对应角色再生成图片
+PROFILES = []
+ACTIVE_PROFILE = None
+# 所有角色共用的素材缓存上限（config.json 的 profile_cache_mb），None 时使用 picture_spawner 的默认值
+PROFILE_CACHE_BYTES = None
+# 与角色相关的配置项的当前值，用于在任意一项变化时重新生成角色列表
+_profile_config = {}
+# 已注册的热键 {热键: keyboard 返回的句柄}
+_hotkey_handles = {}
 global HOTKEY
 HOTKEY = "f1"
 
@@ -27,104 +77,294 @@ FONTS_LIST = [
 
 ]
 
+def set_backend(backend: io_backends.IOBackend) -> None:
+    """替换按键与剪贴板后端（例如基准测试时使用 io_backends.FakeBackend）"""
+    global BACKEND
+    BACKEND = backend
+
+
+def clipboard_format() -> tuple:
+    """
+    返回写入剪贴板的编码格式
+
+    Returns:
+        (编码配置名, MIME 类型, 文件扩展名)；Windows 上为 BMP
+    """
+    if sys.platform.startswith('win'):
+        return 'bmp', 'image/bmp', '.bmp'
+    return CLIPBOARD_PROFILE, image_encoder.mime_type(CLIPBOARD_PROFILE), image_encoder.file_extension(CLIPBOARD_PROFILE)
+
+
+def encode_for_clipboard(img: Image.Image) -> tuple:
+    """
+    把图片编码为写入剪贴板的格式
+
+    Returns:
+        (图片字节, MIME 类型)
+    """
+    if sys.platform.startswith('win'):
+        # Windows 剪贴板使用 DIB，由后端去掉 BMP 的 14 字节文件头
+        with io.BytesIO() as output:
+            img.convert('RGB').save(output, 'BMP')
+            return output.getvalue(), 'image/bmp'
+    return image_encoder.encode_image(img, CLIPBOARD_PROFILE), image_encoder.mime_type(CLIPBOARD_PROFILE)
+
+
+def _encode_timed(img: Image.Image) -> tuple:
+    """编码图片并记录耗时，返回 (图片字节, MIME 类型)"""
+    t0 = time.perf_counter()
+    with tracing.span("hotkey.encode"):
+        img_bytes, mime = encode_for_clipboard(img)
+    LAST_TIMINGS["encode"] = time.perf_counter() - t0
+    print(f'    编码 {LAST_TIMINGS["encode"] * 1000:.1f} ms（{mime}，{len(img_bytes)} 字节）')
+    return img_bytes, mime
+
+
+def copy_bytes_to_clipboard(img_bytes: bytes, mime: str) -> bool:
+    """把编码好的图片字节写入剪贴板，返回是否成功"""
+    t0 = time.perf_counter()
+    with tracing.span("hotkey.clipboard_write"):
+        ok = BACKEND.write_clipboard_image(img_bytes, mime)
+    LAST_TIMINGS["clipboard"] = time.perf_counter() - t0
+    print(f'    写入剪贴板 {LAST_TIMINGS["clipboard"] * 1000:.1f} ms')
+    return ok
+
+
 def copy_image_to_clipboard(img: Image.Image) -> bool:
     """
-    把 PIL Image 拷贝到系统剪贴板（尝试 wl-copy、xclip、xsel），
+    把 PIL Image 拷贝到系统剪贴板（Windows 使用 Win32 API，其他平台尝试 wl-copy、xclip、xsel），
     返回是否成功（True/False）。
     """
-    # 平台区分：Windows 使用 Win32 API，其他平台尝试 wl-copy/xclip/xsel
-    if sys.platform.startswith('win'):
-        # 尝试使用 pywin32 的 win32clipboard
+    # 在内存中编码后直接交给剪贴板后端，不经过临时文件
+    return copy_bytes_to_clipboard(*_encode_timed(img))
+
+
+def read_clipboard_text() -> str:
+    """读取剪贴板文本，失败时返回空字符串"""
+    return BACKEND.read_clipboard_text()
+
+
+def clipboard_change_token():
+    """返回表示当前剪贴板状态的标记（见 io_backends.IOBackend.clipboard_change_token）"""
+    return BACKEND.clipboard_change_token()
+
+
+def wait_for_clipboard_change(token, timeout: float = None) -> str:
+    """
+    等待剪贴板相对 token 发生变化并返回新的文本
+
+    先立即检查一次，之后第一次等待最近几次实测延迟中位数的一半，再以指数退避轮询，
+    检测到新文本立即返回。超时仍未变化时返回当前剪贴板文本（选中的文本可能与剪切前相同）。
+
+    Args:
+        token: clipboard_change_token 的返回值
+        timeout: 超时时间（秒），默认使用 CLIPBOARD_TIMEOUT
+
+    Returns:
+        剪贴板文本，读取失败时为空字符串
+    """
+    timeout = CLIPBOARD_TIMEOUT if timeout is None else timeout
+    start = time.perf_counter()
+    deadline = start + timeout
+    if _clipboard_wait_samples:
+        delay = max(CLIPBOARD_POLL_MIN, statistics.median(_clipboard_wait_samples) / 2)
+    else:
+        delay = CLIPBOARD_POLL_MIN
+    while True:
+        current = clipboard_change_token()
+        if current != token:
+            text = current if isinstance(current, str) else read_clipboard_text()
+            if text:
+                elapsed = time.perf_counter() - start
+                _clipboard_wait_samples.append(elapsed)
+                print(f'    剪贴板等待 {elapsed * 1000:.0f} ms'
+                      f'（中位数 {statistics.median(_clipboard_wait_samples) * 1000:.0f} ms）')
+                return text
+        if time.perf_counter() >= deadline:
+            print(f'    等待剪贴板变化超时（{timeout:.1f} s）')
+            return read_clipboard_text()
+        time.sleep(max(0.0, min(delay, deadline - time.perf_counter())))
+        delay = min(delay * 2, CLIPBOARD_POLL_MAX)
+
+
+def render_dialog(dialog_text: str) -> tuple:
+    """
+    生成对话图片：配置了渲染服务时优先请求服务，服务不可用则回退到本地渲染
+
+    渲染服务直接按剪贴板的编码配置编码，返回的字节不再解码与重新编码
+    （Windows 剪贴板使用 BMP，服务端不支持，仍解码后在本地转换）。
+
+    Returns:
+        (图片, 剪贴板格式的图片字节)：使用渲染服务时图片为 None，本地渲染时字节为 None
+    """
+    global _render_client
+    kwargs = render_kwargs(dialog_text)
+    if RENDER_SERVER:
+        profile = clipboard_format()[0]
+        direct = profile in image_encoder.ENCODE_PROFILES
         try:
-            import win32clipboard
-            import win32con
-
-            # 将 PIL Image 转为 DIB（BMP 的除文件头外部分）
-            with io.BytesIO() as output:
-                # Pillow 保存 BMP 会包含 14 字节的文件头，需要去掉
-                img.convert('RGB').save(output, 'BMP')
-                data = output.getvalue()
-            # BMP 文件头为 14 字节，DIB 从第 14 字节开始
-            dib = data[14:]
-
-            win32clipboard.OpenClipboard()
-            try:
-                win32clipboard.EmptyClipboard()
-                win32clipboard.SetClipboardData(win32con.CF_DIB, dib)
-            finally:
-                win32clipboard.CloseClipboard()
-            return True
-        except ModuleNotFoundError:
-            print('pywin32 未安装，Windows 上请安装 pywin32 (pip install pywin32) 以启用图片复制到剪贴板')
-            return False
+            if _render_client is None:
+                _render_client = render_server.RenderClient(RENDER_SERVER)
+            data = _render_client.render(
+                dialog_text,
+                avatar=AVATAR_FILE,
+                background=BACKGROUND_FILE,
+                username=USERNAME,
+                font=FONT_NAME,
+                fallback_fonts=FALLBACK_FONTS,
+                auto_fit=AUTO_FIT or None,
+                break_rules=BREAK_RULES or None,
+                size=list(IMG_SIZE),
+                profile=profile if direct else "png-fast"
+            )
+            if direct:
+                return None, data
+            return Image.open(io.BytesIO(data)), None
         except Exception as e:
-            print('复制到 Windows 剪贴板失败:', e)
-            return False
+            print('渲染服务不可用，改为本地渲染:', e)
+
+    return picture_spawner.generate_dialog_image(output_path=None, **kwargs), None
+
+
+def render_kwargs(dialog_text: str) -> dict:
+    """当前配置下 generate_dialog_image 的参数"""
+    return {
+        "avatar_path": AVATAR_FILE,
+        "background_path": BACKGROUND_FILE,
+        "username": USERNAME,
+        "dialog_text": dialog_text,
+        "font_index": FONT_NAME,
+        "img_size": IMG_SIZE,
+        "fallback_fonts": FALLBACK_FONTS,
+        "auto_fit": AUTO_FIT,
+        "break_rules": BREAK_RULES,
+    }
+
+
+def clipboard_cache_key(dialog_text: str) -> str:
+    """剪贴板图片在成品缓存中的键（见 render_cache.make_key）"""
+    return render_cache.make_key(render_kwargs(dialog_text), clipboard_format()[0])
+
+
+def render_dialog_pages(dialog_text: str):
+    """
+    分页生成对话图片，返回逐页生成图片的迭代器（见 picture_spawner.generate_dialog_pages）
+
+    分页需要在本进程换行，因此总是本地渲染；渲染服务只用于单页模式。
+    """
+    return picture_spawner.generate_dialog_pages(
+        avatar_path=AVATAR_FILE,
+        background_path=BACKGROUND_FILE,
+        username=USERNAME,
+        dialog_text=dialog_text,
+        font_index=FONT_NAME,
+        img_size=IMG_SIZE,
+        fallback_fonts=FALLBACK_FONTS,
+        break_rules=BREAK_RULES
+    )
+
+
+def animation_enabled() -> bool:
+    """是否以打字机动画代替静态图片（Windows 剪贴板只支持位图）"""
+    return bool(TYPEWRITER_FORMAT) and not sys.platform.startswith('win')
+
+
+def animation_cache_key(dialog_text: str) -> str:
+    """打字机动画在成品缓存中的键"""
+    profile = f"typewriter:{TYPEWRITER_FORMAT}:{TYPEWRITER_FPS}:{TYPEWRITER_CHARS_PER_FRAME}"
+    return render_cache.make_key(render_kwargs(dialog_text), profile)
+
+
+def render_animation(dialog_text: str) -> bytes:
+    """在本进程生成打字机动画（见 typewriter.generate_typewriter_animation）"""
+    kwargs = render_kwargs(dialog_text)
+    kwargs.pop("auto_fit")
+    return typewriter.generate_typewriter_animation(
+        fmt=TYPEWRITER_FORMAT, fps=TYPEWRITER_FPS, chars_per_frame=TYPEWRITER_CHARS_PER_FRAME, **kwargs
+    )
+
+
+def paste_image(img: Image.Image) -> bytes:
+    """
+    编码图片、放入剪贴板并粘贴，开启自动发送时再按下回车
+
+    Returns:
+        编码后的图片字节
+    """
+    img_bytes, mime = _encode_timed(img)
+    paste_bytes(img_bytes, mime)
+    return img_bytes
+
+
+def paste_bytes(img_bytes: bytes, mime: str) -> None:
+    """把编码好的图片放入剪贴板并粘贴，开启自动发送时再按下回车"""
+    ok = copy_bytes_to_clipboard(img_bytes, mime)
+    if ok:
+        print('已将生成的图片放入剪贴板。')
     else:
-        # 首先把图片写入临时 PNG
-        tmp_path = None
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tf:
-                tmp_path = tf.name
-                img.save(tmp_path, format='PNG')
-                tf.flush()
-
-            with open(tmp_path, 'rb') as f:
-                img_bytes = f.read()
-
-            # 优先尝试 Wayland 的 wl-copy
-            if shutil.which('wl-copy'):
-                res = subprocess.run(['wl-copy', '--type', 'image/png'], input=img_bytes)
-                return res.returncode == 0
-
-            # 尝试 xclip
-            if shutil.which('xclip'):
-                res = subprocess.run(['xclip', '-selection', 'clipboard', '-t', 'image/png', '-i'], input=img_bytes)
-                return res.returncode == 0
-
-            # 尝试 xsel（支持可能有限）
-            if shutil.which('xsel'):
-                res = subprocess.run(['xsel', '--clipboard', '--input', '--mime-type', 'image/png'], input=img_bytes)
-                return res.returncode == 0
-
-            print('未找到支持图片复制到剪贴板的命令（wl-copy/xclip/xsel）。请安装其中之一以启用此功能。')
-            return False
-        finally:
-            try:
-                if tmp_path:
-                    Path(tmp_path).unlink()
-            except Exception:
-                pass
+        # 仍然把图片保存到临时文件供用户手动使用
+        with tempfile.NamedTemporaryFile(delete=False, suffix=clipboard_format()[2]) as tmp:
+            tmp.write(img_bytes)
+        print(f'无法直接复制图片到剪贴板，已将图片保存为: {tmp.name}')
+
+    t_paste = time.perf_counter()
+    with tracing.span("hotkey.paste"):
+        BACKEND.send_keys('ctrl+v')
+        time.sleep(PASTE_DELAY)
+        if (WANT_AUTO_SEND != 0):
+            BACKEND.send_keys('enter')
+    LAST_TIMINGS["paste"] = time.perf_counter() - t_paste
 
 
-def on_hotkey_pressed():
+def use_profile(profile: profiles.Profile) -> None:
+    """切换到指定角色：之后的渲染使用该角色的头像、背景、用户名、字体与图片尺寸"""
+    global ACTIVE_PROFILE, AVATAR_FILE, BACKGROUND_FILE, USERNAME, FONT_NAME, FALLBACK_FONTS, IMG_SIZE
+    if ACTIVE_PROFILE is not None and profile.name != ACTIVE_PROFILE.name:
+        print(f'切换角色: {profile.name}')
+    ACTIVE_PROFILE = profile
+    AVATAR_FILE = profile.avatar_path
+    BACKGROUND_FILE = profile.background_path
+    USERNAME = profile.username
+    FONT_NAME = profile.font_name
+    FALLBACK_FONTS = profile.fallback_fonts
+    IMG_SIZE = profile.img_size
+
+
+def on_hotkey_pressed(profile: profiles.Profile = None):
     """
     热键触发的回调：选中当前输入框内容（发送 Ctrl+A/Ctrl+C）、读取剪贴板文本，
     生成对话图片，并把图片放入剪贴板。
+
+    Args:
+        profile: 热键对应的角色，None 时使用当前配置
     """
+    if profile is not None:
+        use_profile(profile)
+    with tracing.span("hotkey.total"):
+        _run_hotkey_pipeline()
+
+
+def _run_hotkey_pipeline():
+    """热键流水线本体，各阶段耗时记录到 LAST_TIMINGS 与 tracing"""
+    timings = LAST_TIMINGS
+    timings.clear()
+    t_start = time.perf_counter()
     try:
-        # 备份当前剪贴板文本（以便用户需要时可恢复）
-        try:
-            previous_clip = pyperclip.paste()
-        except Exception:
-            previous_clip = None
+        # 剪切前记录剪贴板状态，剪切后等待剪贴板变化
+        token = clipboard_change_token()
 
         # 发送全选与复制（Linux 使用 ctrl）
-        keyboard.send('ctrl+a')
-        #time.sleep(0.06)
-        keyboard.send('ctrl+x')
-        time.sleep(0.5)
-        # keyboard.send('backspace')
+        with tracing.span("hotkey.keys"):
+            BACKEND.send_keys('ctrl+a')
+            #time.sleep(0.06)
+            BACKEND.send_keys('ctrl+x')
+            # keyboard.send('backspace')
 
         # 读取剪贴板文本作为对话内容
-        dialog_text = ''
-        try:
-            if sys.platform.startswith('win'):
-                dialog_text = pyperclip.paste()
-            else:
-                dialog_text = subprocess.check_output(["wl-paste"], text=True).strip()
-        except Exception:
-            dialog_text = ''
+        with tracing.span("hotkey.clipboard_wait"):
+            dialog_text = wait_for_clipboard_change(token)
+        t_captured = time.perf_counter()
+        timings["capture"] = t_captured - t_start
 
         if not dialog_text:
             print('未检测到剪贴板文本，取消生成。')
@@ -132,70 +372,366 @@ def on_hotkey_pressed():
 
         print('检测到文本，正在生成图片...')
         
-        img = picture_spawner.generate_dialog_image(
-            avatar_path=AVATAR_FILE,
-            background_path=BACKGROUND_FILE,
-            username=USERNAME,
-            dialog_text=dialog_text,
-            font_index='STKAITI.TTF',
-            img_size=(900, 300),
-            output_path=None
-        )
+        animate = animation_enabled()
+        mime = typewriter.ANIMATION_FORMATS[TYPEWRITER_FORMAT][0] if animate else clipboard_format()[1]
 
-        ok = copy_image_to_clipboard(img)
-        if ok:
-            print('已将生成的图片放入剪贴板。')
+        # 成品缓存命中时跳过渲染与编码（分页模式逐页生成，不使用成品缓存）
+        if animate:
+            cache_key = animation_cache_key(dialog_text)
         else:
-            # 仍然把图片保存到临时文件供用户手动使用
-            tmp = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-            img.save(tmp.name, format='PNG')
-            print(f'无法直接复制图片到剪贴板，已将图片保存为: {tmp.name}')
-        
-        keyboard.send('ctrl+v')
-        time.sleep(0.1)
-        if (WANT_AUTO_SEND != 0):
-            keyboard.send('enter')
+            cache_key = None if PAGINATE else clipboard_cache_key(dialog_text)
+        cached = RENDER_CACHE.get(cache_key) if cache_key else None
+        if cached is not None:
+            print('命中成品缓存，跳过渲染与编码。')
+            timings["render"] = time.perf_counter() - t_captured
+            timings["encode"] = 0.0
+            paste_bytes(cached, mime)
+            timings["total"] = time.perf_counter() - t_start
+            return
+
+        if animate:
+            # 动画的绘制与编码交错进行，耗时全部计入 render
+            with tracing.span("hotkey.render"):
+                img_bytes = render_animation(dialog_text)
+            timings["render"] = time.perf_counter() - t_captured
+            timings["encode"] = 0.0
+            paste_bytes(img_bytes, mime)
+            timings["total"] = time.perf_counter() - t_start
+            RENDER_CACHE.put(cache_key, img_bytes)
+            return
+
+        # 分页模式下先只绘制第一页，其余页面在第一页粘贴之后逐页绘制并粘贴
+        pages = render_dialog_pages(dialog_text) if PAGINATE else None
+        with tracing.span("hotkey.render"):
+            img, img_bytes = (next(pages), None) if pages is not None else render_dialog(dialog_text)
+        t_rendered = time.perf_counter()
+        timings["render"] = t_rendered - t_captured
+
+        if img_bytes is None:
+            img_bytes = paste_image(img)
+        else:
+            # 渲染服务已按剪贴板格式编码
+            timings["encode"] = 0.0
+            paste_bytes(img_bytes, clipboard_format()[1])
+        timings["total"] = time.perf_counter() - t_start
+        if cache_key:
+            RENDER_CACHE.put(cache_key, img_bytes)
+
+        if pages is not None:
+            # LAST_TIMINGS 只记录第一页（用户实际等待的延迟）
+            first_page = dict(timings)
+            for number, img in enumerate(pages, 2):
+                print(f'正在粘贴第 {number} 页...')
+                paste_image(img)
+            timings.clear()
+            timings.update(first_page)
 
     except Exception as e:
         print('热键回调发生错误:', e)
 
 
+class HotkeyWorker:
+    """
+    串行执行热键流水线的工作线程
+
+    键盘钩子的回调只调用 submit 放入任务，剪切、渲染、编码、粘贴都在工作线程中按顺序执行，
+    不会阻塞键盘钩子，也不会有两条流水线同时操作剪贴板。任务执行期间再次按下热键时按策略处理：
+        drop      丢弃（默认）：已有任务在执行或排队时忽略新的按键
+        coalesce  合并：最多保留一个排队任务，后续按键合并到这个任务（使用最后一次按键的参数，例如角色）
+        queue     排队：每次按键都执行一次，排队数超过上限时丢弃
+    """
+
+    POLICIES = ("drop", "coalesce", "queue")
+
+    def __init__(self, job, policy: str = "drop", max_queue: int = 4):
+        self.job = job
+        self.policy = policy if policy in self.POLICIES else "drop"
+        self.max_queue = max_queue
+        # 排队任务的参数，每项是传给 job 的参数元组
+        self._jobs = collections.deque()
+        self.busy = False
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="hotkey-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._jobs)
+
+    def submit(self, *args) -> bool:
+        """
+        放入一次按键任务，不阻塞
+
+        Args:
+            args: 传给 job 的参数
+
+        Returns:
+            是否产生了新的排队任务（被丢弃或合并时为 False）
+        """
+        with self._cond:
+            self.submitted += 1
+            if self.policy == "drop" and (self.busy or self.pending):
+                self.dropped += 1
+                print('上一次生成尚未完成，忽略本次按键。')
+                return False
+            if self.policy == "coalesce" and self.pending:
+                self.coalesced += 1
+                self._jobs[-1] = args
+                return False
+            if self.policy == "queue" and self.pending >= self.max_queue:
+                self.dropped += 1
+                print('排队的按键过多，忽略本次按键。')
+                return False
+            self._jobs.append(args)
+            self._cond.notify()
+            return True
+
+    def stats(self) -> dict:
+        """返回队列深度与丢弃、合并计数"""
+        with self._cond:
+            return {
+                "policy": self.policy,
+                "queue_depth": self.pending,
+                "busy": self.busy,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+            }
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self.pending:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                args = self._jobs.popleft()
+                self.busy = True
+            try:
+                self.job(*args)
+            except Exception as e:
+                # 任务抛出的异常不能结束工作线程，否则之后的按键都会被丢弃
+                print('热键任务发生错误:', e)
+            finally:
+                with self._cond:
+                    self.busy = False
+                    self.completed += 1
+
+
+_hotkey_worker = HotkeyWorker(on_hotkey_pressed)
+
+
+def enqueue_hotkey_press(profile: profiles.Profile = None) -> None:
+    """键盘钩子回调：只把任务（及热键对应的角色）交给工作线程"""
+    _hotkey_worker.submit(profile)
+
+
+def get_hotkey_stats() -> dict:
+    """返回热键流水线的队列统计"""
+    return _hotkey_worker.stats()
+
+
+def register_hotkeys(profile_list: list) -> bool:
+    """
+    为每个角色注册热键，已注册的旧热键会先被移除
+
+    Returns:
+        是否全部注册成功
+    """
+    for handle in _hotkey_handles.values():
+        try:
+            keyboard.remove_hotkey(handle)
+        except (KeyError, ValueError):
+            pass
+    _hotkey_handles.clear()
+    ok = True
+    for profile in profile_list:
+        print(f'注册热键: {profile.hotkey} → {profile.name}（按下时会复制当前输入框内容并生成图片）')
+        try:
+            _hotkey_handles[profile.hotkey] = keyboard.add_hotkey(profile.hotkey, enqueue_hotkey_press,
+                                                                  args=(profile,))
+        except Exception as e:
+            print('无法注册热键，请检查权限或 hotkey 字符串是否有效:', e)
+            ok = False
+    return ok
+
+
+def reload_profiles(initial: bool = False) -> None:
+    """按当前配置重新生成角色列表，重新注册热键并预热各角色的字体与素材"""
+    global PROFILES
+    PROFILES = profiles.load_profiles(_profile_config)
+    if not PROFILES:
+        print('没有可用的角色配置。')
+        return
+    # 当前角色被删除或修改时切换到第一个角色
+    current = next((p for p in PROFILES if ACTIVE_PROFILE and p.name == ACTIVE_PROFILE.name), PROFILES[0])
+    use_profile(current)
+    if not initial:
+        register_hotkeys(PROFILES)
+        if not RENDER_SERVER:
+            profiles.preload_profiles(PROFILES, PROFILE_CACHE_BYTES)
+
+
+def apply_config(changed: dict, initial: bool = False) -> None:
+    """
+    把配置项应用到运行中的服务，只重建受影响的部分
+
+    Args:
+        changed: 变化的配置项 {键: 新值}
+        initial: 是否为启动时的首次加载（此时热键由 start_hotkey_listener 注册）
+    """
+    global HOTKEY, PROFILE_CACHE_BYTES, AVATAR_FILE, BACKGROUND_FILE, USERNAME, WANT_AUTO_SEND
+    global FONT_NAME, FALLBACK_FONTS, AUTO_FIT, PAGINATE, BREAK_RULES, RENDER_SERVER, TYPEWRITER_FORMAT, TYPEWRITER_FPS, TYPEWRITER_CHARS_PER_FRAME, CLIPBOARD_PROFILE, CLIPBOARD_TIMEOUT, _render_client
+
+    if "avatar_image_path" in changed:
+        AVATAR_FILE = changed["avatar_image_path"]
+    if "background_image_path" in changed:
+        BACKGROUND_FILE = changed["background_image_path"]
+    if "username" in changed:
+        USERNAME = changed["username"]
+    if "want_auto_send" in changed:
+        WANT_AUTO_SEND = changed["want_auto_send"] or 0
+    # 头像、背景与用户名变化后底图缓存的键随之变化，下次渲染时自动重建
+    if "asset_cache_dir" in changed:
+        picture_spawner.ASSET_DISK_CACHE_DIR = changed["asset_cache_dir"] or None
+    if "asset_cache_max_mb" in changed and changed["asset_cache_max_mb"]:
+        picture_spawner.ASSET_DISK_CACHE_MAX_BYTES = int(float(changed["asset_cache_max_mb"]) * 2 ** 20)
+    if "render_server" in changed:
+        RENDER_SERVER = changed["render_server"]
+        if _render_client is not None:
+            _render_client.close()
+            _render_client = None
+    if "fallback_fonts" in changed:
+        FALLBACK_FONTS = changed["fallback_fonts"]
+    if "font_name" in changed:
+        FONT_NAME = changed["font_name"] or FONT_NAME
+    if "auto_fit_text" in changed:
+        AUTO_FIT = bool(changed["auto_fit_text"])
+    if "paginate_long_text" in changed:
+        PAGINATE = bool(changed["paginate_long_text"])
+    if "line_break_rules" in changed:
+        BREAK_RULES = bool(changed["line_break_rules"])
+    if "typewriter_format" in changed:
+        fmt = changed["typewriter_format"] or None
+        if fmt is not None and fmt not in typewriter.ANIMATION_FORMATS:
+            print('不支持的动画格式，输出静态图片:', fmt)
+            fmt = None
+        TYPEWRITER_FORMAT = fmt
+        if fmt and not initial:
+            BACKEND.prepare(typewriter.ANIMATION_FORMATS[fmt][0])
+    if "typewriter_fps" in changed and changed["typewriter_fps"]:
+        TYPEWRITER_FPS = float(changed["typewriter_fps"])
+    if "typewriter_chars_per_frame" in changed and changed["typewriter_chars_per_frame"]:
+        TYPEWRITER_CHARS_PER_FRAME = int(changed["typewriter_chars_per_frame"])
+    if "render_cache_mb" in changed and changed["render_cache_mb"] is not None:
+        RENDER_CACHE.max_bytes = int(float(changed["render_cache_mb"]) * 2 ** 20)
+    if "render_cache_dir" in changed:
+        RENDER_CACHE.disk_dir = changed["render_cache_dir"] or None
+    if "render_cache_disk_mb" in changed and changed["render_cache_disk_mb"]:
+        RENDER_CACHE.disk_max_bytes = int(float(changed["render_cache_disk_mb"]) * 2 ** 20)
+    if "clipboard_encode_profile" in changed:
+        profile = changed["clipboard_encode_profile"] or CLIPBOARD_PROFILE
+        if profile not in image_encoder.ENCODE_PROFILES:
+            print(f'未知的编码配置，保持 {CLIPBOARD_PROFILE}:', profile)
+        else:
+            CLIPBOARD_PROFILE = profile
+            # 编码格式变化时 MIME 类型可能变化，预先查找对应的剪贴板命令
+            if not initial:
+                BACKEND.prepare(image_encoder.mime_type(CLIPBOARD_PROFILE))
+    if "clipboard_timeout" in changed and changed["clipboard_timeout"]:
+        CLIPBOARD_TIMEOUT = float(changed["clipboard_timeout"])
+    if "hotkey_coalesce" in changed:
+        policy = changed["hotkey_coalesce"]
+        _hotkey_worker.policy = policy if policy in HotkeyWorker.POLICIES else "drop"
+    if "trace_enabled" in changed or "trace_file" in changed:
+        try:
+            tracing.configure(enabled=changed.get("trace_enabled", tracing.ENABLED),
+                              trace_file=(changed["trace_file"] or "") if "trace_file" in changed else None)
+        except OSError as e:
+            print('无法打开追踪文件:', e)
+    if "hotkey" in changed and changed["hotkey"]:
+        HOTKEY = changed["hotkey"]
+    if "profile_cache_mb" in changed and changed["profile_cache_mb"]:
+        PROFILE_CACHE_BYTES = int(float(changed["profile_cache_mb"]) * 2 ** 20)
+        # 立即生效：超出新上限的素材在下次加载素材时淘汰
+        picture_spawner.ASSET_CACHE_MAX_BYTES = PROFILE_CACHE_BYTES
+    # 角色从顶层配置继承未设置的项，任意一项变化都重新生成角色列表、注册热键并预热
+    if any(key in changed for key in profiles.CONFIG_KEYS):
+        _profile_config.update({key: changed[key] for key in profiles.CONFIG_KEYS if key in changed})
+        _profile_config.setdefault("hotkey", HOTKEY)
+        _profile_config.setdefault("font_name", FONT_NAME)
+        reload_profiles(initial)
+
+    if not initial:
+        print('配置已更新:', ', '.join(changed))
+
+
 def start_hotkey_listener():
     """
     启动监听线程/循环，注册热键并保持运行。
     """
-    # 读取配置中的 HOTKEY（如果有）
-    print(f'注册热键: {HOTKEY}（按下时会复制当前输入框内容并生成图片）')
-    try:
-        keyboard.add_hotkey(HOTKEY, on_hotkey_pressed)
-    except Exception as e:
-        print('无法注册热键，请检查权限或 hotkey 字符串是否有效:', e)
+    _hotkey_worker.start()
+    if not PROFILES:
+        reload_profiles(initial=True)
+    if not register_hotkeys(PROFILES):
         return 0
 
+    # 预热所有角色的字体与素材缓存，第一次按下热键或切换角色时不再读取字体文件或解码图片
+    # （使用渲染服务时由服务端预热）
+    if not RENDER_SERVER:
+        stats = profiles.preload_profiles(PROFILES, PROFILE_CACHE_BYTES)
+        print(f'已预热 {len(PROFILES)} 个角色的字体与素材（素材缓存 {stats["bytes"] / 2 ** 20:.1f} MB）')
+    # 剪贴板工具只在启动时查找一次
+    BACKEND.prepare(image_encoder.mime_type(CLIPBOARD_PROFILE))
+
+    # 配置文件变化时自动应用，无需重启服务
+    store = config.get_store()
+    store.subscribe(apply_config)
+    store.start_watching()
+
     print('监听中，按 Ctrl+C 退出。')
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         print('\n已停止监听。')
+        print('热键统计:', get_hotkey_stats())
+        print('成品缓存:', RENDER_CACHE.stats())
+        if tracing.ENABLED:
+            print('各阶段耗时:')
+            print(tracing.format_stats())
         return 1
 
 
 if __name__ == '__main__':
-    HOTKEY = config.get_config_value(key = "hotkey")
-    AVATAR_FILE = config.get_config_value(key = "avatar_image_path")
-    BACKGROUND_FILE = config.get_config_value(key = "background_image_path")
-    USERNAME = config.get_config_value(key = "username")
-    WANT_AUTO_SEND = config.get_config_value(key = "want_auto_send")
+    # 配置文件只解析一次
+    apply_config(config.get_store().snapshot(), initial=True)
     print(HOTKEY)
     print(AVATAR_FILE)
     print(BACKGROUND_FILE)
     print(USERNAME)
     print(WANT_AUTO_SEND)
-    if start_hotkey_listener() == 0:
-        sys.exit(0)
-    elif start_hotkey_listener() == 1:
-        sys.exit(1)
+    sys.exit(start_hotkey_listener())
 
 
 # 使用示例
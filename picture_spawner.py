@@ -1,102 +1,881 @@
 from PIL import Image, ImageDraw, ImageFont
+from collections import OrderedDict
 from pathlib import Path
+import hashlib
+import math
+import mmap
 import os
 import sys
+import threading
+import weakref
 
-def get_available_font(font_index: str, font_size: int = 32) -> ImageFont.FreeTypeFont:
+import font_catalog
+import font_fallback
+import image_encoder
+import tracing
+
+# ===== 字体缓存 =====
+# 进程内共享的字体缓存，键为 (解析后的字体路径, 字号, face 索引)。
+# 热键回调和 GUI 预览都通过 get_available_font 取字体，只有第一次渲染需要读取字体文件。
+FONT_CACHE_MAXSIZE = 32
+_font_cache = OrderedDict()
+_font_cache_lock = threading.Lock()
+# hits/misses 统计 load_font；字体链与字号度量缓存位于 load_font 之前，命中时不会调用 load_font，单独计数
+_font_cache_stats = {"hits": 0, "misses": 0, "evictions": 0,
+                     "chain_hits": 0, "chain_misses": 0, "metrics_hits": 0, "metrics_misses": 0}
+
+# 回退字体使用的缓存键路径
+DEFAULT_FONT_KEY = "<default>"
+# Pillow 内置的位图字体（不可缩放，字号参数无效）
+BITMAP_FONT_KEY = "<bitmap>"
+
+
+def resolve_font(font_index: str) -> tuple:
     """
-    固定使用 Pillow 包自带的可缩放字体（优先尝试 DejaVuSans.ttf），
-    如果不可用则回退到 ImageFont.load_default()（位图字体，无法缩放）。
+    把配置中的字体名解析为字体文件路径与 face 索引
+
+    绝对路径直接使用；其他名称先在系统字体索引（font_catalog）中查找，
+    可以是文件名、字体族名或 "字体族 样式"；索引中没有时按系统字体目录下的相对路径处理。
 
-    这里忽略用户传入的 font_index，始终锁定为内部字体，满足“不需要用户自定义字体”的需求。
+    Args:
+        font_index: 字体名（例如 "STKAITI.TTF"、"Noto Sans CJK SC"）或路径
+
+    Returns:
+        (字体文件路径, face 索引)
     """
-    try: 
-        if sys.platform.startswith('win'):
-            fonts_dir = "C:/Windows/Fonts/"
-        else:
-            fonts_dir = "/usr/share/fonts/"
-        p = Path(fonts_dir + font_index)
-        print(p)
-        return ImageFont.truetype(p, font_size)
+    p = Path(str(font_index))
+    if p.is_absolute():
+        return p, 0
+    found = font_catalog.find_font(font_index)
+    if found is not None:
+        return Path(found[0]), found[1]
+    return resolve_font_path(font_index), 0
+
+
+def resolve_font_path(font_index: str) -> Path:
+    """
+    把配置中的字体文件名解析为系统字体目录下的完整路径（不查字体索引）
+
+    Args:
+        font_index: 字体文件名（例如 "STKAITI.TTF"）或完整路径
+
+    Returns:
+        字体文件路径
+    """
+    p = Path(str(font_index))
+    if p.is_absolute():
+        return p
+    if sys.platform.startswith('win'):
+        fonts_dir = "C:/Windows/Fonts/"
+    else:
+        fonts_dir = "/usr/share/fonts/"
+    return Path(fonts_dir + str(font_index))
+
+
+def load_font(font_path, font_size: int = 32, index: int = 0) -> ImageFont.FreeTypeFont:
+    """
+    从缓存中取字体，未命中时用 ImageFont.truetype 加载并放入缓存（LRU 淘汰）
+
+    Args:
+        font_path: 字体文件路径，DEFAULT_FONT_KEY 表示 Pillow 默认字体，
+            BITMAP_FONT_KEY 表示 Pillow 内置位图字体
+        font_size: 字号
+        index: TTC 字体集合中的 face 索引
+
+    Returns:
+        字体对象
+
+    Raises:
+        OSError: 字体文件无法加载
+    """
+    key = (str(font_path), font_size, index)
+    with _font_cache_lock:
+        font = _font_cache.get(key)
+        if font is not None:
+            _font_cache.move_to_end(key)
+            _font_cache_stats["hits"] += 1
+            return font
+        _font_cache_stats["misses"] += 1
+
+    # 在锁外加载，避免大字体文件阻塞其他线程的缓存命中
+    if key[0] == DEFAULT_FONT_KEY:
+        font = ImageFont.load_default(font_size)
+    elif key[0] == BITMAP_FONT_KEY:
+        font = ImageFont.load_default_imagefont()
+    else:
+        font = ImageFont.truetype(key[0], font_size, index=index)
+        print(f"    加载字体: {key[0]} ({font_size}px)")
+
+    with _font_cache_lock:
+        _font_cache[key] = font
+        _font_cache.move_to_end(key)
+        while len(_font_cache) > FONT_CACHE_MAXSIZE:
+            _font_cache.popitem(last=False)
+            _font_cache_stats["evictions"] += 1
+    return font
+
+
+def get_font_cache_stats() -> dict:
+    """
+    获取字体缓存的命中统计
+
+    Returns:
+        包含 hits、misses、evictions、size（load_font 的字体缓存），
+        chain_hits、chain_misses、chain_size（字体链缓存）与
+        metrics_hits、metrics_misses、metrics_size（字号度量缓存）的字典
+    """
+    with _font_cache_lock:
+        stats = dict(_font_cache_stats)
+        stats["size"] = len(_font_cache)
+        stats["chain_size"] = len(_font_chains)
+        stats["metrics_size"] = len(_size_metrics)
+    return stats
+
+
+def clear_font_cache() -> None:
+    """清空字体缓存并重置统计"""
+    with _font_cache_lock:
+        _font_cache.clear()
+        _font_chains.clear()
+        _size_metrics.clear()
+        for k in _font_cache_stats:
+            _font_cache_stats[k] = 0
+
+
+def get_available_font(font_index: str, font_size: int = 32) -> ImageFont.FreeTypeFont:
+    """
+    按字体文件名获取系统字体（带进程内缓存），
+    如果不可用则回退到 Pillow 的默认字体（ImageFont.load_default，按字号缩放）。
+    """
+    if font_index in (DEFAULT_FONT_KEY, BITMAP_FONT_KEY):
+        return load_font(font_index, font_size)
+    try:
+        font_path, face_index = resolve_font(font_index)
+        return load_font(font_path, font_size, face_index)
     except Exception:
-        # 回退到 Pillow 的默认位图字体（可能无法按像素精确缩放）
+        # 回退到 Pillow 的默认字体
         print("未获取到字体！")
-        return ImageFont.load_default()
+        return load_font(DEFAULT_FONT_KEY, font_size)
+
 
+# 回退字体链：主字体缺少字形的字符依次尝试这些字体（见 font_fallback），None 表示使用默认列表
+FALLBACK_FONTS = font_fallback.DEFAULT_FALLBACK_FONTS
+_font_chains = OrderedDict()
 
-def wrap_text(text: str, max_width: int, font: ImageFont.FreeTypeFont) -> list:
+
+def get_font_chain(font_index: str, font_size: int = 32, fallback_fonts=None):
     """
-    文本换行处理，支持原始换行符
-    
+    获取主字体加回退字体的字体链（带进程内缓存）
+
     Args:
-        text: 原始文本
-        max_width: 最大宽度（像素）
-        font: 字体对象
-    
+        font_index: 主字体名
+        font_size: 字号
+        fallback_fonts: 回退字体名列表，None 时使用 FALLBACK_FONTS；系统中不存在的字体会被跳过
+
     Returns:
-        换行后的文本列表
+        font_fallback.FontChain；没有可用的回退字体时直接返回主字体对象。
+        主字体不存在时字体链由可用的回退字体组成，Pillow 默认字体放在最后
+    """
+    fallbacks = tuple(FALLBACK_FONTS if fallback_fonts is None else fallback_fonts)
+    key = (str(font_index), font_size, fallbacks)
+    with _font_cache_lock:
+        chain = _font_chains.get(key)
+        if chain is not None:
+            _font_chains.move_to_end(key)
+            _font_cache_stats["chain_hits"] += 1
+            return chain
+        _font_cache_stats["chain_misses"] += 1
+
+    primary = get_available_font(font_index, font_size)
+    chain = primary
+    if fallbacks and font_index not in (DEFAULT_FONT_KEY, BITMAP_FONT_KEY):
+        fonts, coverages = [], []
+        seen = set()
+        primary_missing = False
+        for i, name in enumerate((font_index,) + fallbacks):
+            try:
+                font_path, face_index = resolve_font(name)
+                if (str(font_path), face_index) in seen:
+                    continue
+                seen.add((str(font_path), face_index))
+                coverage = font_fallback.get_coverage(font_path, face_index)
+                font = primary if i == 0 else load_font(font_path, font_size, face_index)
+            except Exception:
+                # 主字体不存在时由回退字体组成字体链，默认字体放在最后；回退字体不存在或位图字体不支持该字号时跳过
+                if i == 0:
+                    primary_missing = True
+                continue
+            fonts.append(font)
+            coverages.append(coverage)
+        if primary_missing and fonts:
+            # 默认字体的覆盖范围未知，作为最后一级接收其他字体都不包含的字符
+            fonts.append(primary)
+            coverages.append(font_fallback.FULL_COVERAGE)
+        if len(fonts) > 1:
+            chain = font_fallback.FontChain(fonts, coverages)
+
+    with _font_cache_lock:
+        _font_chains[key] = chain
+        while len(_font_chains) > FONT_CACHE_MAXSIZE:
+            _font_chains.popitem(last=False)
+    return chain
+
+
+def get_font_sizes(height: int) -> tuple:
+    """
+    根据图片高度计算用户名与内容的字号，并设置最小字号以防止过小
+
+    Args:
+        height: 图片高度（像素）
+
+    Returns:
+        (用户名字号, 内容字号)
+    """
+    username_font_size = max(24, int(height * 0.1))  # 约高度的5%
+    content_font_size = max(18, int(height * 0.15))  # 约高度的3.5%
+    return username_font_size, content_font_size
+
+
+def get_avatar_size(height: int) -> int:
+    """根据图片高度计算头像边长，约占高度的65%"""
+    return int(height * 0.65)
+
+
+def preload_fonts(font_index: str, img_size: tuple = (1200, 800), fallback_fonts=None) -> None:
+    """
+    预先加载指定图片尺寸下会用到的字体（含回退字体链），使第一次按下热键时无需再读取字体文件
+
+    Args:
+        font_index: 字体文件名
+        img_size: 图片大小 (width, height)
+        fallback_fonts: 回退字体名列表，None 时使用 FALLBACK_FONTS
+    """
+    for size in get_font_sizes(img_size[1]):
+        get_font_chain(font_index, size, fallback_fonts)
+
+
+# ===== 换行 =====
+# 每个字体对象对应一组测量表：字符步进宽度、字偶距（kerning）修正、字形墨迹左右边界，
+# 每个字符 / 字符对只测量一次。
+_advance_tables = weakref.WeakKeyDictionary()
+
+# 估算宽度与 getbbox 实测宽度之间允许的舍入误差（像素），
+# 估算值落在 max_width 附近这个范围内时才调用 getbbox 校正
+WRAP_TOLERANCE = 2
+
+# 不能出现在行首的字符（标点、右括号等）
+NO_BREAK_BEFORE = set(
+    "，。、；：？！）」』】》〉”’…‥・ー～,.;:?!)]}%"
+    "ぁぃぅぇぉっゃゅょゎァィゥェォッャュョヮヵヶ々"
+)
+# 不能出现在行尾的字符（左括号、左引号等）
+NO_BREAK_AFTER = set("（「『【《〈“‘([{$¥￥")
+
+
+def _get_advance_table(font) -> tuple:
+    """
+    获取字体对应的 (步进宽度表, 字偶距表, 墨迹边界表)，不存在时创建
+    """
+    try:
+        tables = _advance_tables.get(font)
+    except TypeError:
+        # 无法弱引用的字体对象不缓存
+        return {}, {}, {}
+    if tables is None:
+        tables = ({}, {}, {})
+        _advance_tables[font] = tables
+    return tables
+
+
+def _measure_glyphs(paragraph: str, font) -> tuple:
+    """
+    计算段落中每个字符的绘制原点（含字偶距修正），并取出每个字符的墨迹左右边界
+
+    Returns:
+        (原点列表, 墨迹边界表)，原点列表长度为 len(paragraph)
+    """
+    advances, kerning, ink = _get_advance_table(font)
+    origins = [0.0] * len(paragraph)
+    pen = 0.0
+    prev = None
+    for i, char in enumerate(paragraph):
+        adv = advances.get(char)
+        if adv is None:
+            adv = font.getlength(char)
+            advances[char] = adv
+            bbox = font.getbbox(char)
+            ink[char] = (bbox[0], bbox[2])
+        if prev is not None:
+            pair = prev + char
+            kern = kerning.get(pair)
+            if kern is None:
+                kern = font.getlength(pair) - advances[prev] - adv
+                kerning[pair] = kern
+            pen += kern
+        origins[i] = pen
+        pen += adv
+        prev = char
+    return origins, ink
+
+
+def _line_width(line: str, font) -> int:
+    bbox = font.getbbox(line)
+    return bbox[2] - bbox[0]
+
+
+def _find_break(paragraph: str, start: int, origins: list, ink: dict, max_width: int, font) -> int:
+    """
+    找到从 start 开始的一行的结束位置 end（该行为 paragraph[start:end]）
+
+    与逐字符测量整行的结果一致：end 是第一个使 paragraph[start:end + 1] 超宽的位置，
+    每行至少包含一个字符。先用测量表增量估算行宽，只有估算值接近 max_width 时
+    才用 getbbox 在断点附近校正。
+    """
+    n = len(paragraph)
+    base = origins[start]
+    left, right = ink[paragraph[start]]
+    end = start + 1
+    next_width = None
+    while end < n:
+        glyph_left, glyph_right = ink[paragraph[end]]
+        x = origins[end] - base
+        new_left = min(left, x + glyph_left)
+        new_right = max(right, x + glyph_right)
+        if new_right - new_left > max_width:
+            next_width = new_right - new_left
+            break
+        left, right = new_left, new_right
+        end += 1
+
+    near_limit = right - left > max_width - WRAP_TOLERANCE
+    if next_width is not None and next_width <= max_width + WRAP_TOLERANCE:
+        near_limit = True
+    if near_limit:
+        # 校正：向后扩展直到下一个字符会超宽，再向前收缩直到本行不超宽
+        while end < n and _line_width(paragraph[start:end + 1], font) <= max_width:
+            end += 1
+        while end > start + 1 and _line_width(paragraph[start:end], font) > max_width:
+            end -= 1
+    return end
+
+
+def _is_word_char(char: str) -> bool:
+    # 拉丁字母、数字等按单词处理，CJK 字符可在任意位置断行
+    return char.isalnum() and ord(char) < 0x2E80
+
+
+def _can_break(prev: str, char: str) -> bool:
+    """判断 prev 与 char 之间是否允许换行"""
+    if char in NO_BREAK_BEFORE or prev in NO_BREAK_AFTER:
+        return False
+    if _is_word_char(prev) and _is_word_char(char):
+        return False
+    return True
+
+
+def _wrap_paragraph(paragraph: str, max_width: int, font, break_rules: bool) -> list:
+    """对不含换行符的非空段落换行"""
+    lines = []
+    origins, ink = _measure_glyphs(paragraph, font)
+    start = 0
+    n = len(paragraph)
+    while start < n:
+        end = _find_break(paragraph, start, origins, ink, max_width, font)
+        if break_rules and end < n:
+            # 在本行内向前寻找允许断行的位置，找不到则保持按字符断行
+            for candidate in range(end, start, -1):
+                if _can_break(paragraph[candidate - 1], paragraph[candidate]):
+                    end = candidate
+                    break
+        lines.append(paragraph[start:end])
+        start = end
+    return lines
+
+
+def _wrap_lines(text: str, max_width: int, font, break_rules: bool = False, max_lines: int = None) -> list:
+    """
+    wrap_text 的实现（不打印状态信息）
+
+    Args:
+        max_lines: 得到的行数超过该值时立即停止（用于判断文本是否放得下），None 表示不限制
+
+    Returns:
+        换行后的文本列表；提前停止时为前 max_lines + 1 行
     """
     lines = []
     # 先按原始换行符分割文本
     paragraphs = text.split('\n')
     
     for paragraph in paragraphs:
+        if max_lines is not None and len(lines) > max_lines:
+            break
         if not paragraph:  # 处理空行
             lines.append("")
             continue
-            
-        current_line = ""
-        for char in paragraph:
-            test_line = current_line + char
-            bbox = font.getbbox(test_line)
-            line_width = bbox[2] - bbox[0]
-            
-            if line_width > max_width:
-                if current_line:
-                    lines.append(current_line)
-                current_line = char
+        if max_lines is not None:
+            # 只测量并换行段落的前缀：前缀的换行结果除最后一行外都与整段相同，
+            # 前缀得到的行数足够判断是否超出时不再处理段落的其余部分
+            need = max_lines + 1 - len(lines)
+            chunk = max(256, need * 64)
+            while chunk < len(paragraph):
+                prefix_lines = _wrap_paragraph(paragraph[:chunk], max_width, font, break_rules)
+                if len(prefix_lines) > need:
+                    lines.extend(prefix_lines[:need])
+                    break
+                chunk *= 4
             else:
-                current_line = test_line
-        
-        if current_line:
-            lines.append(current_line)
-    
-    print("    wrap text成功！")
+                lines.extend(_wrap_paragraph(paragraph, max_width, font, break_rules))
+            continue
+        lines.extend(_wrap_paragraph(paragraph, max_width, font, break_rules))
+    if max_lines is not None:
+        del lines[max_lines + 1:]
     return lines
 
 
-def generate_dialog_image(
-    avatar_path: str,
-    background_path: str = None,
-    username: str = "角色名称",
-    dialog_text: str = "说话内容",
-    font_index: int = 0,
-    img_size: tuple = (1200, 800),
-    output_path: str = None
-) -> Image.Image:
+def wrap_text(text: str, max_width: int, font: ImageFont.FreeTypeFont, break_rules: bool = False) -> list:
     """
-    生成对话框布局图片
+    文本换行处理，支持原始换行符
+    
+    Args:
+        text: 原始文本
+        max_width: 最大宽度（像素）
+        font: 字体对象或 font_fallback.FontChain
+        break_rules: 是否启用断行规则（CJK 行首/行尾禁则、拉丁文按单词换行），
+            关闭时按字符换行
     
+    Returns:
+        换行后的文本列表
+    """
+    return _wrap_lines(text, max_width, font, break_rules)
+
+
+# ===== 自动缩小字号 =====
+# 自动适配时允许的最小内容字号
+AUTO_FIT_MIN_SIZE = 12
+# 行间距（像素），与 generate_dialog_image 中的绘制一致
+LINE_SPACING = 10
+ELLIPSIS = "…"
+_size_metrics = OrderedDict()
+
+
+def get_content_metrics(font_index, font_size: int, fallback_fonts=None) -> tuple:
+    """
+    获取某个字号的内容字体与行高（带进程内缓存）
+
+    Returns:
+        (字体或字体链, 行高)
+    """
+    key = (str(font_index), font_size, None if fallback_fonts is None else tuple(fallback_fonts))
+    with _font_cache_lock:
+        metrics = _size_metrics.get(key)
+        if metrics is not None:
+            _size_metrics.move_to_end(key)
+            _font_cache_stats["metrics_hits"] += 1
+            return metrics
+        _font_cache_stats["metrics_misses"] += 1
+    font = get_font_chain(font_index, font_size, fallback_fonts)
+    a_bbox = font.getbbox("A")
+    metrics = (font, a_bbox[3] - a_bbox[1])
+    with _font_cache_lock:
+        _size_metrics[key] = metrics
+        while len(_size_metrics) > FONT_CACHE_MAXSIZE * 4:
+            _size_metrics.popitem(last=False)
+    return metrics
+
+
+def _max_lines(max_height: int, line_height: int) -> int:
+    """n 行文本占用 n * line_height + (n - 1) * LINE_SPACING 像素，返回 max_height 内最多能放下的行数"""
+    return max(1, (max_height + LINE_SPACING) // (line_height + LINE_SPACING))
+
+
+def _paragraph_lengths(text: str, font) -> list:
+    """每段文本的总宽度（像素）"""
+    return [font.getlength(paragraph) if paragraph else 0 for paragraph in text.split('\n')]
+
+
+def _min_line_count(lengths: list, scale: float, max_width: int) -> int:
+    """
+    换行后行数的下界（不换行，只用各段总宽度估计）
+
+    lengths 为某个字号下测得的各段宽度，scale 为目标字号与该字号之比。字宽随字号近似线性变化，
+    每行的墨迹宽度不超过 max_width；提示（hinting）取整与行尾空白使实际行宽略有出入，按 20% 的余量估计
+    """
+    limit = max_width * 1.2
+    return sum(max(1, math.ceil(length * scale / limit)) for length in lengths)
+
+
+def _truncate_line(line: str, max_width: int, font) -> str:
+    """截断一行文本并加上省略号，使其不超过 max_width"""
+    while line and font.getlength(line + ELLIPSIS) > max_width:
+        line = line[:-1]
+    return line + ELLIPSIS
+
+
+def fit_text(
+    text: str,
+    max_width: int,
+    max_height: int,
+    font_index,
+    max_size: int,
+    fallback_fonts=None,
+    min_size: int = None,
+    break_rules: bool = False
+) -> tuple:
+    """
+    选择能让换行后的文本放进 max_width x max_height 的最大字号
+
+    先试最大字号（短文本一次即可确定），放不下时在 [min_size, max_size) 内二分查找。
+    每个候选字号的字体与行高只计算一次；按最大字号下各段总宽度缩放估计的行数已超出时不再换行，
+    否则换行在超过该字号可容纳的行数时立即停止，放不下的字号只需测量可容纳行数 + 1 行。最小字号仍放不下时截断多余的行并在末尾加省略号。
+
+    Args:
+        text: 对话内容
+        max_width: 文本区域宽度（像素）
+        max_height: 文本区域高度（像素）
+        font_index: 字体名
+        max_size: 最大字号
+        fallback_fonts: 回退字体名列表
+        min_size: 最小字号，默认 AUTO_FIT_MIN_SIZE
+        break_rules: 是否启用断行规则
+
+    Returns:
+        (字体, 行高, 换行后的文本列表, 字号)
+    """
+    min_size = min(AUTO_FIT_MIN_SIZE if min_size is None else min_size, max_size)
+
+    def attempt(size, estimate=True):
+        """返回 (字体, 行高, 换行结果, 可容纳行数)；按宽度估计已放不下时换行结果为 None"""
+        font, line_height = get_content_metrics(font_index, size, fallback_fonts)
+        limit = _max_lines(max_height, line_height)
+        if estimate and _min_line_count(lengths, size / max_size, max_width) > limit:
+            return font, line_height, None, limit
+        return font, line_height, _wrap_lines(text, max_width, font, break_rules, max_lines=limit), limit
+
+    def fits(result):
+        return result[2] is not None and len(result[2]) <= result[3]
+
+    result = attempt(max_size, estimate=False)
+    if fits(result):
+        return result[0], result[1], result[2], max_size
+
+    lengths = _paragraph_lengths(text, result[0])
+
+    best = None
+    lo, hi = min_size, max_size - 1
+    while lo <= hi:
+        mid = (lo + hi + 1) // 2
+        result = attempt(mid)
+        if fits(result):
+            best = (mid, result)
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    if best is not None:
+        size, (font, line_height, lines, _) = best
+        return font, line_height, lines, size
+
+    # 最小字号也放不下：截断
+    font, line_height, lines, limit = attempt(min_size, estimate=False)
+    lines = lines[:limit]
+    lines[-1] = _truncate_line(lines[-1], max_width, font)
+    print(f"    文本过长，最小字号 {min_size}px 仍放不下，已截断")
+    return font, line_height, lines, min_size
+
+
+# ===== 素材解码缓存 =====
+# 背景与头像常是数千像素的照片或数 MB 的 PNG，而画布只有几百像素。
+# JPEG 先用 draft 模式按 1/2、1/4、1/8 缩小解码，再用 reduce 按整数倍缩小后做最终的 LANCZOS 重采样
+# （resize 的 reducing_gap），RGB/灰度原图先缩小再转换模式，不对原尺寸图片做 RGBA 转换。
+# 缩放后的结果按文件指纹、目标尺寸与模式缓存，底图重新合成（例如内容区高度变化）时不再解码。
+#
+# 缩放结果同时以原始像素写入磁盘缓存目录（文件名为键的哈希），进程重启后用 mmap 映射文件、
+# Image.frombuffer 直接包装成图片，不需要解码与缩放；目录总大小超过上限时删除最久未使用的文件。
+# 进程内缓存的条目数上限与像素总字节数上限（多个角色共用，见 profiles），新加入的条目总是保留
+ASSET_CACHE_MAXSIZE = 8
+ASSET_CACHE_MAX_BYTES = 256 * 2 ** 20
+# 整数倍缩小后保留目标尺寸的倍数，3 倍时与直接重采样的结果几乎没有差别
+ASSET_REDUCING_GAP = 3.0
+# 磁盘缓存目录，None 或空字符串表示不使用磁盘缓存
+ASSET_DISK_CACHE_DIR = os.path.join(os.path.expanduser('~'), 'ADVTextSpawner', 'asset_cache')
+# 磁盘缓存的总大小上限（字节）
+ASSET_DISK_CACHE_MAX_BYTES = 256 * 2 ** 20
+_asset_cache = OrderedDict()
+_asset_cache_bytes = 0
+_asset_cache_lock = threading.Lock()
+_asset_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "disk_hits": 0, "disk_writes": 0}
+
+
+def image_nbytes(image: Image.Image) -> int:
+    """图片像素数据占用的字节数（按每通道 8 位估算）"""
+    return image.width * image.height * len(image.getbands())
+
+
+def _decode_resized(path, size: tuple, mode: str) -> Image.Image:
+    """解码图片并缩放到 size，返回 mode 模式的图片"""
+    gap = ASSET_REDUCING_GAP
+    with Image.open(path) as img:
+        if img.format == "JPEG":
+            # 按不小于目标尺寸的最大比例缩小解码（DCT 缩放本身带有平滑），必须在读取像素之前调用
+            img.draft(None, size)
+        if img.mode != mode and img.mode not in ("RGB", "L"):
+            # 调色板、CMYK、带透明通道等模式先转换（调色板图片不能直接重采样，透明通道的处理与原来保持一致）
+            img = img.convert(mode)
+        resized = img.resize(size, Image.Resampling.LANCZOS, reducing_gap=gap)
+    if resized.mode != mode:
+        resized = resized.convert(mode)
+    return resized
+
+
+def _asset_disk_path(key: tuple) -> str:
+    """磁盘缓存文件路径，键包含文件指纹、目标尺寸、模式与缩放参数"""
+    digest = hashlib.sha1(repr(key + (ASSET_REDUCING_GAP,)).encode("utf-8")).hexdigest()
+    return os.path.join(ASSET_DISK_CACHE_DIR, digest + ".raw")
+
+
+def _load_from_disk(cache_path: str, size: tuple, mode: str):
+    """映射磁盘缓存文件并包装为图片，文件不存在或大小不符时返回 None"""
+    try:
+        with open(cache_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # ValueError：空文件无法映射
+        return None
+    if len(mapped) != size[0] * size[1] * Image.getmodebands(mode):
+        mapped.close()
+        return None
+    try:
+        # 更新修改时间，作为 LRU 淘汰的最近使用时间
+        os.utime(cache_path)
+    except OSError:
+        pass
+    # RGBA 等 Pillow 可直接映射的模式不复制像素，RGB 在包装时解包一次
+    return Image.frombuffer(mode, size, mapped, "raw", mode, 0, 1)
+
+
+def _save_to_disk(cache_path: str, image: Image.Image) -> bool:
+    """把图片的原始像素写入磁盘缓存（先写临时文件再替换），返回是否写入"""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(image.tobytes())
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print("    无法写入素材缓存:", e)
+        return False
+    _evict_disk_cache(os.path.dirname(cache_path))
+    return True
+
+
+def _evict_disk_cache(directory: str) -> None:
+    """磁盘缓存超过 ASSET_DISK_CACHE_MAX_BYTES 时按最近使用时间删除旧文件"""
+    entries = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name.endswith(".raw"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= ASSET_DISK_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass  # Windows 上仍被映射的文件无法删除，下次再淘汰
+
+
+def load_resized_image(path, size: tuple, mode: str) -> Image.Image:
+    """
+    加载并缩放素材图片（带进程内缓存）。返回的图片为缓存中的共享对象，调用方不能原地修改。
+
+    Args:
+        path: 图片文件路径
+        size: 目标尺寸 (width, height)
+        mode: 目标模式，例如 "RGB"、"RGBA"
+
+    Returns:
+        缩放后的图片（来自磁盘缓存时可能是只读的映射图片）
+
+    Raises:
+        OSError: 文件不存在或无法解码
+    """
+    key = (file_fingerprint(path), tuple(size), mode)
+    with _asset_cache_lock:
+        image = _asset_cache.get(key)
+        if image is not None:
+            _asset_cache.move_to_end(key)
+            _asset_cache_stats["hits"] += 1
+            return image
+        _asset_cache_stats["misses"] += 1
+
+    # 内存未命中时依次尝试磁盘缓存与解码；文件指纹缺失（文件不存在）时不使用磁盘缓存
+    cache_path = _asset_disk_path(key) if ASSET_DISK_CACHE_DIR and key[0][1] is not None else None
+    image = _load_from_disk(cache_path, tuple(size), mode) if cache_path else None
+    if image is not None:
+        stat = "disk_hits"
+    else:
+        image = _decode_resized(path, tuple(size), mode)
+        stat = "disk_writes" if cache_path and _save_to_disk(cache_path, image) else None
+
+    global _asset_cache_bytes
+    with _asset_cache_lock:
+        if stat:
+            _asset_cache_stats[stat] += 1
+        old = _asset_cache.pop(key, None)
+        if old is not None:
+            _asset_cache_bytes -= image_nbytes(old)
+        _asset_cache[key] = image
+        _asset_cache_bytes += image_nbytes(image)
+        while len(_asset_cache) > 1 and (len(_asset_cache) > ASSET_CACHE_MAXSIZE
+                                         or _asset_cache_bytes > ASSET_CACHE_MAX_BYTES):
+            _, evicted = _asset_cache.popitem(last=False)
+            _asset_cache_bytes -= image_nbytes(evicted)
+            _asset_cache_stats["evictions"] += 1
+    return image
+
+
+def get_asset_cache_stats() -> dict:
+    """
+    获取素材解码缓存的命中统计
+
+    Returns:
+        包含 hits、misses、evictions、disk_hits、disk_writes、size、bytes 的字典，
+        misses 中命中磁盘缓存的次数为 disk_hits
+    """
+    with _asset_cache_lock:
+        stats = dict(_asset_cache_stats)
+        stats["size"] = len(_asset_cache)
+        stats["bytes"] = _asset_cache_bytes
+    return stats
+
+
+def preload_assets(avatar_path: str, background_path: str, img_size: tuple = (1200, 800)) -> None:
+    """
+    预先加载指定图片尺寸下的头像与背景（已写入磁盘缓存时只需映射文件），使第一次按下热键时无需解码
+
     Args:
         avatar_path: 头像文件路径
-        background_path: 背景文件路径，如果为None或文件不存在则使用纯黑背景
+        background_path: 背景文件路径
+        img_size: 图片大小 (width, height)
+    """
+    avatar_size = get_avatar_size(img_size[1])
+    for path, size, mode in ((avatar_path, (avatar_size, avatar_size), "RGBA"),
+                             (background_path, tuple(img_size), "RGB")):
+        if path and Path(path).exists():
+            try:
+                load_resized_image(path, size, mode)
+            except OSError as e:
+                print(f"    无法预加载素材 {path}:", e)
+
+
+def clear_asset_cache() -> None:
+    """清空素材解码缓存（不删除磁盘缓存）并重置统计"""
+    global _asset_cache_bytes
+    with _asset_cache_lock:
+        _asset_cache.clear()
+        _asset_cache_bytes = 0
+        for k in _asset_cache_stats:
+            _asset_cache_stats[k] = 0
+
+
+# ===== 静态底图缓存 =====
+# 背景、头像、用户名与半透明对话框在配置不变时每次渲染都相同，只有对话文本会变化。
+# 缓存合成好的底图，键中包含素材文件的 mtime，素材被修改后自动失效。
+BASE_FRAME_CACHE_MAXSIZE = 16
+_base_frame_cache = OrderedDict()
+_base_frame_cache_lock = threading.Lock()
+_base_frame_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def file_fingerprint(path) -> tuple:
+    """返回 (路径, mtime, 文件大小)，文件不存在时 mtime 与大小为 None"""
+    if not path:
+        return (path, None, None)
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return (str(path), None, None)
+    return (str(path), st.st_mtime_ns, st.st_size)
+
+
+def compute_layout(img_size: tuple, username: str, font_index, fallback_fonts=None) -> dict:
+    """
+    计算对话框布局（头像、用户名、文本框位置）以及使用的字体
+
+    Args:
+        img_size: 图片大小 (width, height)
         username: 用户名称
-        dialog_text: 说话内容
         font_index: 字体索引
-        img_size: 图片大小 (width, height)，默认 (1200, 800)
-        output_path: 输出文件路径，如果提供则保存图片
-    
+        fallback_fonts: 回退字体名列表，None 时使用 FALLBACK_FONTS
+
     Returns:
-        PIL Image 对象
+        布局字典
+    """
+    width, height = img_size
+
+    # ===== 自适应调整头像大小 =====
+    # 根据图片高度自动计算头像大小，约占高度的65%
+    avatar_size = get_avatar_size(height)
+    avatar_padding = 30
+
+    # ===== 自适应调整字体大小 =====
+    # 根据图片尺寸自动调整字体大小（以图片高度的百分比），并设置最小字号以防止过小
+    username_font_size, content_font_size = get_font_sizes(height)
+
+    username_font = get_font_chain(font_index, username_font_size, fallback_fonts)
+    content_font = get_font_chain(font_index, content_font_size, fallback_fonts)
+
+    # ===== 文本框布局 =====
+    text_box_x = avatar_size + avatar_padding + 20  # 头像右侧
+    text_box_y = int(height * 0.1)  # 顶部边距
+    text_box_width = width - text_box_x - 40
+    text_box_height = height - text_box_y - 40
+
+    # 用户名
+    username_bbox = username_font.getbbox(username)
+    username_height = username_bbox[3] - username_bbox[1]
+
+    # 行高
+    a_bbox = content_font.getbbox("A")
+    line_height = a_bbox[3] - a_bbox[1]
+
+    return {
+        "avatar_size": avatar_size,
+        "avatar_padding": avatar_padding,
+        "username_font": username_font,
+        "content_font": content_font,
+        "text_box_x": text_box_x,
+        "text_box_y": text_box_y,
+        "text_box_width": text_box_width,
+        "text_box_height": text_box_height,
+        "username_height": username_height,
+        "content_start_y": text_box_y + username_height + 25,
+        "line_height": line_height,
+    }
+
+
+def _compose_base_frame(
+    avatar_path: str,
+    background_path: str,
+    username: str,
+    img_size: tuple,
+    layout: dict,
+    content_height: int
+) -> Image.Image:
+    """
+    合成底图：背景、头像、用户名以及半透明对话框
     """
     width, height = img_size
     
     # 创建或加载背景
     if background_path and Path(background_path).exists():
         try:
-            bg_image = Image.open(background_path).convert("RGB")
-            bg_image = bg_image.resize((width, height), Image.Resampling.LANCZOS)
-            image = bg_image
+            # 缓存中的背景是共享对象，复制后再绘制
+            image = load_resized_image(background_path, (width, height), "RGB").copy()
         except:
             print("    未检测到背景图片，使用纯黑背景")
             image = Image.new("RGB", (width, height), color=(0, 0, 0))
@@ -106,16 +885,13 @@ def generate_dialog_image(
     
     draw = ImageDraw.Draw(image)
     
-    # ===== 自适应调整头像大小 =====
-    # 根据图片高度自动计算头像大小，约占高度的65%
-    avatar_size = int(height * 0.65)
-    avatar_padding = 30
+    avatar_size = layout["avatar_size"]
+    avatar_padding = layout["avatar_padding"]
     
     avatar = None
     if Path(avatar_path).exists():
         try:
-            avatar = Image.open(avatar_path).convert("RGBA")
-            avatar = avatar.resize((avatar_size, avatar_size), Image.Resampling.LANCZOS)
+            avatar = load_resized_image(avatar_path, (avatar_size, avatar_size), "RGBA")
         except:
             avatar = None
     
@@ -124,74 +900,308 @@ def generate_dialog_image(
         avatar_pos = (avatar_padding, height - avatar_size - avatar_padding)
         image.paste(avatar, avatar_pos, avatar)
     
-    # ===== 自适应调整字体大小 =====
-    # 根据图片尺寸自动调整字体大小（以图片高度的百分比），并设置最小字号以防止过小
-    username_font_size = max(24, int(height * 0.1))  # 约高度的5%
-    content_font_size = max(18, int(height * 0.15))  # 约高度的3.5%
-    
-    username_font = get_available_font(font_index, username_font_size)
-    content_font = get_available_font(font_index, content_font_size)
-    
-    # ===== 文本框布局 =====
-    text_box_x = avatar_size + avatar_padding + 20  # 头像右侧
-    text_box_y = int(height * 0.1)  # 顶部边距
-    text_box_width = width - text_box_x - 40
-    text_box_height = height - text_box_y - 40
-    
-    # 用户名
-    username_bbox = username_font.getbbox(username)
-    username_height = username_bbox[3] - username_bbox[1]
+    text_box_x = layout["text_box_x"]
+    content_start_y = layout["content_start_y"]
     
-    draw.text(
-        (text_box_x, text_box_y),
+    font_fallback.draw_text(
+        draw,
+        (text_box_x, layout["text_box_y"]),
         username,
-        fill=(255, 200, 100),  # 金黄色
-        font=username_font
+        font=layout["username_font"],
+        fill=(255, 200, 100)  # 金黄色
     )
     
-    # 说话内容（带文本换行）
-    lines = wrap_text(dialog_text, text_box_width, content_font)
-    
-    # 计算内容框高度
-    line_height = content_font.getbbox("A")[3] - content_font.getbbox("A")[1]
-    total_text_height = len(lines) * line_height + (len(lines) - 1) * 10
-    
-    # 绘制半透明背景框
-    content_start_y = text_box_y + username_height + 25
-    
-    # 调整文本框高度以适应内容
-    content_height = min(total_text_height + 30, text_box_height - username_height - 30)
-    
     # 绘制半透明黑色背景框
     dialog_box_coords = [
         (text_box_x - 10, content_start_y - 10),
-        (text_box_x + text_box_width + 10, content_start_y + content_height)
+        (text_box_x + layout["text_box_width"] + 10, content_start_y + content_height)
     ]
     
-    # 创建半透明背景
-    overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
-    overlay_draw = ImageDraw.Draw(overlay)
-    overlay_draw.rectangle(
-        dialog_box_coords,
-        fill=(20, 20, 40, 180)  # 深蓝色半透明
+    # 只在对话框区域内混合半透明背景
+    blend_box(image, dialog_box_coords, (20, 20, 40, 180))  # 深蓝色半透明
+    return image
+
+
+def blend_box(image: Image.Image, coords, fill: tuple) -> None:
+    """
+    在 RGB 图片上原地叠加一个半透明矩形
+
+    用常量透明度的蒙版把纯色直接贴到矩形区域，结果与整幅图片转为 RGBA 后
+    alpha_composite 一个同样大小的透明图层完全相同，但只需一个与矩形等大的单通道蒙版，
+    耗时也只与矩形面积成正比。
+
+    Args:
+        image: RGB 图片（原地修改）
+        coords: 矩形 [(x0, y0), (x1, y1)]，与 ImageDraw.rectangle 相同，包含右下角
+        fill: RGBA 填充颜色
+    """
+    (x0, y0), (x1, y1) = coords
+    box = (max(0, int(x0)), max(0, int(y0)), min(image.width, int(x1) + 1), min(image.height, int(y1) + 1))
+    if box[2] <= box[0] or box[3] <= box[1]:
+        return
+    mask = Image.new("L", (box[2] - box[0], box[3] - box[1]), fill[3])
+    image.paste(fill[:3], box, mask)
+
+
+def get_base_frame(
+    avatar_path: str,
+    background_path: str,
+    username: str,
+    font_index,
+    img_size: tuple,
+    content_height: int,
+    layout: dict = None,
+    fallback_fonts=None
+) -> Image.Image:
+    """
+    获取（必要时合成并缓存）底图。返回的图片为缓存中的共享对象，调用方需 copy() 后再绘制。
+
+    Args:
+        avatar_path: 头像文件路径
+        background_path: 背景文件路径
+        username: 用户名称
+        font_index: 字体索引
+        img_size: 图片大小 (width, height)
+        content_height: 对话框内容区高度
+        layout: compute_layout 的结果，为 None 时重新计算
+        fallback_fonts: 回退字体名列表，None 时使用 FALLBACK_FONTS
+
+    Returns:
+        底图
+    """
+    key = (
+        file_fingerprint(avatar_path),
+        file_fingerprint(background_path),
+        username,
+        str(font_index),
+        tuple(FALLBACK_FONTS if fallback_fonts is None else fallback_fonts),
+        tuple(img_size),
+        content_height,
     )
-    image = Image.alpha_composite(image.convert("RGBA"), overlay).convert("RGB")
-    draw = ImageDraw.Draw(image)
+    with _base_frame_cache_lock:
+        frame = _base_frame_cache.get(key)
+        if frame is not None:
+            _base_frame_cache.move_to_end(key)
+            _base_frame_cache_stats["hits"] += 1
+            return frame
+        _base_frame_cache_stats["misses"] += 1
+
+    if layout is None:
+        layout = compute_layout(img_size, username, font_index, fallback_fonts)
+    frame = _compose_base_frame(avatar_path, background_path, username, img_size, layout, content_height)
+
+    with _base_frame_cache_lock:
+        _base_frame_cache[key] = frame
+        _base_frame_cache.move_to_end(key)
+        while len(_base_frame_cache) > BASE_FRAME_CACHE_MAXSIZE:
+            _base_frame_cache.popitem(last=False)
+            _base_frame_cache_stats["evictions"] += 1
+    return frame
+
+
+def get_base_frame_cache_stats() -> dict:
+    """
+    获取底图缓存的命中统计
+
+    Returns:
+        包含 hits、misses、evictions、size 的字典
+    """
+    with _base_frame_cache_lock:
+        stats = dict(_base_frame_cache_stats)
+        stats["size"] = len(_base_frame_cache)
+    return stats
+
+
+def clear_base_frame_cache() -> None:
+    """清空底图缓存并重置统计"""
+    with _base_frame_cache_lock:
+        _base_frame_cache.clear()
+        for k in _base_frame_cache_stats:
+            _base_frame_cache_stats[k] = 0
+
+
+def _max_content_height(layout: dict) -> int:
+    """对话框内容区（含上下留白 30 像素）的最大高度"""
+    return layout["text_box_height"] - layout["username_height"] - 30
+
+
+def get_content_height(layout: dict, line_count: int, line_height: int) -> int:
+    """根据行数计算对话框内容区高度（不超过对话框可容纳的高度）"""
+    total_text_height = line_count * line_height + (line_count - 1) * LINE_SPACING
+    return min(total_text_height + 30, _max_content_height(layout))
+
+
+def _render_lines(
+    avatar_path: str,
+    background_path: str,
+    username: str,
+    font_index,
+    img_size: tuple,
+    layout: dict,
+    lines: list,
+    content_font,
+    line_height: int,
+    fallback_fonts=None
+) -> Image.Image:
+    """在底图副本上绘制已换行的文本"""
+    content_height = get_content_height(layout, len(lines), line_height)
+    
+    # 只在底图副本上绘制对话文本
+    with tracing.span("render.base_frame"):
+        image = get_base_frame(
+            avatar_path, background_path, username, font_index, img_size, content_height, layout,
+            fallback_fonts
+        ).copy()
     
     # 绘制文本内容
-    current_y = content_start_y
-    for i, line in enumerate(lines):
-        draw.text(
-            (text_box_x, current_y),
-            line,
-            fill=(255, 255, 255),  # 白色
-            font=content_font
-        )
-        current_y += line_height + 10
+    with tracing.span("render.draw_text"):
+        draw = ImageDraw.Draw(image)
+        current_y = layout["content_start_y"]
+        for line in lines:
+            font_fallback.draw_text(
+                draw,
+                (layout["text_box_x"], current_y),
+                line,
+                font=content_font,
+                fill=(255, 255, 255)  # 白色
+            )
+            current_y += line_height + LINE_SPACING
+    return image
+
+
+def generate_dialog_image(
+    avatar_path: str,
+    background_path: str = None,
+    username: str = "角色名称",
+    dialog_text: str = "说话内容",
+    font_index: int = 0,
+    img_size: tuple = (1200, 800),
+    output_path: str = None,
+    encode_profile: str = None,
+    quality: int = None,
+    fallback_fonts=None,
+    auto_fit: bool = False,
+    break_rules: bool = False
+) -> Image.Image:
+    """
+    生成对话框布局图片
+    
+    Args:
+        avatar_path: 头像文件路径
+        background_path: 背景文件路径，如果为None或文件不存在则使用纯黑背景
+        username: 用户名称
+        dialog_text: 说话内容
+        font_index: 字体索引
+        img_size: 图片大小 (width, height)，默认 (1200, 800)
+        output_path: 输出文件路径，如果提供则保存图片
+        encode_profile: 保存时使用的编码配置（见 image_encoder.ENCODE_PROFILES），
+            为 None 时按文件扩展名使用 Pillow 默认参数
+        quality: 覆盖编码配置中的 quality（WebP/JPEG）
+        fallback_fonts: 主字体缺少字形时依次尝试的回退字体名列表，None 时使用 FALLBACK_FONTS，
+            空列表表示不回退
+        auto_fit: 文本放不下对话框时自动缩小内容字号（见 fit_text），关闭时使用固定字号，
+            超出对话框的行仍会绘制
+        break_rules: 是否启用断行规则（CJK 行首/行尾禁则、拉丁文按单词换行，见 wrap_text）
+    
+    Returns:
+        PIL Image 对象
+    """
+    # 各阶段计时见 tracing（未启用时 span 为空操作）
+    with tracing.span("render.layout"):
+        layout = compute_layout(img_size, username, font_index, fallback_fonts)
+    content_font = layout["content_font"]
+    line_height = layout["line_height"]
+    
+    max_content_height = _max_content_height(layout)
+    
+    # 说话内容（带文本换行）
+    if auto_fit:
+        with tracing.span("render.fit"):
+            content_font, line_height, lines, _ = fit_text(
+                dialog_text, layout["text_box_width"], max_content_height - 30, font_index,
+                get_font_sizes(img_size[1])[1], fallback_fonts, break_rules=break_rules
+            )
+    else:
+        with tracing.span("render.wrap"):
+            lines = wrap_text(dialog_text, layout["text_box_width"], content_font, break_rules)
+        # 日志放在 wrap_text 之外，换行基准测试与自动适配的逐字号尝试不受输出影响
+        print("    wrap text成功！")
+    
+    image = _render_lines(
+        avatar_path, background_path, username, font_index, img_size, layout, lines, content_font,
+        line_height, fallback_fonts
+    )
     
     # 保存图片
     if output_path:
-        image.save(output_path)
+        with tracing.span("render.save"):
+            if encode_profile:
+                image_encoder.save_image(image, output_path, encode_profile, quality)
+            else:
+                image.save(output_path)
         print(f"图片已保存到: {output_path}")
     
-    return image
\ No newline at end of file
+    return image
+
+
+def paginate_lines(lines: list, line_height: int, max_height: int) -> list:
+    """
+    把换行后的文本按对话框高度分页
+
+    Args:
+        lines: 换行后的文本列表
+        line_height: 行高
+        max_height: 文本区域高度（像素）
+
+    Returns:
+        每页的文本列表组成的列表（至少一页）
+    """
+    per_page = _max_lines(max_height, line_height)
+    return [lines[i:i + per_page] for i in range(0, len(lines), per_page)] or [[]]
+
+
+def generate_dialog_pages(
+    avatar_path: str,
+    background_path: str = None,
+    username: str = "角色名称",
+    dialog_text: str = "说话内容",
+    font_index: int = 0,
+    img_size: tuple = (1200, 800),
+    fallback_fonts=None,
+    break_rules: bool = False
+):
+    """
+    把放不下一个对话框的长文本分成多页，逐页生成对话图片
+
+    文本只换行一次并按对话框高度分页；返回的生成器在迭代时才绘制下一页，
+    第一页可以在后续页面绘制之前使用。各页共用同一张缓存底图（最后一页高度不同时多一张），
+    只绘制本页的文本。文本放得下一页时结果与 generate_dialog_image 相同。
+
+    Args:
+        avatar_path: 头像文件路径
+        background_path: 背景文件路径
+        username: 用户名称
+        dialog_text: 说话内容
+        font_index: 字体索引
+        img_size: 图片大小 (width, height)
+        fallback_fonts: 回退字体名列表，None 时使用 FALLBACK_FONTS
+        break_rules: 是否启用断行规则
+
+    Yields:
+        每一页的 PIL Image 对象
+    """
+    with tracing.span("render.layout"):
+        layout = compute_layout(img_size, username, font_index, fallback_fonts)
+    content_font = layout["content_font"]
+    line_height = layout["line_height"]
+    with tracing.span("render.wrap"):
+        lines = _wrap_lines(dialog_text, layout["text_box_width"], content_font, break_rules)
+    pages = paginate_lines(lines, line_height, _max_content_height(layout) - 30)
+    if len(pages) > 1:
+        print(f"    文本共 {len(lines)} 行，分为 {len(pages)} 页")
+
+    for page in pages:
+        yield _render_lines(
+            avatar_path, background_path, username, font_index, img_size, layout, page, content_font,
+            line_height, fallback_fonts
+        )
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""
+多角色配置
+
+config.json 的 profiles 列表中每一项是一个角色，可以单独设置头像、背景、用户名、字体、图片尺寸与热键，
+未设置的项使用顶层配置的值：
+    {
+      "font_name": "STKAITI.TTF",
+      "profiles": [
+        {"name": "小明", "hotkey": "f1", "avatar_image_path": "a.png", "username": "小明"},
+        {"name": "小红", "hotkey": "f2", "avatar_image_path": "b.png", "username": "小红",
+         "image_size": [1200, 400]}
+      ],
+      "profile_cache_mb": 256
+    }
+没有 profiles 时顶层配置本身就是唯一的角色，与原来的单角色配置完全相同。
+
+服务启动时为每个角色注册热键并预热字体与缩放后的素材，所有角色共用 picture_spawner 的素材缓存，
+总字节数不超过 profile_cache_mb；切换角色时不再读取字体文件或解码图片。
+"""
+import font_fallback
+import picture_spawner
+
+# 可以在角色中单独设置、未设置时从顶层配置继承的配置项
+PROFILE_KEYS = ("avatar_image_path", "background_image_path", "username", "font_name",
+                "fallback_fonts", "image_size", "hotkey")
+# 与角色相关的所有配置项，其中任意一项变化时需要重新加载角色
+CONFIG_KEYS = PROFILE_KEYS + ("profiles",)
+DEFAULT_IMG_SIZE = (900, 300)
+DEFAULT_HOTKEY = "f1"
+# 每个角色预留的字体缓存条目数（两种字号，各自的主字体与回退字体）
+FONTS_PER_PROFILE = 2 * (1 + len(font_fallback.DEFAULT_FALLBACK_FONTS))
+
+
+class Profile:
+    """
+    一个角色的渲染配置
+
+    Args:
+        name: 角色名（用于日志）
+        hotkey: 触发该角色的热键
+        avatar_path: 头像文件路径
+        background_path: 背景文件路径
+        username: 对话框中显示的用户名
+        font_name: 字体名
+        fallback_fonts: 回退字体名列表，None 时使用 picture_spawner.FALLBACK_FONTS
+        img_size: 图片大小 (width, height)
+    """
+
+    def __init__(self, name: str, hotkey: str, avatar_path: str, background_path: str, username: str,
+                 font_name: str, fallback_fonts=None, img_size: tuple = DEFAULT_IMG_SIZE):
+        self.name = name
+        self.hotkey = hotkey
+        self.avatar_path = avatar_path
+        self.background_path = background_path
+        self.username = username
+        self.font_name = font_name
+        self.fallback_fonts = fallback_fonts
+        self.img_size = tuple(img_size)
+
+    def __repr__(self):
+        return f"Profile({self.name!r}, hotkey={self.hotkey!r}, size={self.img_size})"
+
+    def asset_bytes(self) -> int:
+        """缩放后的头像（RGBA）与背景（RGB）占用的字节数"""
+        avatar_size = picture_spawner.get_avatar_size(self.img_size[1])
+        total = 0
+        if self.avatar_path:
+            total += avatar_size * avatar_size * 4
+        if self.background_path:
+            total += self.img_size[0] * self.img_size[1] * 3
+        return total
+
+
+def _parse_size(value) -> tuple:
+    """把 [w, h] 或 "WxH" 转换为 (w, h)，无效时返回默认尺寸"""
+    try:
+        if isinstance(value, str):
+            value = value.lower().split("x")
+        width, height = (int(v) for v in value)
+    except (TypeError, ValueError):
+        return DEFAULT_IMG_SIZE
+    if width <= 0 or height <= 0:
+        return DEFAULT_IMG_SIZE
+    return width, height
+
+
+def _make_profile(entry: dict, defaults: dict, name: str) -> Profile:
+    merged = {key: defaults.get(key) for key in PROFILE_KEYS}
+    merged.update({key: entry[key] for key in PROFILE_KEYS if key in entry})
+    return Profile(
+        name=entry.get("name") or name,
+        hotkey=merged["hotkey"] or DEFAULT_HOTKEY,
+        avatar_path=merged["avatar_image_path"],
+        background_path=merged["background_image_path"],
+        username=merged["username"],
+        font_name=merged["font_name"],
+        fallback_fonts=merged["fallback_fonts"],
+        img_size=_parse_size(merged["image_size"]) if merged["image_size"] else DEFAULT_IMG_SIZE,
+    )
+
+
+def load_profiles(cfg: dict) -> list:
+    """
+    从配置字典读取角色列表
+
+    Args:
+        cfg: 配置字典（顶层的头像、背景、用户名、字体、图片尺寸与热键作为每个角色的默认值）
+
+    Returns:
+        Profile 列表；没有 profiles 时只有一个由顶层配置组成的角色。
+        热键重复的角色只保留第一个
+    """
+    entries = cfg.get("profiles")
+    if not entries:
+        return [_make_profile({}, cfg, cfg.get("username") or "默认")]
+
+    profiles = []
+    hotkeys = set()
+    for i, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict):
+            print(f"第 {i} 个角色配置无效，已跳过。")
+            continue
+        profile = _make_profile(entry, cfg, f"角色{i}")
+        if profile.hotkey in hotkeys:
+            print(f"角色 {profile.name} 的热键 {profile.hotkey} 与前面的角色重复，已跳过。")
+            continue
+        hotkeys.add(profile.hotkey)
+        profiles.append(profile)
+    return profiles
+
+
+def preload_profiles(profiles: list, max_bytes: int = None) -> dict:
+    """
+    预热所有角色的字体与缩放后的素材
+
+    按角色数放大字体缓存与素材缓存的条目数上限，素材缓存的总字节数由 max_bytes 限制
+    （超出时最早加载的角色的素材会被淘汰，切换到该角色时从磁盘缓存映射或重新解码）。
+
+    Args:
+        profiles: Profile 列表
+        max_bytes: 所有角色共用的素材缓存字节数上限，None 时保持 picture_spawner.ASSET_CACHE_MAX_BYTES
+
+    Returns:
+        预热后的素材缓存统计（picture_spawner.get_asset_cache_stats）
+    """
+    if max_bytes is not None:
+        picture_spawner.ASSET_CACHE_MAX_BYTES = max_bytes
+    picture_spawner.ASSET_CACHE_MAXSIZE = max(picture_spawner.ASSET_CACHE_MAXSIZE, 2 * len(profiles))
+    picture_spawner.FONT_CACHE_MAXSIZE = max(picture_spawner.FONT_CACHE_MAXSIZE, FONTS_PER_PROFILE * len(profiles))
+
+    needed = sum(profile.asset_bytes() for profile in profiles)
+    if needed > picture_spawner.ASSET_CACHE_MAX_BYTES:
+        print(f"    {len(profiles)} 个角色的素材约需 {needed / 2 ** 20:.1f} MB，超过缓存上限 "
+              f"{picture_spawner.ASSET_CACHE_MAX_BYTES / 2 ** 20:.1f} MB，部分角色切换时需要重新加载素材")
+
+    for profile in profiles:
+        picture_spawner.preload_fonts(profile.font_name, profile.img_size, profile.fallback_fonts)
+        picture_spawner.preload_assets(profile.avatar_path, profile.background_path, profile.img_size)
+    return picture_spawner.get_asset_cache_stats()
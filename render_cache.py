@@ -0,0 +1,211 @@
+"""
+按内容寻址的成品图片缓存
+
+常用的短句（“好的”、“收到”、口头禅）会反复生成完全相同的图片。成品缓存以渲染参数的哈希为键
+保存编码后的图片字节：对话内容、角色名、头像与背景的文件指纹、字体与回退字体、图片尺寸、
+自动缩小字号与断行规则开关以及编码配置与质量。命中时跳过渲染与编码，直接使用缓存的字节。
+
+两级缓存：
+    内存  按总字节数限制的 LRU
+    磁盘  可选，每个键一个文件，目录总大小超过上限时删除最久未使用的文件；
+          命中后提升到内存，进程重启后仍然有效
+
+头像或背景文件被修改后文件指纹变化，对应的键自然失效；字体文件本身被替换时不会失效，
+需要调用 clear（或删除磁盘缓存目录）。
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import picture_spawner
+
+# 渲染结果的格式版本，排版或绘制方式改变时递增，使旧的磁盘缓存失效
+RENDER_CACHE_VERSION = 1
+# 内存缓存的总字节数上限
+MEMORY_MAX_BYTES = 32 * 2 ** 20
+# 磁盘缓存的默认目录与总大小上限（字节）
+DEFAULT_DISK_DIR = os.path.join(os.path.expanduser('~'), 'ADVTextSpawner', 'render_cache')
+DISK_MAX_BYTES = 256 * 2 ** 20
+
+
+def make_key(kwargs: dict, encode_profile: str, quality: int = None) -> str:
+    """
+    计算渲染结果的缓存键
+
+    Args:
+        kwargs: generate_dialog_image 的参数（不含 output_path），例如 batch.record_to_kwargs 的返回值
+        encode_profile: 编码配置名（剪贴板在 Windows 上为 "bmp"）
+        quality: 编码质量
+
+    Returns:
+        十六进制的 SHA-256 摘要
+    """
+    parts = dict(kwargs)
+    parts.pop("output_path", None)
+    parts["avatar_path"] = picture_spawner.file_fingerprint(parts.get("avatar_path"))
+    parts["background_path"] = picture_spawner.file_fingerprint(parts.get("background_path"))
+    fallback_fonts = parts.get("fallback_fonts")
+    parts["fallback_fonts"] = list(picture_spawner.FALLBACK_FONTS if fallback_fonts is None else fallback_fonts)
+    parts["font_index"] = str(parts.get("font_index"))
+    parts["img_size"] = list(parts.get("img_size") or ())
+    parts["auto_fit"] = bool(parts.get("auto_fit", False))
+    parts["break_rules"] = bool(parts.get("break_rules", False))
+    parts["encode_profile"] = encode_profile
+    parts["quality"] = quality
+    parts["version"] = RENDER_CACHE_VERSION
+    blob = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """
+    编码后图片字节的两级缓存
+
+    Args:
+        max_bytes: 内存缓存的总字节数上限，0 表示不使用内存缓存
+        disk_dir: 磁盘缓存目录，None 表示不使用磁盘缓存
+        disk_max_bytes: 磁盘缓存的总大小上限
+    """
+
+    def __init__(self, max_bytes: int = MEMORY_MAX_BYTES, disk_dir: str = None,
+                 disk_max_bytes: int = DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + ".bin")
+
+    def get(self, key: str):
+        """
+        查找缓存
+
+        Returns:
+            图片字节，未命中时返回 None
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return data
+
+        data = self._read_disk(key) if self.disk_dir else None
+        with self._lock:
+            if data is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._store_memory(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """保存编码后的图片字节"""
+        with self._lock:
+            self._stats["stores"] += 1
+            self._store_memory(key, data)
+        if self.disk_dir:
+            self._write_disk(key, data)
+
+    def _store_memory(self, key: str, data: bytes) -> None:
+        # 调用方持有 self._lock
+        if len(data) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = data
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._stats["evictions"] += 1
+
+    def _read_disk(self, key: str):
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            # 更新修改时间，作为 LRU 淘汰的最近使用时间
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _write_disk(self, key: str, data: bytes) -> None:
+        path = self._disk_path(key)
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print("    无法写入成品缓存:", e)
+            return
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        """磁盘缓存超过上限时按最近使用时间删除旧文件"""
+        entries = []
+        try:
+            with os.scandir(self.disk_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".bin"):
+                        st = entry.stat()
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        """
+        返回命中统计
+
+        Returns:
+            包含 memory_hits、disk_hits、misses、stores、evictions、hit_rate、entries、bytes 的字典
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self, disk: bool = False) -> None:
+        """
+        清空内存缓存并重置统计
+
+        Args:
+            disk: 同时删除磁盘缓存文件
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            for k in self._stats:
+                self._stats[k] = 0
+        if disk and self.disk_dir and os.path.isdir(self.disk_dir):
+            for name in os.listdir(self.disk_dir):
+                if name.endswith(".bin"):
+                    try:
+                        os.remove(os.path.join(self.disk_dir, name))
+                    except OSError:
+                        pass
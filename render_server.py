@@ -0,0 +1,554 @@
+"""
+常驻渲染服务
+
+进程常驻，字体与底图缓存一直保持预热，避免每次请求都启动 Python 解释器并加载字体。
+基于 asyncio，监听 Unix 域套接字（以及可选的本机 HTTP 端口），渲染在有界线程池中执行。
+
+Unix 套接字协议（支持长连接与流水线请求，响应按请求顺序返回）：
+    请求：一帧 JSON，例如 {"op": "render", "text": "你好", "username": "A"}
+          或 {"op": "status"}
+    响应：一帧 JSON 头（{"ok": true, ...} 或 {"ok": false, "error": "..."}），
+          随后一帧图片数据（status 或出错时为空帧）
+    帧格式与 headless.py 相同：4 字节大端无符号长度 + 数据。
+    请求帧超过 MAX_REQUEST_BYTES 时返回出错响应并关闭连接。
+
+HTTP 接口（HTTP/1.1 keep-alive）：
+    POST /render   请求体为 JSON（字段同上）或纯文本对话内容，返回图片；请求体超过 MAX_REQUEST_BYTES 时返回 413
+    GET  /status   返回队列深度、p50/p99 延迟与缓存统计（--trace 时还有各渲染阶段的 p50/p95/p99）
+
+render 请求可选字段：username、avatar、background、font、fallback_fonts（回退字体名列表）、auto_fit（自动缩小字号）、
+break_rules（断行规则）、size（[宽, 高]，每边不超过 MAX_IMG_SIDE）、profile（编码配置，见 image_encoder.ENCODE_PROFILES）、
+quality（1-100）。avatar 与 background 只能位于素材目录中：配置的头像、背景（包括各角色）所在的目录以及 --asset-dir 指定的目录。
+
+用法：
+    python render_server.py [--socket 路径] [--http 8765] [--workers 2] [--asset-dir 目录]
+"""
+import argparse
+import asyncio
+import collections
+import http.client
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import batch
+import config
+import headless
+import image_encoder
+import picture_spawner
+import profiles
+import tracing
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "avg_text_spawner.sock")
+DEFAULT_HTTP_HOST = "127.0.0.1"
+DEFAULT_IMG_SIZE = (900, 300)
+
+# 最近多少次请求参与延迟分位数统计
+LATENCY_WINDOW = 1000
+# 单个请求（Unix 套接字的请求帧或 HTTP 请求体）的最大字节数，防止客户端声明超大长度让服务缓冲大量数据
+MAX_REQUEST_BYTES = 1024 * 1024
+# 请求图片的最大边长（像素），防止客户端请求超大图片耗尽内存
+MAX_IMG_SIDE = 4096
+
+
+# render 请求中必须为字符串的字段（可省略或为 null）
+STRING_FIELDS = ("text", "username", "avatar", "background", "font")
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _check_fields(request) -> dict:
+    """
+    检查解析后的请求是否为 JSON 对象，且各字段的类型与取值合法
+
+    Returns:
+        原请求
+
+    Raises:
+        ValueError: 请求不是 JSON 对象或字段不合法
+    """
+    if not isinstance(request, dict):
+        raise ValueError("请求必须是 JSON 对象")
+    for name in STRING_FIELDS:
+        if request.get(name) is not None and not isinstance(request[name], str):
+            raise ValueError(f"字段 {name} 必须是字符串")
+    size = request.get("size")
+    if size is not None:
+        if (not isinstance(size, (list, tuple)) or len(size) != 2
+                or not all(_is_int(v) and 0 < v <= MAX_IMG_SIDE for v in size)):
+            raise ValueError(f"字段 size 必须是两个 1-{MAX_IMG_SIDE} 之间的整数")
+    fallback_fonts = request.get("fallback_fonts")
+    if fallback_fonts is not None:
+        if not isinstance(fallback_fonts, list) or not all(isinstance(v, str) for v in fallback_fonts):
+            raise ValueError("字段 fallback_fonts 必须是字符串列表")
+    quality = request.get("quality")
+    if quality is not None and not (_is_int(quality) and 1 <= quality <= 100):
+        raise ValueError("字段 quality 必须是 1-100 之间的整数")
+    profile = request.get("profile")
+    if profile is not None and profile not in image_encoder.ENCODE_PROFILES:
+        raise ValueError(f"未知的编码配置: {profile}（可选: {', '.join(image_encoder.ENCODE_PROFILES)}）")
+    return request
+
+
+def asset_dirs_from_config(defaults: dict, profile_list=()) -> list:
+    """
+    返回配置中的头像与背景（包括各角色）所在的目录
+
+    Args:
+        defaults: batch.load_defaults 的返回值
+        profile_list: profiles.load_profiles 的返回值
+
+    Returns:
+        目录列表
+    """
+    paths = [defaults.get("avatar"), defaults.get("background")]
+    for profile in profile_list:
+        paths += [profile.avatar_path, profile.background_path]
+    return [os.path.dirname(os.path.abspath(path)) for path in paths if path]
+
+
+def _assert_not_listening(socket_path: str) -> None:
+    """
+    确认套接字路径上没有正在运行的服务，可以删除旧的套接字文件
+
+    Raises:
+        RuntimeError: 已有服务在监听，或该路径不是套接字文件
+    """
+    if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+        raise RuntimeError(f"{socket_path} 已存在且不是套接字文件")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"已有渲染服务在监听 {socket_path}")
+
+
+class RenderServer:
+    """渲染服务：管理线程池、排队上限与统计信息"""
+
+    def __init__(self, defaults: dict, workers: int = 2, max_pending: int = 64,
+                 img_size: tuple = DEFAULT_IMG_SIZE, max_request: int = MAX_REQUEST_BYTES, asset_dirs=None):
+        self.defaults = defaults
+        # 请求中的 avatar、background 只能位于这些目录中，为 None 时使用 asset_dirs_from_config(defaults)
+        if asset_dirs is None:
+            asset_dirs = asset_dirs_from_config(defaults)
+        self.asset_dirs = sorted({os.path.realpath(d) for d in asset_dirs})
+        self.img_size = img_size
+        self.max_pending = max_pending
+        self.max_request = max_request
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render")
+        self.workers = workers
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.started_at = time.time()
+
+    def _render(self, request: dict) -> bytes:
+        record = dict(request)
+        defaults = dict(self.defaults)
+        if request.get("font"):
+            defaults["font_name"] = request["font"]
+        if request.get("fallback_fonts") is not None:
+            defaults["fallback_fonts"] = request["fallback_fonts"]
+        if request.get("auto_fit") is not None:
+            defaults["auto_fit"] = bool(request["auto_fit"])
+        if request.get("break_rules") is not None:
+            defaults["break_rules"] = bool(request["break_rules"])
+        img_size = tuple(request.get("size") or self.img_size)
+        quality = request.get("quality", defaults["quality"])
+        return batch.render_encoded(record, defaults, img_size, self._profile(request), quality)[0]
+
+    def _check_request(self, request) -> dict:
+        """在 _check_fields 的基础上检查 avatar、background 是否位于素材目录中"""
+        _check_fields(request)
+        for name in ("avatar", "background"):
+            if request.get(name) and not self._is_asset(request[name]):
+                raise ValueError(f"字段 {name} 不在允许的素材目录中")
+        return request
+
+    def _is_asset(self, path: str) -> bool:
+        real = os.path.realpath(path)
+        for directory in self.asset_dirs:
+            try:
+                if os.path.commonpath([real, directory]) == directory:
+                    return True
+            except ValueError:
+                # Windows 上不同盘符的路径
+                continue
+        return False
+
+    def _profile(self, request: dict) -> str:
+        return request.get("profile") or self.defaults["encode_profile"]
+
+    async def render(self, request: dict) -> bytes:
+        """
+        把渲染任务放入线程池执行
+
+        Raises:
+            RuntimeError: 排队任务数超过上限
+            KeyError: 请求缺少 text 字段
+        """
+        if "text" not in request:
+            raise KeyError("text")
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise RuntimeError("服务繁忙，排队任务已满")
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(self.executor, self._render, request)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        self.latencies.append(time.perf_counter() - start)
+        self.completed += 1
+        return data
+
+    def status(self) -> dict:
+        """返回队列深度、延迟分位数与缓存统计"""
+        latencies = sorted(self.latencies)
+        return {
+            "queue_depth": self.pending,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "latency_ms": {
+                "p50": round(tracing.percentile(latencies, 50) * 1000, 2),
+                "p99": round(tracing.percentile(latencies, 99) * 1000, 2),
+            },
+            "font_cache": picture_spawner.get_font_cache_stats(),
+            "base_frame_cache": picture_spawner.get_base_frame_cache_stats(),
+            "asset_cache": picture_spawner.get_asset_cache_stats(),
+            "render_cache": batch.get_render_cache(self.defaults).stats(),
+            "stages": tracing.get_stats(),
+        }
+
+    # ===== Unix 套接字 =====
+    async def handle_stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # 读取请求后立即调度，响应按请求顺序写回，同一连接上的请求可以并发渲染
+        responses = asyncio.Queue()
+        sender = asyncio.ensure_future(self._send_responses(responses, writer))
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(headless.FRAME_HEADER.size)
+                    (length,) = headless.FRAME_HEADER.unpack(header)
+                    if length > self.max_request:
+                        # 无法跳过未读取的请求体继续解析后续帧，返回出错响应后关闭连接
+                        self.rejected += 1
+                        await responses.put(asyncio.ensure_future(
+                            self._reject(f"请求过大: {length} 字节，上限 {self.max_request} 字节")))
+                        break
+                    payload = await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    break
+                await responses.put(asyncio.ensure_future(self._dispatch(payload)))
+        finally:
+            await responses.put(None)
+            await sender
+            writer.close()
+
+    async def _reject(self, error: str) -> tuple:
+        return {"ok": False, "error": error}, b""
+
+    async def _dispatch(self, payload: bytes) -> tuple:
+        try:
+            request = self._check_request(json.loads(payload.decode("utf-8")))
+            if request.get("op", "render") == "status":
+                return {"ok": True, "status": self.status()}, b""
+            data = await self.render(request)
+            return {"ok": True, "mime": image_encoder.mime_type(self._profile(request))}, data
+        except KeyError as e:
+            return {"ok": False, "error": f"缺少字段: {e}"}, b""
+        except Exception as e:
+            return {"ok": False, "error": str(e)}, b""
+
+    async def _send_responses(self, responses: asyncio.Queue, writer: asyncio.StreamWriter) -> None:
+        while True:
+            task = await responses.get()
+            if task is None:
+                return
+            head, data = await task
+            body = json.dumps(head, ensure_ascii=False).encode("utf-8")
+            try:
+                writer.write(headless.FRAME_HEADER.pack(len(body)) + body)
+                writer.write(headless.FRAME_HEADER.pack(len(data)) + data)
+                await writer.drain()
+            except ConnectionError:
+                return
+
+    # ===== HTTP =====
+    async def handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._http_reply(writer, 400, b"bad request", "text/plain", False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = b""
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._http_reply(writer, 400, b"bad content-length", "text/plain", False)
+                    break
+                if length > self.max_request:
+                    # 请求体未读取，连接无法继续使用
+                    self.rejected += 1
+                    message = f"请求过大: {length} 字节，上限 {self.max_request} 字节".encode("utf-8")
+                    await self._http_reply(writer, 413, message, "text/plain; charset=utf-8", False)
+                    break
+                if length:
+                    body = await reader.readexactly(length)
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                status, data, content_type = await self._http_route(method, path, headers, body)
+                await self._http_reply(writer, status, data, content_type, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _http_route(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        if method == "GET" and path == "/status":
+            return 200, json.dumps(self.status(), ensure_ascii=False).encode("utf-8"), "application/json"
+        if method == "POST" and path == "/render":
+            try:
+                if headers.get("content-type", "").startswith("application/json"):
+                    request = self._check_request(json.loads(body.decode("utf-8")))
+                else:
+                    request = {"text": body.decode("utf-8")}
+            except ValueError as e:
+                # 包括 JSON 解析与 UTF-8 解码失败
+                return 400, str(e).encode("utf-8"), "text/plain; charset=utf-8"
+            try:
+                data = await self.render(request)
+            except RuntimeError as e:
+                return 503, str(e).encode("utf-8"), "text/plain; charset=utf-8"
+            except KeyError as e:
+                return 400, f"缺少字段: {e}".encode("utf-8"), "text/plain; charset=utf-8"
+            except Exception as e:
+                return 500, str(e).encode("utf-8"), "text/plain; charset=utf-8"
+            return 200, data, image_encoder.mime_type(self._profile(request))
+        return 404, b"not found", "text/plain"
+
+    async def _http_reply(self, writer, status: int, data: bytes, content_type: str, keep_alive: bool) -> None:
+        reason = http.client.responses.get(status, "")
+        head = (
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + data)
+        await writer.drain()
+
+    async def serve(self, socket_path: str = DEFAULT_SOCKET, http_port: int = None) -> None:
+        """启动监听并一直运行"""
+        servers = []
+        if socket_path and hasattr(asyncio, "start_unix_server"):
+            if os.path.exists(socket_path):
+                _assert_not_listening(socket_path)
+                os.unlink(socket_path)
+            servers.append(await asyncio.start_unix_server(self.handle_stream, path=socket_path))
+            # 只允许当前用户连接
+            os.chmod(socket_path, 0o600)
+            print(f"渲染服务监听 Unix 套接字: {socket_path}")
+        if http_port:
+            servers.append(await asyncio.start_server(self.handle_http, DEFAULT_HTTP_HOST, http_port))
+            print(f"渲染服务监听 HTTP: http://{DEFAULT_HTTP_HOST}:{http_port}")
+        if not servers:
+            raise RuntimeError("没有可用的监听方式（当前平台不支持 Unix 套接字时请指定 --http）")
+        try:
+            await asyncio.gather(*(server.serve_forever() for server in servers))
+        finally:
+            self.executor.shutdown(wait=False)
+            if socket_path and os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+class RenderClient:
+    """
+    渲染服务客户端（同步，保持长连接）
+
+    address 为 Unix 套接字路径，或 "host:port" 形式的 HTTP 地址。
+    """
+
+    def __init__(self, address: str = DEFAULT_SOCKET, timeout: float = 10.0):
+        self.address = address
+        self.timeout = timeout
+        self._sock = None
+        self._http = None
+        self._lock = threading.Lock()
+
+    def _is_http(self) -> bool:
+        host, sep, port = self.address.rpartition(":")
+        return bool(sep) and port.isdigit() and "/" not in self.address
+
+    def _connect(self) -> None:
+        if self._is_http():
+            host, _, port = self.address.rpartition(":")
+            self._http = http.client.HTTPConnection(host, int(port), timeout=self.timeout)
+        else:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.address)
+            self._sock = sock
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+    def _recv_exactly(self, size: int) -> bytes:
+        chunks = []
+        while size:
+            chunk = self._sock.recv(size)
+            if not chunk:
+                raise ConnectionError("渲染服务关闭了连接")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def _request_socket(self, request: dict) -> tuple:
+        payload = json.dumps(request, ensure_ascii=False).encode("utf-8")
+        self._sock.sendall(headless.FRAME_HEADER.pack(len(payload)) + payload)
+        (length,) = headless.FRAME_HEADER.unpack(self._recv_exactly(headless.FRAME_HEADER.size))
+        head = json.loads(self._recv_exactly(length).decode("utf-8"))
+        (length,) = headless.FRAME_HEADER.unpack(self._recv_exactly(headless.FRAME_HEADER.size))
+        return head, self._recv_exactly(length)
+
+    def _request_http(self, request: dict) -> tuple:
+        if request.get("op") == "status":
+            self._http.request("GET", "/status")
+        else:
+            body = json.dumps(request, ensure_ascii=False).encode("utf-8")
+            self._http.request("POST", "/render", body, {"Content-Type": "application/json"})
+        response = self._http.getresponse()
+        data = response.read()
+        if response.status != 200:
+            return {"ok": False, "error": data.decode("utf-8", "replace")}, b""
+        if request.get("op") == "status":
+            return {"ok": True, "status": json.loads(data.decode("utf-8"))}, b""
+        return {"ok": True}, data
+
+    def _request(self, request: dict) -> tuple:
+        with self._lock:
+            # 连接断开时重连一次
+            for attempt in range(2):
+                try:
+                    if self._sock is None and self._http is None:
+                        self._connect()
+                    if self._http is not None:
+                        head, data = self._request_http(request)
+                    else:
+                        head, data = self._request_socket(request)
+                    break
+                except (OSError, http.client.HTTPException):
+                    self.close()
+                    if attempt:
+                        raise
+        if not head.get("ok"):
+            raise RuntimeError(head.get("error", "渲染失败"))
+        return head, data
+
+    def render(self, text: str, **options) -> bytes:
+        """
+        请求渲染一张图片
+
+        Args:
+            text: 对话内容
+            options: username、avatar、background、font、size、profile、quality 等可选字段
+
+        Returns:
+            编码后的图片字节
+
+        Raises:
+            OSError: 无法连接渲染服务
+            RuntimeError: 服务端渲染失败
+        """
+        request = {"op": "render", "text": text}
+        request.update({k: v for k, v in options.items() if v is not None})
+        return self._request(request)[1]
+
+    def status(self) -> dict:
+        """获取服务状态"""
+        return self._request({"op": "status"})[0]["status"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AVG Text Spawner 常驻渲染服务")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"Unix 套接字路径（默认 {DEFAULT_SOCKET}），空字符串表示不监听")
+    parser.add_argument("--http", type=int, default=None, help="同时监听本机 HTTP 端口")
+    parser.add_argument("--workers", type=int, default=2, help="渲染线程数（默认 2）")
+    parser.add_argument("--max-pending", type=int, default=64, help="最多排队的渲染任务数（默认 64）")
+    parser.add_argument("--max-request", type=int, default=MAX_REQUEST_BYTES,
+                        help=f"单个请求的最大字节数（默认 {MAX_REQUEST_BYTES}）")
+    parser.add_argument("--asset-dir", action="append", default=[],
+                        help="允许请求使用的头像与背景目录（可重复，配置中的头像与背景所在目录总是允许）")
+    parser.add_argument("--size", type=batch.parse_size, default=DEFAULT_IMG_SIZE, help="默认图片尺寸，默认 900x300")
+    parser.add_argument("--trace", action="store_true", help="记录各渲染阶段耗时（在 /status 的 stages 中查看）")
+    parser.add_argument("--trace-file", default=None, help="同时把各阶段耗时追加写入 JSON Lines 文件")
+    parser.add_argument("--config", default=config.CONFIG_FILE, help="配置文件路径")
+    args = parser.parse_args()
+
+    tracing.configure(enabled=args.trace or bool(args.trace_file), trace_file=args.trace_file)
+    defaults = batch.load_defaults(args.config)
+    picture_spawner.preload_fonts(defaults["font_name"], args.size, defaults["fallback_fonts"])
+    picture_spawner.preload_assets(defaults["avatar"], defaults["background"], args.size)
+    # 配置了多个角色时一并预热，热键服务切换角色后的请求不需要加载字体与素材
+    try:
+        cfg = config.load_config(args.config)
+    except FileNotFoundError:
+        cfg = {}
+    profile_list = profiles.load_profiles(cfg) if cfg.get("profiles") else []
+    if profile_list:
+        cache_mb = cfg.get("profile_cache_mb")
+        profiles.preload_profiles(profile_list, int(float(cache_mb) * 2 ** 20) if cache_mb else None)
+    asset_dirs = asset_dirs_from_config(defaults, profile_list) + args.asset_dir
+    server = RenderServer(defaults, args.workers, args.max_pending, args.size, args.max_request, asset_dirs)
+    try:
+        asyncio.run(server.serve(args.socket, args.http))
+    except KeyboardInterrupt:
+        print("\n渲染服务已停止。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
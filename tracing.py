@@ -0,0 +1,188 @@
+"""
+热键流水线的分阶段计时
+
+用法：
+    with tracing.span("render.wrap"):
+        lines = wrap_text(...)
+
+启用后每个阶段的耗时进入滚动直方图（保留最近 HISTOGRAM_WINDOW 个样本，可随时查询
+p50/p95/p99），并可选地逐条写入 JSON Lines 追踪文件。同一线程中嵌套的阶段属于同一次
+追踪（trace），追踪文件中以 trace 与 parent 字段关联。
+
+未启用时 span 直接返回一个共享的空上下文管理器，开销只有一次函数调用与全局变量判断。
+"""
+import collections
+import itertools
+import json
+import os
+import threading
+import time
+
+# 是否启用计时
+ENABLED = False
+# 每个阶段保留的最近样本数
+HISTOGRAM_WINDOW = 512
+
+_histograms = {}
+_lock = threading.Lock()
+_local = threading.local()
+_trace_ids = itertools.count(1)
+_trace_file = None
+_trace_path = None
+
+
+class _NullSpan:
+    """未启用时使用的空上下文管理器"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """记录一个阶段的耗时"""
+
+    __slots__ = ("name", "trace", "parent", "start", "wall")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        if stack:
+            self.trace = stack[-1].trace
+            self.parent = stack[-1].name
+        else:
+            self.trace = next(_trace_ids)
+            self.parent = None
+        stack.append(self)
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _local.stack.pop()
+        _record(self, duration, exc_type is not None)
+        return False
+
+
+def span(name: str):
+    """
+    返回记录一个阶段耗时的上下文管理器
+
+    Args:
+        name: 阶段名，约定以点号分组，例如 "hotkey.capture"、"render.wrap"
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def _record(s: _Span, duration: float, failed: bool) -> None:
+    with _lock:
+        samples = _histograms.get(s.name)
+        if samples is None:
+            samples = _histograms[s.name] = collections.deque(maxlen=HISTOGRAM_WINDOW)
+        samples.append(duration)
+        if _trace_file is not None:
+            entry = {
+                "trace": s.trace,
+                "span": s.name,
+                "parent": s.parent,
+                "start": round(s.wall, 6),
+                "ms": round(duration * 1000, 3),
+                "thread": threading.current_thread().name,
+            }
+            if failed:
+                entry["error"] = True
+            _trace_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            _trace_file.flush()
+
+
+def configure(enabled: bool = None, trace_file: str = None) -> None:
+    """
+    启用或关闭计时，并设置追踪文件
+
+    Args:
+        enabled: 是否启用，为 None 时保持不变
+        trace_file: JSON Lines 追踪文件路径（追加写入），空字符串表示关闭追踪文件，
+            为 None 时保持不变
+    """
+    global ENABLED, _trace_file, _trace_path
+    with _lock:
+        if trace_file is not None and trace_file != _trace_path:
+            if _trace_file is not None:
+                _trace_file.close()
+                _trace_file = None
+            _trace_path = trace_file or None
+            if _trace_path:
+                directory = os.path.dirname(os.path.abspath(_trace_path))
+                os.makedirs(directory, exist_ok=True)
+                _trace_file = open(_trace_path, "a", encoding="utf-8")
+        if enabled is not None:
+            ENABLED = bool(enabled)
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """
+    最近秩法求百分位数，render_server 与 benchmark 的延迟统计也使用这个函数，保证各处的分位数可以直接比较
+
+    Args:
+        sorted_values: 已升序排列的样本
+        pct: 百分位（0~100）
+
+    Returns:
+        对应的样本值，没有样本时返回 0.0
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def get_stats() -> dict:
+    """
+    返回每个阶段的滚动统计
+
+    Returns:
+        {阶段名: {"count", "p50_ms", "p95_ms", "p99_ms", "max_ms"}}，count 为窗口内的样本数
+    """
+    with _lock:
+        snapshot = {name: sorted(samples) for name, samples in _histograms.items() if samples}
+    return {
+        name: {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round(values[-1] * 1000, 3),
+        }
+        for name, values in sorted(snapshot.items())
+    }
+
+
+def format_stats() -> str:
+    """把各阶段统计格式化为文本表格"""
+    stats = get_stats()
+    if not stats:
+        return "（没有计时数据）"
+    width = max(len(name) for name in stats)
+    rows = [f"{'阶段'.ljust(width - 2)}  {'次数':>6}  {'p50':>9}  {'p95':>9}  {'p99':>9}  {'最大':>8}"]
+    for name, s in stats.items():
+        rows.append(f"{name.ljust(width)}  {s['count']:>8}  {s['p50_ms']:>8.2f}ms  {s['p95_ms']:>8.2f}ms"
+                    f"  {s['p99_ms']:>8.2f}ms  {s['max_ms']:>8.2f}ms")
+    return "\n".join(rows)
+
+
+def reset() -> None:
+    """清空所有直方图"""
+    with _lock:
+        _histograms.clear()
@@ -0,0 +1,349 @@
+"""
+打字机效果的动态图片（APNG / 动态 WebP / GIF）
+
+像 AVG 游戏一样逐字显示对话内容。文本只换行一次，底图来自 picture_spawner 的底图缓存；
+所有帧共用一张工作帧，每一帧只在新出现的字所在的行上绘制，并只输出与上一帧相比发生变化的矩形区域：
+    APNG  每帧是一个子矩形（fcTL 偏移 + fdAT），直接写入块；默认图片为最终画面，不支持动画的应用显示完整文字
+    GIF   整个动画共用一个调色板（由最终画面量化得到），每帧只把变化的像素映射到该调色板
+    WebP  每帧是一个 ANMF 子矩形（偏移取整到偶数坐标），子矩形用 Pillow 编码为静态 WebP 后写入
+
+生成耗时与文件大小与文本长度大致成正比；APNG 与无损 WebP 的最后一帧与 generate_dialog_image 的结果完全相同。
+不支持自动缩小字号，放不下对话框的文本与静态图片一样被截断。
+
+用法：
+    data = typewriter.generate_typewriter_animation(avatar, background, "角色名称", "你好", font, (900, 300),
+                                                    fmt="gif", fps=20, chars_per_frame=1)
+"""
+import io
+import struct
+import zlib
+
+from PIL import GifImagePlugin, Image, ImageChops, ImageDraw
+
+import font_fallback
+import picture_spawner
+
+# 支持的动画格式：MIME 类型与文件扩展名（APNG 也是合法的 PNG，以 image/png 放入剪贴板，
+# 大多数应用只接受 image/png，不支持动画的应用显示完整的最终画面，见 _encode_apng）
+ANIMATION_FORMATS = {
+    "apng": ("image/png", ".png"),
+    "webp": ("image/webp", ".webp"),
+    "gif": ("image/gif", ".gif"),
+}
+DEFAULT_FPS = 20
+DEFAULT_CHARS_PER_FRAME = 1
+# 文字全部出现后最后一帧的停留时间（毫秒）
+DEFAULT_HOLD_MS = 2000
+# 行的墨迹范围向外扩展的像素，包住抗锯齿边缘
+_INK_PADDING = 2
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _line_region(layout: dict, line: str, y: int, img_size: tuple) -> tuple:
+    """整行文本绘制后的墨迹范围（含余量），限制在画布内"""
+    font = layout["content_font"]
+    x = layout["text_box_x"]
+    left, top, right, bottom = font.getbbox(line)
+    return (
+        max(0, x + left - _INK_PADDING),
+        max(0, y + top - _INK_PADDING),
+        min(img_size[0], x + right + _INK_PADDING),
+        min(img_size[1], y + bottom + _INK_PADDING),
+    )
+
+
+def _union(a, b):
+    if a is None:
+        return b
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def typewriter_frames(
+    avatar_path: str,
+    background_path: str = None,
+    username: str = "角色名称",
+    dialog_text: str = "说话内容",
+    font_index: int = 0,
+    img_size: tuple = (1200, 800),
+    chars_per_frame: int = DEFAULT_CHARS_PER_FRAME,
+    fallback_fonts=None,
+    break_rules: bool = False
+):
+    """
+    逐帧生成打字机效果的差异区域
+
+    第一项是没有文字的整帧；之后每显示 chars_per_frame 个字产生一项，只包含发生变化的矩形。
+    只增加了空白字符（没有可见变化）的步骤不产生新帧。
+
+    Yields:
+        (矩形 (x0, y0, x1, y1), 该矩形的 RGB 图片, 变化像素的蒙版（L 模式，0/255）或 None)，
+        第一项的蒙版为 None
+    """
+    chars_per_frame = max(1, int(chars_per_frame))
+    layout = picture_spawner.compute_layout(img_size, username, font_index, fallback_fonts)
+    font = layout["content_font"]
+    line_height = layout["line_height"]
+    lines = picture_spawner.wrap_text(dialog_text, layout["text_box_width"], font, break_rules)
+    content_height = picture_spawner.get_content_height(layout, len(lines), line_height)
+    base = picture_spawner.get_base_frame(
+        avatar_path, background_path, username, font_index, img_size, content_height, layout, fallback_fonts
+    )
+
+    # done：底图 + 已完整显示的行；working：当前帧
+    done = base.copy()
+    working = base.copy()
+    yield (0, 0) + tuple(img_size), working.copy(), None
+
+    x = layout["text_box_x"]
+    ys = [layout["content_start_y"] + i * (line_height + picture_spawner.LINE_SPACING) for i in range(len(lines))]
+    boxes = [_line_region(layout, line, y, img_size) if line else None for line, y in zip(lines, ys)]
+
+    # 每一步显示到的位置 (行号, 该行显示的字数)，每 chars_per_frame 个字一步，最后一个字总是一步
+    steps = []
+    total = sum(len(line) for line in lines)
+    shown = 0
+    for index, line in enumerate(lines):
+        for end in range(1, len(line) + 1):
+            shown += 1
+            if shown % chars_per_frame == 0 or shown == total:
+                steps.append((index, end))
+
+    row, shown_in_row = 0, 0
+    for index, end in steps:
+        # 这一步可能跨越多行：先补全之前的行，再绘制当前行的前缀
+        updates = []
+        while row <= index:
+            target = end if row == index else len(lines[row])
+            if target > shown_in_row and boxes[row] is not None and boxes[row][2] > boxes[row][0] \
+                    and boxes[row][3] > boxes[row][1]:
+                updates.append((row, target))
+            if row == index:
+                shown_in_row = target
+                break
+            row, shown_in_row = row + 1, 0
+        if not updates:
+            continue
+
+        region = None
+        for update_row, _ in updates:
+            region = _union(region, boxes[update_row])
+        before = working.crop(region)
+        for update_row, target in updates:
+            box = boxes[update_row]
+            line = lines[update_row]
+            # 在 done（底图 + 之前的整行）的副本上绘制本行的前缀，整图绘制时本行也是画在这些内容之上
+            crop = done.crop(box)
+            font_fallback.draw_text(
+                ImageDraw.Draw(crop), (x - box[0], ys[update_row] - box[1]), line[:target],
+                font=font, fill=(255, 255, 255)
+            )
+            working.paste(crop, box[:2])
+            if target == len(line):
+                done.paste(crop, box[:2])
+
+        after = working.crop(region)
+        diff = ImageChops.difference(before, after)
+        changed = diff.getbbox()
+        if changed is None:
+            continue  # 只增加了空白字符
+        delta = (region[0] + changed[0], region[1] + changed[1], region[0] + changed[2], region[1] + changed[3])
+        red, green, blue = diff.crop(changed).split()
+        mask = ImageChops.lighter(ImageChops.lighter(red, green), blue).point(lambda v: 255 if v else 0)
+        yield delta, after.crop(changed), mask
+
+
+def _with_durations(frames, frame_ms: int, hold_ms: int):
+    """给每一帧加上显示时长，最后一帧停留 hold_ms"""
+    previous = None
+    for frame in frames:
+        if previous is not None:
+            yield previous + (frame_ms,)
+        previous = frame
+    if previous is not None:
+        yield previous + (max(frame_ms, hold_ms),)
+
+
+# ===== APNG =====
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def _png_idat(image: Image.Image, compress_level: int) -> bytes:
+    """用 Pillow 把图片编码为 PNG，返回合并后的 IDAT 数据（zlib 流）"""
+    with io.BytesIO() as output:
+        image.save(output, "PNG", compress_level=compress_level)
+        data = output.getvalue()
+    idat = []
+    pos = len(PNG_SIGNATURE)
+    while pos < len(data):
+        (length,) = struct.unpack(">I", data[pos:pos + 4])
+        chunk_type = data[pos + 4:pos + 8]
+        if chunk_type == b"IDAT":
+            idat.append(data[pos + 8:pos + 8 + length])
+        pos += length + 12
+    return b"".join(idat)
+
+
+def _encode_apng(frames: list, img_size: tuple, final_image: Image.Image, compress_level: int = 6) -> bytes:
+    """
+    按差异帧写入 APNG：每帧一个 fcTL（子矩形与偏移）与 fdAT
+
+    默认图片（IDAT）是最终画面且不属于动画，不支持 APNG 的应用显示完整的文字而不是空白的第一帧。
+    """
+    width, height = img_size
+    out = [PNG_SIGNATURE, _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)),
+           _png_chunk(b"acTL", struct.pack(">II", len(frames), 0)),
+           _png_chunk(b"IDAT", _png_idat(final_image, compress_level))]
+    sequence = 0
+    for box, image, _, duration in frames:
+        out.append(_png_chunk(b"fcTL", struct.pack(
+            ">IIIIIHHBB", sequence, image.width, image.height, box[0], box[1],
+            min(int(duration), 65535), 1000, 0, 0  # dispose_op NONE，blend_op SOURCE
+        )))
+        out.append(_png_chunk(b"fdAT", struct.pack(">I", sequence + 1) + _png_idat(image, compress_level)))
+        sequence += 2
+    out.append(_png_chunk(b"IEND", b""))
+    return b"".join(out)
+
+
+# ===== GIF =====
+def _encode_gif(frames: list, final_image: Image.Image) -> bytes:
+    """
+    按差异帧写入 GIF，所有帧共用一个全局调色板
+
+    调色板由最终画面量化一次得到；第一帧整帧抖动映射，之后每帧只把变化的像素（不抖动）映射到调色板，
+    未变化的像素保持上一帧的索引，差异矩形的边缘不会出现抖动图案不一致的接缝。
+    """
+    palette_image = final_image.quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+    (_, first, _, first_duration), rest = frames[0], frames[1:]
+    indexed = first.quantize(palette=palette_image, dither=Image.Dither.FLOYDSTEINBERG)
+    header, _ = GifImagePlugin.getheader(indexed, None, {"loop": 0})
+    out = list(header)
+    out += GifImagePlugin.getdata(indexed, (0, 0), duration=first_duration, disposal=1)
+    for box, image, mask, duration in rest:
+        remapped = image.quantize(palette=palette_image, dither=Image.Dither.NONE)
+        indexed.paste(remapped, box[:2], mask)
+        out += GifImagePlugin.getdata(indexed.crop(box), box[:2], duration=duration, disposal=1)
+    out.append(b";")
+    return b"".join(out)
+
+
+# ===== WebP =====
+def _riff_chunk(fourcc: bytes, data: bytes) -> bytes:
+    return fourcc + struct.pack("<I", len(data)) + data + (b"\0" if len(data) & 1 else b"")
+
+
+def _webp_bitstream(image: Image.Image, quality: int) -> bytes:
+    """用 Pillow 把图片编码为静态 WebP，返回其中的图像数据块（ALPH/VP8/VP8L）"""
+    params = {"lossless": True} if quality is None else {"quality": quality}
+    with io.BytesIO() as output:
+        image.save(output, "WEBP", **params)
+        data = output.getvalue()
+    chunks = []
+    pos = 12
+    while pos + 8 <= len(data):
+        fourcc = data[pos:pos + 4]
+        (length,) = struct.unpack("<I", data[pos + 4:pos + 8])
+        if fourcc in (b"ALPH", b"VP8 ", b"VP8L"):
+            chunks.append(_riff_chunk(fourcc, data[pos + 8:pos + 8 + length]))
+        pos += 8 + length + (length & 1)
+    return b"".join(chunks)
+
+
+def _encode_webp(frames: list, img_size: tuple, quality: int = None) -> bytes:
+    """
+    按差异帧写入动态 WebP：每帧一个 ANMF 子矩形（不混合、不清除）
+
+    ANMF 的偏移必须是偶数，差异矩形的左上角向外取整到偶数坐标后从工作帧裁剪。
+    quality 为 None 时无损；有损编码时每个子矩形单独压缩，边缘可能有轻微接缝。
+    """
+    width, height = img_size
+    canvas = frames[0][1].copy()
+    out = [
+        _riff_chunk(b"VP8X", struct.pack("<B3x", 0x02) + (width - 1).to_bytes(3, "little")
+                    + (height - 1).to_bytes(3, "little")),
+        _riff_chunk(b"ANIM", struct.pack("<IH", 0xFFFFFFFF, 0)),
+    ]
+    for box, image, _, duration in frames:
+        canvas.paste(image, box[:2])
+        left, top = box[0] & ~1, box[1] & ~1
+        crop = canvas.crop((left, top, box[2], box[3]))
+        header = b"".join((
+            (left // 2).to_bytes(3, "little"), (top // 2).to_bytes(3, "little"),
+            (crop.width - 1).to_bytes(3, "little"), (crop.height - 1).to_bytes(3, "little"),
+            min(int(duration), 0xFFFFFF).to_bytes(3, "little"),
+            b"\x02",  # 不与上一帧混合，不清除
+        ))
+        out.append(_riff_chunk(b"ANMF", header + _webp_bitstream(crop, quality)))
+    body = b"WEBP" + b"".join(out)
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def generate_typewriter_animation(
+    avatar_path: str,
+    background_path: str = None,
+    username: str = "角色名称",
+    dialog_text: str = "说话内容",
+    font_index: int = 0,
+    img_size: tuple = (1200, 800),
+    output_path: str = None,
+    fmt: str = "apng",
+    fps: float = DEFAULT_FPS,
+    chars_per_frame: int = DEFAULT_CHARS_PER_FRAME,
+    hold_ms: int = DEFAULT_HOLD_MS,
+    quality: int = None,
+    fallback_fonts=None,
+    break_rules: bool = False
+) -> bytes:
+    """
+    生成打字机效果的动态对话图片
+
+    Args:
+        avatar_path: 头像文件路径
+        background_path: 背景文件路径
+        username: 用户名称
+        dialog_text: 说话内容
+        font_index: 字体索引
+        img_size: 图片大小 (width, height)
+        output_path: 输出文件路径，如果提供则保存
+        fmt: "apng"、"webp" 或 "gif"
+        fps: 帧率
+        chars_per_frame: 每帧新显示的字数
+        hold_ms: 文字全部出现后最后一帧的停留时间（毫秒）
+        quality: WebP 的质量（1-100），为 None 时无损
+        fallback_fonts: 回退字体名列表，None 时使用 picture_spawner.FALLBACK_FONTS
+        break_rules: 是否启用断行规则（见 picture_spawner.wrap_text）
+
+    Returns:
+        编码后的动画字节
+
+    Raises:
+        ValueError: 不支持的格式
+    """
+    if fmt not in ANIMATION_FORMATS:
+        raise ValueError(f"不支持的动画格式: {fmt}（可选 {'、'.join(ANIMATION_FORMATS)}）")
+    frame_ms = max(1, round(1000 / max(fps, 0.1)))
+    frames = list(_with_durations(
+        typewriter_frames(avatar_path, background_path, username, dialog_text, font_index, img_size,
+                          chars_per_frame, fallback_fonts, break_rules),
+        frame_ms, hold_ms
+    ))
+    print(f"    打字机动画：{len(frames)} 帧，{frame_ms} ms/帧")
+
+    if fmt in ("apng", "gif"):
+        final = frames[0][1].copy()
+        for box, image, _, _ in frames[1:]:
+            final.paste(image, box[:2])
+    if fmt == "apng":
+        data = _encode_apng(frames, img_size, final)
+    elif fmt == "gif":
+        data = _encode_gif(frames, final)
+    else:
+        data = _encode_webp(frames, img_size, quality)
+
+    if output_path:
+        with open(output_path, "wb") as f:
+            f.write(data)
+        print(f"动画已保存到: {output_path}")
+    return data